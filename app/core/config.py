@@ -10,14 +10,84 @@ class Settings(BaseSettings):
     GOOGLE_API_KEY: str
     EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
     LLM_MODEL_NAME: str = "gemini-1.5-flash-latest"
+    FAKE_LLM_PROFILE: str = "fixed" # LLM_MODEL_NAME="fake": "fixed" canned answer, or "gemini-flash"/"gemini-pro" timing
+    FAKE_LLM_ERROR_RATE: float = 0.0 # Fraction of fake LLM calls that fail (load tests)
+    LLM_GATEWAY_ENABLED: bool = True # Rate limit, retry, hedge and circuit-break every LLM call
+    LLM_RATE_LIMIT_RPM: float = 0 # Requests per minute allowed by the API quota (0: unlimited)
+    LLM_RATE_LIMIT_TPM: float = 0 # Prompt tokens per minute (estimated as chars / CONTEXT_CHARS_PER_TOKEN; 0: unlimited)
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_MAX_QUEUE: int = 64 # Calls waiting for a slot beyond this fail fast
+    LLM_RETRY_ATTEMPTS: int = 3 # Attempts per call on 429/5xx/timeouts, with full-jitter exponential backoff
+    LLM_RETRY_BASE_SECONDS: float = 0.5
+    LLM_RETRY_MAX_SECONDS: float = 8.0
+    LLM_ATTEMPT_TIMEOUT_SECONDS: float = 30.0 # Per attempt: until the first streamed chunk (or the full answer)
+    LLM_HEDGE_ENABLED: bool = False # Duplicate a call still unanswered at the hedge percentile (costs quota)
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 1.0
+    LLM_BREAKER_WINDOW: int = 20 # Recent attempts the circuit breaker looks at
+    LLM_BREAKER_FAILURE_RATIO: float = 0.5 # Failed share of the window that opens the circuit
+    LLM_BREAKER_COOLDOWN_SECONDS: float = 30.0
     CHROMA_HOST: str = "localhost"
     CHROMA_PORT: int = 8000
     VECTOR_STORE_PATH: str = "./data_store/chroma"
+    EMBEDDING_CACHE_DB_PATH: str = "./data_store/chunk_embeddings.sqlite3" # On-disk cache of chunk embeddings
     UPLOADS_DIR: str = "./uploads"
-    CHROMA_COLLECTION_NAME: str = "course_material"
+    MAX_UPLOAD_BYTES: int = 100 * 1024 * 1024 # Per uploaded file; larger uploads get HTTP 413
+    MAX_BULK_UPLOAD_BYTES: int = 1024 * 1024 * 1024 # Per /data/upload/bulk request
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024 # Uploads are written to disk in chunks of this size
+    CHROMA_COLLECTION_NAME: str = "course_material" # Default collection; each course can have its own
+    SHARD_SEARCH_WORKERS: int = 8 # Threads searching course collections in parallel
+    VECTOR_BACKEND: str = "chroma" # "chroma", or "flat": exact search over memory-mapped arrays (FLAT_INDEX_DIR)
+    FLAT_INDEX_DIR: str = "./data_store/flat"
+    FLAT_INDEX_DTYPE: str = "float32" # float32, float16 (half the RAM) or int8 (a quarter); fixed per collection at creation
+    FLAT_INDEX_RESCORE_FACTOR: int = 4 # float16/int8: re-score k * factor candidates exactly in float32
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 150
     RETRIEVED_DOCS_COUNT: int = 4
+    HYBRID_RETRIEVAL_ENABLED: bool = True # Fuse BM25 and vector results (reciprocal rank fusion)
+    HYBRID_FETCH_K: int = 20 # Candidates taken from each of BM25 and vector search
+    HYBRID_RRF_K: int = 60
+    LEXICAL_INDEX_DIR: str = "./data_store/bm25" # BM25 index, next to VECTOR_STORE_PATH
+    QUERY_EMBED_BATCHING_ENABLED: bool = True # Coalesce concurrent chat query embeddings into one forward pass
+    QUERY_EMBED_MAX_BATCH: int = 32
+    QUERY_EMBED_WINDOW_MS: float = 5.0 # How long the first query in a batch waits for others
+    QUERY_EMBED_WORKERS: int = 1 # Dedicated threads running query batches
+    CONTEXT_PACKING_ENABLED: bool = True # Merge overlapping chunks, drop near-duplicates, pack to a token budget
+    CONTEXT_TOKEN_BUDGET: int = 1200 # Estimated tokens of retrieved context per prompt
+    CONTEXT_CHARS_PER_TOKEN: float = 4.0
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8 # Word 3-gram containment at which a passage counts as a duplicate
+    CONTEXT_MMR_ENABLED: bool = False # Diversify with maximal marginal relevance before packing
+    CONTEXT_MMR_FETCH_K: int = 12 # Candidates retrieved for MMR to choose RETRIEVED_DOCS_COUNT from
+    CONTEXT_MMR_LAMBDA: float = 0.5 # 1.0 = pure relevance, 0.0 = pure diversity
+    EMBEDDING_BATCH_SIZE: int = 100 # Chunks per embed + add_documents call (Chroma's max batch is ~166)
+    INGEST_PROCESS_WORKERS: int = 0 # Parser processes for bulk ingestion; 0 = one per CPU core
+    SNAPSHOT_DIR: str = "./data_store/snapshots" # Bundles written by POST /data/snapshot
+    COLLECTION_STATS_PATH: str = "./data_store/collection_stats.json" # Per-collection/source summary kept by ingestion
+    JOBS_DB_PATH: str = "./data_store/jobs.sqlite3" # Persistent ingestion job table
+    INGEST_WORKERS: int = 1 # Ingestion jobs run concurrently (keeps CPU free for chat)
+    INGEST_MAX_ATTEMPTS: int = 3
+    INGEST_RETRY_BACKOFF_SECONDS: float = 5.0 # Doubled per attempt, with jitter
+    INGEST_POLL_INTERVAL_SECONDS: float = 2.0
+    STORE_WRITER_LOCK_PATH: str = "./data_store/writer.lock" # With uvicorn --workers N, the worker holding it owns all writes
+    STORE_VERSION_PATH: str = "./data_store/store_version.json" # Per-collection change counters bumped by the writer
+    STORE_RELOAD_CHECK_SECONDS: float = 1.0 # How often reader workers look for the writer's changes
+    ENABLE_TRACING: bool = False # OpenTelemetry spans around hot stages (needs opentelemetry installed)
+    WARMUP_ON_STARTUP: bool = True # Load models/stores in the background right after the server binds
+    STREAM_RESPONSES: bool = True # Send token-by-token JSON events over /ws
+    RAG_MAX_CONCURRENCY: int = 8 # RAG pipeline runs at once across all clients (round-robin between clients)
+    CHAT_MAX_QUEUED_MESSAGES: int = 2 # Questions a connection may queue behind the one being answered
+    CHAT_SUPERSEDE_IN_FLIGHT: bool = False # A new question cancels the unfinished answer instead of queueing (behind CHAT_MAX_QUEUED_MESSAGES)
+    CONVERSATION_MEMORY_ENABLED: bool = True # Follow-up questions see a bounded summary + recent turns of the connection
+    CONVERSATION_WINDOW_TURNS: int = 4 # Recent turns kept verbatim; older ones are folded into the summary
+    CONVERSATION_TOKEN_BUDGET: int = 600 # Estimated tokens of history (summary + recent turns) per prompt
+    CONVERSATION_SUMMARY_TOKENS: int = 200 # Cap on the running summary
+    CONVERSATION_SUMMARY_MODE: str = "llm" # "llm" (one background call per folded turn) or "extractive" (no calls)
+    CONVERSATION_REWRITE_MODE: str = "heuristic" # Standalone retrieval query for follow-ups: "heuristic", "llm" or "off"
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.92 # Cosine similarity for near-duplicate hits
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: int = 3600 # 0 disables expiry
+    ANSWER_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,264 @@
+import asyncio
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain.schema import Document
+
+from app.core.lexical_index import tokenize
+from app.core.metrics import CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED, RAG_STAGE_SECONDS
+from app.core.query_embedder import aembed_query
+
+# Overlap between two chunks of the same page, when positions are unknown
+# (chunks stored before start_index was recorded): shortest suffix/prefix match accepted
+_MIN_TEXT_OVERLAP = 30
+_MIN_TRUNCATED_TOKENS = 64 # Don't pack a fragment smaller than this
+
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """Model-agnostic token estimate (Gemini and MiniLM tokenizers both average ~4 chars/token on English)."""
+    return math.ceil(len(text) / chars_per_token)
+
+
+# --- Step 1: merge overlapping / adjacent chunks of the same page ---
+def _text_overlap(a: str, b: str, max_overlap: int) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if under _MIN_TEXT_OVERLAP)."""
+    tail = a[-max_overlap:]
+    probe = b[:_MIN_TEXT_OVERLAP]
+    if len(probe) < _MIN_TEXT_OVERLAP:
+        return 0
+    position = tail.find(probe)
+    while position != -1: # Earliest match in the tail = longest overlap
+        size = len(tail) - position
+        if size <= len(b) and b.startswith(tail[position:]):
+            return size
+        position = tail.find(probe, position + 1)
+    return 0
+
+
+def _merge_pair(a: Document, b: Document, max_overlap: int) -> Optional[Document]:
+    """Merges `b` after `a` if they overlap or touch; returns None if they are not contiguous."""
+    a_start, b_start = a.metadata.get("start_index"), b.metadata.get("start_index")
+    if a_start is not None and b_start is not None:
+        a_end = a_start + len(a.page_content)
+        if b_start < a_start or b_start > a_end + 2: # Only whitespace may separate adjacent chunks
+            return None
+        overlap = a_end - b_start
+        if overlap >= len(b.page_content):
+            return a # b lies inside a
+        if overlap >= 0:
+            text = a.page_content + b.page_content[overlap:]
+        else:
+            text = a.page_content + "\n\n" + b.page_content
+    else:
+        overlap = _text_overlap(a.page_content, b.page_content, max_overlap)
+        if not overlap:
+            return None
+        text = a.page_content + b.page_content[overlap:]
+    return Document(page_content=text, metadata=dict(a.metadata))
+
+
+def _passage_key(doc: Document) -> Tuple[Any, Any, Any]:
+    # Collection first: two courses can hold files of the same name
+    return doc.metadata.get("collection"), doc.metadata.get("source"), doc.metadata.get("page")
+
+
+def merge_adjacent(docs: Sequence[Document], max_overlap: int = 300) -> List[Document]:
+    """
+    Merges chunks of the same (collection, source, page) that overlap (CHUNK_OVERLAP) or
+    are adjacent into one passage, so shared text is pasted once. Result keeps
+    the best (lowest) retrieval rank of each merged group.
+    """
+    ranked: List[Tuple[int, Document]] = list(enumerate(docs))
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(ranked)):
+            for j in range(len(ranked)):
+                if i == j:
+                    continue
+                (rank_a, a), (rank_b, b) = ranked[i], ranked[j]
+                if _passage_key(a) != _passage_key(b):
+                    continue
+                combined = _merge_pair(a, b, max_overlap)
+                if combined is None:
+                    continue
+                ranked[i] = (min(rank_a, rank_b), combined)
+                del ranked[j]
+                merged = True
+                break
+            if merged:
+                break
+    return [doc for _, doc in sorted(ranked, key=lambda item: item[0])]
+
+
+# --- Step 2: drop near-duplicate passages ---
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    tokens = tokenize(text)
+    if len(tokens) < size:
+        return {tuple(tokens)}
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def drop_near_duplicates(docs: Sequence[Document], threshold: float) -> List[Document]:
+    """
+    Drops passages whose word 3-gram containment in a better-ranked kept passage
+    is at least `threshold` (same slide in two decks, a chunk inside a merged passage).
+    """
+    kept: List[Tuple[Document, Set[Tuple[str, ...]]]] = []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        duplicate = False
+        for _, other in kept:
+            smaller = min(len(shingles), len(other)) or 1
+            if len(shingles & other) / smaller >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append((doc, shingles))
+    return [doc for doc, _ in kept]
+
+
+# --- Step 3 (optional): MMR for diversity ---
+def mmr_select(query_embedding: List[float], doc_embeddings: List[List[float]], k: int, lambda_mult: float) -> List[int]:
+    """Indices chosen by maximal marginal relevance, in selection order."""
+    if not doc_embeddings:
+        return []
+    docs = np.asarray(doc_embeddings, dtype=np.float32)
+    docs = docs / (np.linalg.norm(docs, axis=1, keepdims=True) + 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / (np.linalg.norm(query) + 1e-12)
+    relevance = docs @ query
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(docs)):
+        redundancy = (docs @ docs[selected].T).max(axis=1)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+
+# --- Step 4: pack into the token budget ---
+def _truncate(text: str, max_chars: int) -> str:
+    cut = text[:max_chars]
+    sentence_end = cut.rfind(". ")
+    if sentence_end > max_chars // 2:
+        cut = cut[:sentence_end + 1]
+    return cut.rstrip()
+
+
+def pack_to_budget(docs: Sequence[Document], token_budget: int, chars_per_token: float = 4.0) -> List[Document]:
+    """Takes passages in rank order until the budget is spent; the last one may be cut at a sentence end."""
+    packed: List[Document] = []
+    remaining = token_budget
+    for doc in docs:
+        tokens = estimate_tokens(doc.page_content, chars_per_token)
+        if tokens <= remaining:
+            packed.append(doc)
+            remaining -= tokens
+        elif remaining >= _MIN_TRUNCATED_TOKENS:
+            text = _truncate(doc.page_content, int(remaining * chars_per_token))
+            packed.append(Document(page_content=text, metadata={**doc.metadata, "truncated": True}))
+            remaining -= estimate_tokens(text, chars_per_token)
+        if remaining < _MIN_TRUNCATED_TOKENS:
+            break
+    return packed
+
+
+def pack_context(
+    docs: Sequence[Document],
+    token_budget: int,
+    dedup_threshold: float = 0.8,
+    chars_per_token: float = 4.0,
+    max_overlap: int = 300,
+) -> Tuple[List[Document], Dict[str, int]]:
+    """Merge -> dedupe -> budget. Returns the packed passages and token stats."""
+    retrieved = sum(estimate_tokens(d.page_content, chars_per_token) for d in docs)
+    passages = merge_adjacent(docs, max_overlap)
+    passages = drop_near_duplicates(passages, dedup_threshold)
+    packed = pack_to_budget(passages, token_budget, chars_per_token)
+    packed_tokens = sum(estimate_tokens(d.page_content, chars_per_token) for d in packed)
+    return packed, {
+        "retrieved_chunks": len(docs),
+        "packed_passages": len(packed),
+        "retrieved_tokens": retrieved,
+        "packed_tokens": packed_tokens,
+        "tokens_saved": max(0, retrieved - packed_tokens), # Joins of adjacent chunks can add a token
+    }
+
+
+class ContextPackingRetriever(BaseRetriever):
+    """
+    Wraps a retriever so the "stuff" chain receives a packed context:
+    overlapping/adjacent chunks merged, near-duplicates dropped, optionally
+    MMR-diversified, and cut to `token_budget` estimated tokens.
+    """
+    base_retriever: BaseRetriever
+    token_budget: int = 1200
+    dedup_threshold: float = 0.8
+    chars_per_token: float = 4.0
+    max_overlap: int = 300 # Longest shared text searched when positions are unknown (~2x CHUNK_OVERLAP)
+    mmr_k: Optional[int] = None # Set to apply MMR, keeping this many chunks
+    mmr_lambda: float = 0.5
+    embeddings: Any = None # Embeds the query for MMR (sync path)
+    vector_stores: Dict[str, Any] = {} # Collection -> store the chunk vectors for MMR are read from
+
+    def _store_name(self, doc: Document) -> Optional[str]:
+        collection = doc.metadata.get("collection") # Set by the sharded retriever
+        if collection in self.vector_stores:
+            return collection
+        return next(iter(self.vector_stores)) if len(self.vector_stores) == 1 else None
+
+    def _stored_vectors(self, docs: List[Document]) -> Optional[List[List[float]]]:
+        """
+        The chunks' vectors as stored with them (nothing is embedded on the request
+        path), or None if a chunk can't be looked up (no ID, unknown collection).
+        """
+        keys = [(self._store_name(d), d.id) for d in docs]
+        wanted: Dict[str, List[str]] = {}
+        for name, chunk_id in keys:
+            if name is None or chunk_id is None:
+                return None
+            wanted.setdefault(name, []).append(chunk_id)
+        vectors: Dict[Tuple[str, str], List[float]] = {}
+        for name, ids in wanted.items():
+            found = self.vector_stores[name].get(ids=ids, include=["embeddings"])
+            for chunk_id, vector in zip(found["ids"], found["embeddings"]):
+                vectors[(name, chunk_id)] = vector
+        if any(key not in vectors for key in keys): # Deleted since it was retrieved
+            return None
+        return [vectors[key] for key in keys]
+
+    def _pack(self, docs: List[Document], query_embedding: Optional[List[float]]) -> List[Document]:
+        start = time.perf_counter()
+        if self.mmr_k and query_embedding is not None and len(docs) > self.mmr_k:
+            doc_embeddings = self._stored_vectors(docs)
+            if doc_embeddings is not None: # Otherwise keep the retrieval order
+                order = mmr_select(query_embedding, doc_embeddings, self.mmr_k, self.mmr_lambda)
+                docs = [docs[i] for i in order]
+        packed, stats = pack_context(docs, self.token_budget, self.dedup_threshold, self.chars_per_token, self.max_overlap)
+        RAG_STAGE_SECONDS.observe(time.perf_counter() - start, stage="context_packing")
+        CONTEXT_TOKENS.observe(stats["retrieved_tokens"], kind="retrieved")
+        CONTEXT_TOKENS.observe(stats["packed_tokens"], kind="packed")
+        CONTEXT_TOKENS_SAVED.observe(stats["tokens_saved"])
+        return packed
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        query_embedding = self.embeddings.embed_query(query) if self.mmr_k else None
+        return self._pack(docs, query_embedding)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = await self.base_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        if self.mmr_k:
+            query_embedding = await aembed_query(query) # Memoized by the batcher
+            # Chunk vectors are read from the vector store: keep that off the event loop
+            return await asyncio.to_thread(self._pack, docs, query_embedding)
+        return self._pack(docs, None)
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, Optional
+
+from app.core.metrics import RAG_STAGE_SECONDS
+
+
+class FairLimiter:
+    """
+    Async concurrency limit with round-robin fairness across clients.
+    Waiters queue per client. When a slot frees up, it goes to the next client
+    in rotation rather than the oldest waiter overall. A client that submits
+    many requests therefore cannot starve the others.
+    Cancelled waiters leave the queue. A slot granted to a waiter that was
+    cancelled before it ran is passed on.
+    """
+
+    def __init__(self, limit: int, wait_stage: Optional[str] = None):
+        self.limit = max(1, limit)
+        self.wait_stage = wait_stage # RAG_STAGE_SECONDS stage for time spent waiting for a slot (None: not recorded)
+        self.active = 0
+        self._waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    def _grant(self):
+        while self.active < self.limit and self._waiters:
+            client, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            del self._waiters[client] # Rotate: this client goes to the back
+            if queue:
+                self._waiters[client] = queue
+            if future.done(): # Cancelled while waiting
+                continue
+            self.active += 1
+            future.set_result(None)
+
+    async def acquire(self, client: Hashable):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # Granted just as we were cancelled: hand the slot on
+            else:
+                queue = self._waiters.get(client)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiters[client]
+            raise
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free and nobody is waiting (never queues)."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        return False
+
+    def release(self):
+        self.active -= 1
+        self._grant()
+
+    def record_wait(self, seconds: float):
+        if self.wait_stage is not None:
+            RAG_STAGE_SECONDS.observe(seconds, stage=self.wait_stage)
+
+    @asynccontextmanager
+    async def slot(self, client: Hashable):
+        start = time.perf_counter()
+        await self.acquire(client)
+        self.record_wait(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"limit": self.limit, "running": self.active, "waiting": self.waiting}
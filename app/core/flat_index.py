@@ -0,0 +1,491 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain.schema import Document
+
+DTYPES = ("float32", "float16", "int8")
+_BLOCK_ROWS = 8192 # Rows scored per step: keeps each block cache-sized while it is read
+_MIN_CAPACITY = 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    source TEXT,
+    document TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _fsync_dir(path: str):
+    """Makes created or removed file names durable (no-op where directories can't be opened)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class FlatVectorStore(VectorStore):
+    """
+    Exact (brute-force) vector index for one collection, as an alternative to Chroma.
+    Unit-normalized embeddings are stored row by row in a memory-mapped array file
+    and scored with one matrix-vector product per query (cosine; distance = 1 - cos).
+    Texts and metadata live in a SQLite sidecar that is only read for the top
+    hits. With float16 or int8 storage the scan runs over the smaller matrix and
+    the best `k * rescore_factor` candidates are re-scored exactly against a
+    float32 copy that is memory-mapped but only paged in for those rows.
+    Deletes are tombstones; compact() writes a new generation of array files
+    without them and switches to it in the same SQLite transaction that renumbers
+    the rows, so a crash or a reader reopening meanwhile sees one consistent state.
+    With `read_only`, nothing is created or written (reader workers): reopen the
+    store to see another process's changes.
+
+    Besides the LangChain VectorStore interface it offers the subset of Chroma's
+    API the app uses (get with ids/where/limit/offset, upsert, query by vector,
+    metadata update), so it can stand in for a Chroma collection.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        embedding_function: Optional[Embeddings] = None,
+        dtype: str = "float32",
+        rescore_factor: int = 4,
+        read_only: bool = False,
+    ):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported flat index dtype '{dtype}' (use one of {', '.join(DTYPES)})")
+        self.path = path
+        self.name = name
+        self._embedding_function = embedding_function
+        self.rescore_factor = max(1, rescore_factor)
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        self._local = threading.local() # One SQLite connection per thread, kept open
+        self._db_path = os.path.join(path, "meta.sqlite3")
+        if not read_only:
+            os.makedirs(path, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL") # Persistent: readers in other processes never block the writer
+                conn.executescript(_SCHEMA)
+        for attempt in range(3):
+            try:
+                self._load(dtype)
+                break
+            except FileNotFoundError: # Read-only: the writer compacted between our read and open
+                if not read_only or attempt == 2:
+                    raise
+        if not read_only:
+            self._remove_stale_files()
+
+    def _load(self, dtype: str):
+        meta, rows = {}, []
+        if os.path.exists(self._db_path): # Read-only and not created yet: an empty store
+            with self._connect() as conn:
+                conn.execute("BEGIN") # One transaction: meta and rows agree
+                meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+                rows = conn.execute("SELECT row, id FROM chunks").fetchall()
+        # The dtype an index was created with wins over the setting (changing it needs a re-import)
+        self.dtype = meta.get("dtype", dtype)
+        if self.dtype != dtype:
+            print(f"!!! Flat index '{self.name}' is stored as {self.dtype}; ignoring FLAT_INDEX_DTYPE={dtype}.")
+        self.dim: Optional[int] = int(meta["dim"]) if "dim" in meta else None
+        self._capacity = int(meta.get("capacity", 0))
+        self._rows = int(meta.get("rows", 0)) # Rows written, live or tombstoned
+        self._generation = int(meta.get("generation", 0)) # Bumped by every compact()
+        self._row_of: Dict[str, int] = {}
+        self._live = np.zeros(self._capacity, dtype=bool)
+        for row, chunk_id in rows:
+            self._row_of[chunk_id] = row
+            self._live[row] = True
+        self._vectors = self._scales = self._full = None
+        if self.dim is not None and self._capacity:
+            self._open_arrays()
+
+    # --- Storage ---
+    @contextmanager
+    def _connect(self):
+        """This thread's connection to the sidecar, as a transaction (commits on success)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{os.path.abspath(self._db_path)}?mode=ro", uri=True, timeout=30)
+            else:
+                conn = sqlite3.connect(self._db_path, timeout=30)
+            self._local.conn = conn
+        with conn:
+            yield conn
+
+    def _files(self, generation: Optional[int] = None) -> List[Tuple[str, str, int]]:
+        """(attribute, file name, values per row) of every array file for this dtype."""
+        generation = self._generation if generation is None else generation
+        prefix = f"g{generation}." if generation else "" # Generation 0 keeps the original names
+        files = [("_vectors", f"vectors.{prefix}{self.dtype}", self.dim)]
+        if self.dtype == "int8":
+            files.append(("_scales", f"scales.{prefix}float32", 1))
+        if self.dtype != "float32":
+            files.append(("_full", f"full.{prefix}float32", self.dim)) # Exact copy for re-scoring
+        return files
+
+    def _remove_stale_files(self):
+        """Deletes array files of other generations (left by a compaction or a crash during one)."""
+        current = {filename for _, filename, _ in self._files()}
+        for filename in os.listdir(self.path):
+            if filename.split(".")[0] in ("vectors", "scales", "full") and filename not in current:
+                os.remove(os.path.join(self.path, filename))
+
+    def _array_dtype(self, attribute: str):
+        return np.dtype(self.dtype) if attribute == "_vectors" else np.dtype(np.float32)
+
+    def _open_arrays(self):
+        for attribute, filename, width in self._files():
+            file_path = os.path.join(self.path, filename)
+            dtype = self._array_dtype(attribute)
+            size = self._capacity * width * dtype.itemsize
+            if not self.read_only:
+                with open(file_path, "ab") as f: # Create if missing, never truncate
+                    if f.tell() < size:
+                        f.truncate(size)
+            # The writer only grows files in place or moves to new ones (compact), so a
+            # reader's mapping stays valid until it reopens the store
+            array = np.memmap(file_path, dtype=dtype, mode="r" if self.read_only else "r+", shape=(self._capacity, width))
+            setattr(self, attribute, array[:, 0] if width == 1 else array)
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        self._flush()
+        self._vectors = self._scales = self._full = None # Release the old mappings before growing
+        self._capacity = max(rows, 2 * self._capacity, _MIN_CAPACITY)
+        self._live = np.concatenate([self._live, np.zeros(self._capacity - len(self._live), dtype=bool)])
+        self._open_arrays()
+
+    def _flush(self):
+        for array in (self._vectors, self._scales, self._full):
+            if array is not None:
+                array.flush()
+
+    def _write_rows(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.dtype == "float32":
+            self._vectors[rows] = vectors
+            return
+        self._full[rows] = vectors
+        if self.dtype == "float16":
+            self._vectors[rows] = vectors.astype(np.float16)
+        else: # Symmetric per-row int8: x ~= scale * q
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._vectors[rows] = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+            self._scales[rows] = scales
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Flat index '{self.name}' is open read-only (this is a reader worker).")
+
+    def _save_meta(self, conn: sqlite3.Connection):
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [
+                ("dtype", self.dtype), ("dim", str(self.dim)), ("capacity", str(self._capacity)),
+                ("rows", str(self._rows)), ("generation", str(self._generation)),
+            ],
+        )
+
+    # --- Chroma-style writes ---
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: List[str],
+        metadatas: Optional[List[Optional[dict]]] = None,
+    ):
+        """Adds chunks, or overwrites the vector, text and metadata of IDs already stored."""
+        self._check_writable()
+        if not ids:
+            return
+        metadatas = metadatas or [None] * len(ids)
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+            rows = []
+            next_row = self._rows
+            for chunk_id in ids:
+                row = self._row_of.get(chunk_id)
+                if row is None:
+                    row, next_row = next_row, next_row + 1
+                    self._row_of[chunk_id] = row
+                rows.append(row)
+            self._ensure_capacity(next_row)
+            # Vectors first, then the sidecar: a crash in between leaves unused rows, never dangling ones
+            self._write_rows(np.asarray(rows), vectors)
+            self._flush()
+            self._rows = next_row
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, id, source, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (row, chunk_id, (metadata or {}).get("source"), text, json.dumps(metadata or {}))
+                        for row, chunk_id, text, metadata in zip(rows, ids, documents, metadatas)
+                    ],
+                )
+                self._save_meta(conn)
+            self._live[rows] = True
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]):
+        self._check_writable()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "UPDATE chunks SET metadata = ?, source = ? WHERE id = ?",
+                [(json.dumps(m or {}), (m or {}).get("source"), chunk_id) for chunk_id, m in zip(ids, metadatas)],
+            )
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Tombstones chunks by ID; their rows are reclaimed by compact()."""
+        self._check_writable()
+        if not ids:
+            return None
+        with self._lock:
+            rows = [self._row_of.pop(chunk_id) for chunk_id in ids if chunk_id in self._row_of]
+            if not rows:
+                return True
+            self._live[rows] = False
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            if self._rows - len(self._row_of) > max(_MIN_CAPACITY, len(self._row_of)):
+                self.compact() # Mostly tombstones: the scan would waste more time than a rewrite
+        return True
+
+    def compact(self):
+        """
+        Rewrites the array files and the sidecar with live rows only, in row order.
+        The new arrays go to files of the next generation and are synced to disk
+        before the row renumbering and the generation switch commit together;
+        until then the store keeps using (and a crash leaves) the old files.
+        """
+        self._check_writable()
+        with self._lock:
+            if self.dim is None:
+                return
+            live_rows = np.flatnonzero(self._live[: self._rows])
+            remap = {int(old): new for new, old in enumerate(live_rows)}
+            capacity = max(len(live_rows), _MIN_CAPACITY)
+            generation = self._generation + 1
+            for attribute, filename, width in self._files(generation):
+                dtype = self._array_dtype(attribute)
+                with open(os.path.join(self.path, filename), "wb") as f:
+                    np.ascontiguousarray(getattr(self, attribute)[live_rows], dtype=dtype).tofile(f)
+                    f.truncate(capacity * width * dtype.itemsize)
+                    f.flush()
+                    os.fsync(f.fileno())
+            _fsync_dir(self.path)
+
+            old_files = self._files()
+            previous = (self._capacity, self._rows, self._generation)
+            self._capacity, self._rows, self._generation = capacity, len(live_rows), generation
+            try:
+                with self._connect() as conn: # The switch: renumbered rows and the new generation
+                    for old, new in sorted(remap.items()): # Ascending and new <= old: no key collisions
+                        conn.execute("UPDATE chunks SET row = ? WHERE row = ?", (new, old))
+                    self._save_meta(conn)
+            except BaseException:
+                self._capacity, self._rows, self._generation = previous
+                raise
+            self._vectors = self._scales = self._full = None
+            self._live = np.zeros(self._capacity, dtype=bool)
+            self._live[: self._rows] = True
+            self._row_of = {chunk_id: remap[row] for chunk_id, row in self._row_of.items()}
+            self._open_arrays()
+            for _, filename, _ in old_files: # Readers still mapping them keep their (unlinked) copy
+                os.remove(os.path.join(self.path, filename))
+        print(f"Flat index '{self.name}' compacted to {self._rows} rows.")
+
+    # --- Reads ---
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def _scan(self, query: np.ndarray, n_rows: int) -> np.ndarray:
+        """Approximate (quantized) or exact (float32) cosine scores of every written row."""
+        scores = np.empty(n_rows, dtype=np.float32)
+        for start in range(0, n_rows, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, n_rows)
+            block = self._vectors[start:end]
+            if self.dtype == "float32":
+                scores[start:end] = block @ query
+            else: # Upcast inside the product: no float32 copy of the block
+                scores[start:end] = np.einsum("ij,j->i", block, query, dtype=np.float32, casting="unsafe")
+                if self.dtype == "int8":
+                    scores[start:end] *= self._scales[start:end]
+        return scores
+
+    def _top_rows(self, query_embedding: Sequence[float], k: int) -> List[Tuple[int, float]]:
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        with self._lock:
+            n_rows = self._rows
+            if self.dim is None or not self._row_of or k <= 0:
+                return []
+            scores = self._scan(query, n_rows)
+            scores[~self._live[:n_rows]] = -np.inf
+            candidates = min(len(self._row_of), k if self.dtype == "float32" else k * self.rescore_factor)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            if self.dtype != "float32": # Exact re-score: only these rows of the float32 copy are read
+                order = np.sort(top)
+                scores[order] = self._full[order] @ query
+            top = top[np.argsort(-scores[top])][:k]
+            return [(int(row), float(scores[row])) for row in top]
+
+    def _fetch(self, rows: Sequence[int]) -> Dict[int, Tuple[str, str, dict]]:
+        if not rows:
+            return {}
+        with self._connect() as conn:
+            found = conn.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(rows))})",
+                list(rows),
+            ).fetchall()
+        # A reader opened before the writer compacted still has the old row numbers:
+        # rows now holding another chunk are dropped until it reloads
+        return {
+            row: (chunk_id, text, json.loads(metadata))
+            for row, chunk_id, text, metadata in found
+            if self._row_of.get(chunk_id) == row
+        }
+
+    def query_with_ids(self, query_embedding: Sequence[float], k: int) -> List[Tuple[str, Document, float]]:
+        """Top-k chunks as (chunk_id, Document, distance), distance = 1 - cosine similarity."""
+        top = self._top_rows(query_embedding, k)
+        fetched = self._fetch([row for row, _ in top])
+        return [
+            (fetched[row][0], Document(id=fetched[row][0], page_content=fetched[row][1], metadata=fetched[row][2]), 1.0 - score)
+            for row, score in top
+            if row in fetched
+        ]
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Iterable[str] = ("metadatas", "documents"),
+    ) -> Dict[str, Any]:
+        """
+        Chroma-compatible get: by IDs and/or equality filters on metadata, paged in row order.
+        "embeddings" in `include` returns the stored (unit-normalized, float32) vectors.
+        """
+        include = set(include)
+        if not os.path.exists(self._db_path):
+            return {"ids": [], "documents": [] if "documents" in include else None,
+                    "metadatas": [] if "metadatas" in include else None}
+        query = "SELECT id, document, metadata, row FROM chunks"
+        clauses, params = [], []
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return {"ids": [], "documents": [], "metadatas": []}
+            clauses.append(f"id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        filters = dict(where or {})
+        if "source" in filters:
+            clauses.append("source = ?")
+            params.append(filters.pop("source"))
+        for key, value in filters.items(): # Other keys: the JSON metadata (unindexed)
+            clauses.append("json_extract(metadata, ?) = ?")
+            params.extend([f"$.{key}", value])
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY row"
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([limit if limit is not None else -1, offset or 0])
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        if "embeddings" in include:
+            with self._lock:
+                # Only rows this instance has mapped (a reader may be behind the writer)
+                rows = [r for r in rows if self._row_of.get(r[0]) == r[3]]
+                exact = self._vectors if self.dtype == "float32" else self._full
+                row_numbers = [r[3] for r in rows]
+                embeddings = np.array(exact[row_numbers]) if rows else np.empty((0, self.dim or 0), dtype=np.float32)
+        result: Dict[str, Any] = {"ids": [chunk_id for chunk_id, _, _, _ in rows]}
+        result["documents"] = [text for _, text, _, _ in rows] if "documents" in include else None
+        result["metadatas"] = [json.loads(metadata) for _, _, metadata, _ in rows] if "metadatas" in include else None
+        if "embeddings" in include:
+            result["embeddings"] = embeddings
+        return result
+
+    # --- LangChain VectorStore interface ---
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if ids is None:
+            import uuid
+            ids = [uuid.uuid4().hex for _ in texts]
+        self.upsert(ids, self._embedding_function.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return [(doc, distance) for _, doc, distance in self.query_with_ids(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(self._embedding_function.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for _, doc, _ in self.query_with_ids(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance # Cosine distance -> similarity
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        path: str,
+        name: str = "default",
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "FlatVectorStore":
+        store = cls(path=path, name=name, embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Dict, Hashable, Iterable, List, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain.schema import Document
+
+from app.core.lexical_index import LexicalIndex
+from app.core.metrics import RAG_STAGE_SECONDS, observe_stage
+from app.core.query_embedder import aembed_query
+from app.core.vector_store import get_embedding_function, similarity_search_with_ids
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[Hashable]], rrf_k: int) -> Dict[Hashable, float]:
+    """Fused score per key: sum(1 / (rrf_k + rank)) over the ranked lists it appears in (rank from 1)."""
+    fused: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return fused
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses dense (Chroma) and lexical (BM25) results with reciprocal rank fusion.
+    Each side contributes `fetch_k` candidates; a chunk's fused score is
+    sum(1 / (rrf_k + rank)) over the lists it appears in. Chunks found only
+    by BM25 are fetched from the vector store by ID.
+    """
+    vector_store: Any
+    lexical_index: LexicalIndex
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with observe_stage(RAG_STAGE_SECONDS, "query_embedding"):
+            query_embedding = get_embedding_function().embed_query(query)
+        return self._search(query, query_embedding)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # The chat path: the query embedding is micro-batched with other concurrent chats
+        with observe_stage(RAG_STAGE_SECONDS, "query_embedding"):
+            query_embedding = await aembed_query(query)
+        return await asyncio.to_thread(self._search, query, query_embedding)
+
+    def _search(self, query: str, query_embedding: List[float]) -> List[Document]:
+        with observe_stage(RAG_STAGE_SECONDS, "vector_search"):
+            dense = similarity_search_with_ids(self.vector_store, query_embedding, self.fetch_k)
+        with observe_stage(RAG_STAGE_SECONDS, "lexical_search"):
+            lexical = self.lexical_index.search(query, self.fetch_k)
+
+        fused = reciprocal_rank_fusion(
+            ([chunk_id for chunk_id, _, _ in dense], [chunk_id for chunk_id, _ in lexical]), self.rrf_k
+        )
+        top_ids = sorted(fused, key=fused.get, reverse=True)[: self.k]
+
+        documents = {chunk_id: doc for chunk_id, doc, _ in dense}
+        missing = [chunk_id for chunk_id in top_ids if chunk_id not in documents]
+        if missing:
+            found = self.vector_store.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                documents[chunk_id] = Document(id=chunk_id, page_content=text, metadata=metadata or {})
+
+        # IDs can be missing from the store if the index is briefly ahead of a delete
+        return [documents[chunk_id] for chunk_id in top_ids if chunk_id in documents]
@@ -0,0 +1,266 @@
+import json
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core import store_sync
+from app.core.config import settings
+from app.core.startup import timed_phase
+from app.core.vector_store import collection_name_of
+
+# Words (keeping internal . - _ so "cs-101", "x_i", "3.14" stay whole) plus
+# single non-ASCII symbols such as ∑, ∇, ≤ that MiniLM embeds poorly.
+_TOKEN_PATTERN = re.compile(r"\w+(?:[.\-_]\w+)*|[^\w\s\x00-\x7f]")
+_MAX_TF = 65535 # Term frequencies are stored as uint16
+
+SNAPSHOT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index over chunk texts.
+    Postings are compact parallel arrays (uint32 doc numbers, uint16 term
+    frequencies), appended in doc order. Updates are applied in memory and
+    appended to a small journal file, so adding a chunk costs milliseconds;
+    the journal is folded into a pickle snapshot every `compact_every` operations.
+    Deletes are tombstones until the next compaction.
+    """
+
+    def __init__(self, path_prefix: str, k1: float = 1.5, b: float = 0.75, compact_every: int = 5000):
+        self.snapshot_path = f"{path_prefix}.snapshot"
+        self.journal_path = f"{path_prefix}.journal"
+        self.k1 = k1
+        self.b = b
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._reset()
+        os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_path)), exist_ok=True)
+        self._load()
+
+    def _reset(self):
+        self._chunk_ids: List[str] = []           # doc number -> chunk ID
+        self._doc_numbers: Dict[str, int] = {}    # chunk ID -> doc number (live docs only)
+        self._doc_lengths = array("I")
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._deleted = set()
+        self._total_length = 0
+        self._journal_entries = 0
+
+    # --- Persistence ---
+    def _load(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("version") == SNAPSHOT_VERSION:
+                self._chunk_ids = state["chunk_ids"]
+                self._doc_lengths = state["doc_lengths"]
+                self._postings = state["postings"]
+                self._deleted = state["deleted"]
+                self._doc_numbers = {
+                    chunk_id: n for n, chunk_id in enumerate(self._chunk_ids) if n not in self._deleted
+                }
+                self._total_length = sum(
+                    length for n, length in enumerate(self._doc_lengths) if n not in self._deleted
+                )
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break # Torn final write; everything before it is intact
+                    if entry["op"] == "add":
+                        self._apply_add(entry["id"], entry["tf"])
+                    elif entry["op"] == "delete":
+                        self._apply_delete(entry["ids"])
+                    self._journal_entries += 1
+        if self._chunk_ids:
+            print(f"Lexical index loaded: {len(self)} chunks, {len(self._postings)} terms.")
+
+    def _append_journal(self, entries: List[dict]):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._journal_entries += len(entries)
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the snapshot without tombstoned docs and truncates the journal."""
+        with self._lock:
+            live = [n for n in range(len(self._chunk_ids)) if n not in self._deleted]
+            renumber = {old: new for new, old in enumerate(live)}
+            postings: Dict[str, Tuple[array, array]] = {}
+            for term, (docs, tfs) in self._postings.items():
+                new_docs, new_tfs = array("I"), array("H")
+                for doc, tf in zip(docs, tfs):
+                    if doc in renumber:
+                        new_docs.append(renumber[doc])
+                        new_tfs.append(tf)
+                if new_docs:
+                    postings[term] = (new_docs, new_tfs)
+            self._chunk_ids = [self._chunk_ids[n] for n in live]
+            self._doc_lengths = array("I", (self._doc_lengths[n] for n in live))
+            self._doc_numbers = {chunk_id: n for n, chunk_id in enumerate(self._chunk_ids)}
+            self._postings = postings
+            self._deleted = set()
+
+            state = {
+                "version": SNAPSHOT_VERSION,
+                "chunk_ids": self._chunk_ids,
+                "doc_lengths": self._doc_lengths,
+                "postings": self._postings,
+                "deleted": self._deleted,
+            }
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path) # Atomic swap
+            open(self.journal_path, "w").close()
+            self._journal_entries = 0
+
+    # --- Updates ---
+    def _apply_add(self, chunk_id: str, term_counts: Dict[str, int]):
+        if chunk_id in self._doc_numbers:
+            return
+        doc = len(self._chunk_ids)
+        self._chunk_ids.append(chunk_id)
+        self._doc_numbers[chunk_id] = doc
+        length = sum(term_counts.values())
+        self._doc_lengths.append(length)
+        self._total_length += length
+        for term, tf in term_counts.items():
+            entry = self._postings.get(term)
+            if entry is None:
+                entry = self._postings[term] = (array("I"), array("H"))
+            entry[0].append(doc)
+            entry[1].append(min(tf, _MAX_TF))
+
+    def _apply_delete(self, chunk_ids: Iterable[str]):
+        for chunk_id in chunk_ids:
+            doc = self._doc_numbers.pop(chunk_id, None)
+            if doc is not None:
+                self._deleted.add(doc)
+                self._total_length -= self._doc_lengths[doc]
+
+    def add(self, items: Iterable[Tuple[str, str]]):
+        """Indexes (chunk_id, text) pairs. Already indexed IDs are ignored."""
+        entries = []
+        with self._lock:
+            for chunk_id, text in items:
+                if chunk_id in self._doc_numbers:
+                    continue
+                term_counts = dict(Counter(tokenize(text)))
+                self._apply_add(chunk_id, term_counts)
+                entries.append({"op": "add", "id": chunk_id, "tf": term_counts})
+            if entries:
+                self._append_journal(entries)
+
+    def delete(self, chunk_ids: Iterable[str]):
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            self._apply_delete(chunk_ids)
+            self._append_journal([{"op": "delete", "ids": chunk_ids}])
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            for path in (self.snapshot_path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # --- Search ---
+    def __len__(self) -> int:
+        return len(self._doc_numbers)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Returns up to k (chunk_id, bm25_score) pairs, best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_numbers)
+            if not terms or n_docs == 0:
+                return []
+            lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32).astype(np.float32)
+            avg_length = self._total_length / n_docs
+            norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            scores = np.zeros(len(self._chunk_ids), dtype=np.float32)
+            for term in terms:
+                entry = self._postings.get(term)
+                if entry is None:
+                    continue
+                docs = np.frombuffer(entry[0], dtype=np.uint32)
+                tfs = np.frombuffer(entry[1], dtype=np.uint16).astype(np.float32)
+                df = len(docs)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+            if self._deleted:
+                scores[list(self._deleted)] = 0.0
+
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._chunk_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+# --- Shared instances (one per collection) ---
+_lexical_indexes: Dict[str, LexicalIndex] = {}
+_lexical_index_lock = threading.Lock()
+
+def get_lexical_index(collection_name: Optional[str] = None) -> LexicalIndex:
+    """Loads a collection's BM25 index from LEXICAL_INDEX_DIR on first use."""
+    name = collection_name or settings.CHROMA_COLLECTION_NAME
+    with _lexical_index_lock:
+        index = _lexical_indexes.get(name)
+        if index is None:
+            with timed_phase("lexical_index"):
+                index = _lexical_indexes[name] = LexicalIndex(os.path.join(settings.LEXICAL_INDEX_DIR, name))
+        return index
+
+
+def rebuild_lexical_index(vector_db, batch_size: int = 1000) -> int:
+    """(Re)builds the BM25 index of `vector_db`'s collection from its chunks. Returns chunks indexed."""
+    index = get_lexical_index(collection_name_of(vector_db))
+    index.clear()
+    offset = 0
+    while True:
+        page = vector_db.get(include=["documents"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        index.add(zip(page["ids"], page["documents"]))
+        offset += len(page["ids"])
+    index.compact()
+    store_sync.bump(collection_name_of(vector_db))
+    print(f"Lexical index for '{collection_name_of(vector_db)}' rebuilt from vector store: {offset} chunks.")
+    return offset
+
+
+def ensure_lexical_index(vector_db):
+    """Builds the index once for collections that were populated before it existed."""
+    name = collection_name_of(vector_db)
+    index = get_lexical_index(name)
+    if len(index) == 0 and vector_db.get(include=[], limit=1)["ids"]:
+        if store_sync.is_writer():
+            rebuild_lexical_index(vector_db)
+        else:
+            print(f"!!! No BM25 index for '{name}' yet; it is built by the writer worker (dense search only until then).")
+    return index
+
+
+def _reload_indexes(collections: List[str]):
+    """Reader worker: forgets changed indexes so they are loaded again from the writer's files."""
+    with _lexical_index_lock:
+        for name in collections:
+            _lexical_indexes.pop(name, None)
+
+store_sync.on_change(_reload_indexes)
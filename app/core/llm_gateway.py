@@ -0,0 +1,440 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.core.fair_limiter import FairLimiter
+from app.core.metrics import LLM_CALLS_TOTAL, RAG_STAGE_SECONDS
+
+T = TypeVar("T")
+
+# Quota, overload and transient server/network errors; anything else (bad request,
+# safety block, auth) would fail the same way again
+_RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "BadGateway", "GatewayTimeout", "TimeoutError", "ConnectionError",
+}
+_RETRYABLE_MESSAGE = re.compile(
+    r"\b(429|500|502|503|504)\b|rate limit|quota|resource has been exhausted|unavailable|deadline exceeded|timed? ?out",
+    re.IGNORECASE,
+)
+
+
+class LLMUnavailableError(RuntimeError):
+    """The LLM could not be called: circuit open, queue full, or retries exhausted."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in _RETRYABLE_NAMES for cls in type(error).__mro__):
+        return True
+    return bool(_RETRYABLE_MESSAGE.search(str(error)))
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` per second up to `capacity`. reserve() takes
+    tokens immediately (the balance may go negative) and returns how long the
+    caller must wait before using them, so callers queue fairly in reservation
+    order without holding a lock while they sleep. rate <= 0 disables it.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def try_take(self, amount: float = 1.0) -> bool:
+        """Takes tokens only if they are available right now (used for optional hedges)."""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+
+class CircuitBreaker:
+    """
+    Tracks the last `window` attempts and opens when at least `failure_ratio`
+    of them failed (once half the window has been seen). While open, calls are
+    rejected for `cooldown_seconds`. Then one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, window: int, failure_ratio: float, cooldown_seconds: float):
+        self.window = max(2, window)
+        self.failure_ratio = failure_ratio
+        self.cooldown_seconds = cooldown_seconds
+        self.opened_at: Optional[float] = None
+        self._outcomes: Deque[bool] = deque(maxlen=self.window) # True = failure
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown_seconds else "open"
+
+    @property
+    def failures(self) -> int:
+        return sum(self._outcomes)
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None: # Trial succeeded: start over
+                self._outcomes.clear()
+            self._outcomes.append(False)
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(True)
+            failures = sum(self._outcomes)
+            tripped = len(self._outcomes) >= self.window // 2 and failures >= self.failure_ratio * len(self._outcomes)
+            if self._trial_running or (self.opened_at is None and tripped):
+                print(f"!!! LLM circuit breaker opened: {failures} of the last {len(self._outcomes)} attempts failed.")
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release_trial(self):
+        """A trial call ended without a verdict (e.g. cancelled): let the next one try."""
+        with self._lock:
+            self._trial_running = False
+
+
+def _discard_late(task: "asyncio.Future", discard: Callable[[Any], Awaitable[None]]):
+    """Cleans up a losing request that still completed before its cancellation landed."""
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(discard(task.result()))
+
+
+class LLMGateway:
+    """
+    Admission and retry policy shared by every LLM call in the process:
+    circuit breaker, bounded concurrency with a bounded queue, request/token
+    rate limits, retries with full-jitter exponential backoff, and optional
+    hedging. A hedge is a second identical request started when the first has
+    not answered by the `hedge_percentile` of recent latencies. It only runs
+    on spare rate and concurrency budget, and the slower of the two is
+    cancelled.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        retry_attempts: int = 3,
+        retry_base_seconds: float = 0.5,
+        retry_max_seconds: float = 8.0,
+        attempt_timeout_seconds: float = 30.0,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay_seconds: float = 1.0,
+        breaker_window: int = 20,
+        breaker_failure_ratio: float = 0.5,
+        breaker_cooldown_seconds: float = 30.0,
+    ):
+        self.max_queue = max_queue
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 60.0))
+        # A minute's worth of burst: prompts are large, so a per-second bucket would never fit one
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self.retry_attempts = max(1, retry_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.attempt_timeout_seconds = attempt_timeout_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+        self.breaker = CircuitBreaker(breaker_window, breaker_failure_ratio, breaker_cooldown_seconds)
+        self.limiter = FairLimiter(max_concurrency, wait_stage="llm_wait") # Single client key: FIFO
+        self._latencies: Deque[float] = deque(maxlen=500) # Recent time-to-first-result, for the hedge delay
+
+    # --- Admission ---
+    @asynccontextmanager
+    async def slot(self):
+        """One concurrency slot for a whole call (including the rest of a stream)."""
+        if not self.breaker.allow():
+            LLM_CALLS_TOTAL.inc(outcome="circuit_open")
+            raise LLMUnavailableError("LLM circuit breaker is open after repeated failures")
+        start = time.perf_counter()
+        try:
+            if self.limiter.active >= self.limiter.limit and self.limiter.waiting >= self.max_queue:
+                LLM_CALLS_TOTAL.inc(outcome="rejected")
+                raise LLMUnavailableError("Too many LLM calls waiting")
+            await self.limiter.acquire("llm")
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        self.limiter.record_wait(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self.limiter.release()
+
+    async def _wait_for_rate(self, prompt_tokens: float):
+        delay = max(self.requests.reserve(1), self.tokens.reserve(prompt_tokens))
+        if delay:
+            RAG_STAGE_SECONDS.observe(delay, stage="llm_rate_limit")
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled or len(self._latencies) < 20:
+            return None
+        return max(self.hedge_min_delay_seconds, float(np.percentile(self._latencies, self.hedge_percentile)))
+
+    # --- Calls ---
+    async def _race(
+        self,
+        start: Callable[[], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[None]]],
+        prompt_tokens: float,
+    ) -> T:
+        """One attempt: the primary request, plus a hedge if it is slow. First success wins."""
+        began = time.perf_counter()
+        deadline = began + self.attempt_timeout_seconds
+        primary = asyncio.ensure_future(start())
+        pending = {primary}
+        hedge_delay = self.hedge_delay()
+        extra_slot = False
+        error: Optional[BaseException] = None
+        try:
+            if hedge_delay is not None and hedge_delay < self.attempt_timeout_seconds:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done and self.requests.try_take(1) and self.tokens.try_take(prompt_tokens) and self.limiter.try_acquire():
+                    extra_slot = True
+                    LLM_CALLS_TOTAL.inc(outcome="hedged")
+                    pending.add(asyncio.ensure_future(start()))
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.perf_counter()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError(f"No LLM response within {self.attempt_timeout_seconds}s")
+                winners = [task for task in done if task.exception() is None]
+                if winners:
+                    winner = winners[0]
+                    if winner is not primary:
+                        LLM_CALLS_TOTAL.inc(outcome="hedge_won")
+                    for task in winners[1:]: # Both finished at once: drop the spare result
+                        if discard is not None:
+                            await discard(task.result())
+                    self._latencies.append(time.perf_counter() - began)
+                    return winner.result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+                if discard is not None:
+                    task.add_done_callback(lambda t: _discard_late(t, discard))
+            if extra_slot:
+                self.limiter.release()
+
+    async def call(
+        self,
+        start: Callable[[], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+        prompt_tokens: float = 0,
+    ) -> T:
+        """
+        Runs `start` (an LLM request) with rate limiting, retries, hedging and
+        circuit breaking. The caller holds a slot(). `discard` cleans up the
+        result of a losing hedge (e.g. closes its stream).
+        """
+        for attempt in range(self.retry_attempts):
+            await self._wait_for_rate(prompt_tokens)
+            try:
+                result = await self._race(start, discard, prompt_tokens)
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.release_trial()
+                    LLM_CALLS_TOTAL.inc(outcome="failed")
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 >= self.retry_attempts or not self.breaker.allow():
+                    LLM_CALLS_TOTAL.inc(outcome="failed")
+                    raise LLMUnavailableError(f"LLM call failed after {attempt + 1} attempt(s): {e}") from e
+                delay = self._backoff(attempt)
+                print(f"!!! LLM call failed ({type(e).__name__}: {e}); retry {attempt + 1} in {delay:.2f}s")
+                LLM_CALLS_TOTAL.inc(outcome="retried")
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            LLM_CALLS_TOTAL.inc(outcome="ok")
+            return result
+        raise AssertionError("unreachable")
+
+    def call_sync(self, start: Callable[[], T], prompt_tokens: float = 0) -> T:
+        """Blocking variant for sync callers: rate limit, retries and breaker (no hedging or slots)."""
+        if not self.breaker.allow():
+            LLM_CALLS_TOTAL.inc(outcome="circuit_open")
+            raise LLMUnavailableError("LLM circuit breaker is open after repeated failures")
+        for attempt in range(self.retry_attempts):
+            time.sleep(max(self.requests.reserve(1), self.tokens.reserve(prompt_tokens)))
+            try:
+                result = start()
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.release_trial()
+                    LLM_CALLS_TOTAL.inc(outcome="failed")
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 >= self.retry_attempts or not self.breaker.allow():
+                    LLM_CALLS_TOTAL.inc(outcome="failed")
+                    raise LLMUnavailableError(f"LLM call failed after {attempt + 1} attempt(s): {e}") from e
+                LLM_CALLS_TOTAL.inc(outcome="retried")
+                time.sleep(self._backoff(attempt))
+                continue
+            self.breaker.record_success()
+            LLM_CALLS_TOTAL.inc(outcome="ok")
+            return result
+        raise AssertionError("unreachable")
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        return {
+            "in_flight": self.limiter.active,
+            "waiting": self.limiter.waiting,
+            "circuit": self.breaker.state,
+            "recent_failures": self.breaker.failures,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+        }
+
+
+class ResilientChatModel(BaseChatModel):
+    """
+    Chat model wrapper that sends every call through an LLMGateway. It is a drop-in
+    replacement for the wrapped model in chains. Streams are retried and hedged
+    up to their first chunk. After that, tokens have reached the user and an
+    error is passed through.
+    """
+    llm: BaseChatModel
+    gateway: Any # LLMGateway
+    chars_per_token: float = 4.0
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.llm._llm_type}"
+
+    def _prompt_tokens(self, messages: List[BaseMessage]) -> float:
+        return sum(len(str(m.content)) for m in messages) / self.chars_per_token
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self.gateway.call_sync(
+            lambda: self.llm._generate(messages, stop=stop, **kwargs), self._prompt_tokens(messages)
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        async with self.gateway.slot():
+            return await self.gateway.call(
+                lambda: self.llm._agenerate(messages, stop=stop, **kwargs),
+                prompt_tokens=self._prompt_tokens(messages),
+            )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        def open_stream() -> Tuple[Iterator[ChatGenerationChunk], Optional[ChatGenerationChunk]]:
+            stream = self.llm._stream(messages, stop=stop, **kwargs)
+            return stream, next(stream, None)
+
+        stream, first = self.gateway.call_sync(open_stream, self._prompt_tokens(messages))
+        if first is not None:
+            yield first
+        yield from stream
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        Opened = Tuple[AsyncIterator[ChatGenerationChunk], Optional[ChatGenerationChunk]]
+
+        async def open_stream() -> Opened:
+            stream = self.llm._astream(messages, stop=stop, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        async def close_stream(opened: Opened):
+            await opened[0].aclose()
+
+        async with self.gateway.slot():
+            stream, first = await self.gateway.call(open_stream, close_stream, self._prompt_tokens(messages))
+            try:
+                if first is not None:
+                    yield first
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
@@ -0,0 +1,270 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+# Minimal Prometheus text-format metrics (no extra dependency) plus optional
+# OpenTelemetry spans around the same stages when ENABLE_TRACING is set.
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], le: Optional[str] = None) -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+
+SampleCallback = Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+
+
+class Gauge(_Metric):
+    """A gauge that is either set directly or read from callbacks at scrape time."""
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._callbacks: List[SampleCallback] = []
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def add_callback(self, callback: SampleCallback):
+        """Registers a function returning (labels, value) pairs, called on every scrape."""
+        self._callbacks.append(callback)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        for callback in self._callbacks:
+            try:
+                for labels, value in callback():
+                    values[self._key(labels)] = value
+            except Exception as e:
+                print(f"!!! Metrics: {self.name} callback failed: {e}")
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values.items()]
+
+
+class CallbackCounter(Gauge):
+    """A counter whose running totals live elsewhere (e.g. cache stats) and are read at scrape time."""
+    type_name = "counter"
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {} # bucket counts..., +Inf count, sum
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, str(bound))} {cumulative}")
+                cumulative += series[len(self.buckets)]
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, '+Inf')} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- Chat / RAG ---
+RAG_STAGE_SECONDS = registry.register(Histogram(
+    "rag_stage_seconds",
+    "Latency of each query-path stage (queue_wait, query_embedding, shard_search, vector_search, lexical_search, "
+    "context_packing, query_rewrite, retrieval, prompt_assembly, llm_wait, llm_rate_limit, llm_ttft, llm_total, ws_send, request_total).",
+    labelnames=("stage",),
+))
+CHAT_MESSAGES_TOTAL = registry.register(Counter(
+    "chat_messages_total", "Chat messages by outcome (llm, cache, error, cancelled, rejected).", labelnames=("outcome",),
+))
+ACTIVE_CONNECTIONS = registry.register(Gauge(
+    "ws_active_connections", "Open /ws WebSocket connections.",
+))
+RAG_EXECUTIONS = registry.register(Gauge(
+    "rag_executions", "RAG pipeline runs by state (running, waiting for a RAG_MAX_CONCURRENCY slot).",
+    labelnames=("state",),
+))
+CHAT_QUEUED_MESSAGES = registry.register(Gauge(
+    "chat_queued_messages", "Questions queued on open connections behind the one being answered.",
+))
+LLM_CALLS_TOTAL = registry.register(Counter(
+    "llm_calls_total",
+    "LLM gateway calls by outcome (ok, retried, failed, rejected, circuit_open, hedged, hedge_won).",
+    labelnames=("outcome",),
+))
+LLM_GATEWAY = registry.register(Gauge(
+    "llm_gateway", "LLM calls by state (running, waiting for an LLM_MAX_CONCURRENCY slot) and circuit_open (0/1).",
+    labelnames=("state",),
+))
+
+CONTEXT_TOKENS = registry.register(Histogram(
+    "context_tokens", "Estimated context tokens per request, retrieved (raw chunks) vs packed into the prompt.",
+    labelnames=("kind",),
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000),
+))
+CONTEXT_TOKENS_SAVED = registry.register(Histogram(
+    "context_tokens_saved", "Estimated prompt tokens removed per request by merging, dedup and budget packing.",
+    buckets=(0, 50, 100, 250, 500, 1000, 2000, 4000),
+))
+CONVERSATION_HISTORY_TOKENS = registry.register(Histogram(
+    "conversation_history_tokens", "Estimated tokens of conversation history (summary + recent turns) per prompt.",
+    buckets=(0, 50, 100, 200, 400, 600, 800, 1200, 1600),
+))
+CONVERSATION_EVENTS = registry.register(Counter(
+    "conversation_events_total",
+    "Follow-up rewrites (rewrite_heuristic, rewrite_llm, rewrite_failed) and turns folded into the summary "
+    "(summary_llm, summary_extractive, summary_failed).",
+    labelnames=("event",),
+))
+QUERY_EMBED_BATCH_SIZE = registry.register(Histogram(
+    "query_embed_batch_size", "Queries per micro-batched embedding forward pass.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+))
+QUERY_EMBED_BATCH_FILL = registry.register(Histogram(
+    "query_embed_batch_fill_ratio", "Batch size / QUERY_EMBED_MAX_BATCH of each query embedding batch.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0),
+))
+
+# --- Ingestion ---
+INGEST_STAGE_SECONDS = registry.register(Histogram(
+    "ingest_stage_seconds",
+    "Latency of each ingestion phase (load, split, embed, add).",
+    labelnames=("stage",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+))
+INGEST_CHUNKS_TOTAL = registry.register(Counter(
+    "ingest_chunks_total", "Chunks seen by ingestion, by result (added, skipped, failed, deleted).", labelnames=("result",),
+))
+INGEST_JOBS = registry.register(Gauge(
+    "ingest_jobs", "Ingestion jobs by status (queued, running, succeeded, failed).", labelnames=("status",),
+))
+STORE_RELOADS_TOTAL = registry.register(Counter(
+    "store_reloads_total", "Collections this reader worker reloaded after the writer worker changed them.",
+))
+
+# --- Caches ---
+CACHE_EVENTS = registry.register(CallbackCounter(
+    "cache_events_total", "Cache hits/misses since start, by cache (answer, chunk_embedding, query_embedding) and event.",
+    labelnames=("cache", "event"),
+))
+
+
+# --- Tracing (optional) ---
+_tracer = None
+if settings.ENABLE_TRACING:
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("course-content-rag")
+        print("OpenTelemetry tracing enabled.")
+    except ImportError:
+        print("!!! ENABLE_TRACING is set but opentelemetry is not installed; tracing disabled.")
+
+
+@contextmanager
+def observe_stage(histogram: Histogram, stage: str):
+    """Times a block into `histogram{stage=...}` and, if tracing is on, wraps it in a span."""
+    start = time.perf_counter()
+    if _tracer is not None:
+        with _tracer.start_as_current_span(f"{histogram.name}.{stage}"):
+            try:
+                yield
+            finally:
+                histogram.observe(time.perf_counter() - start, stage=stage)
+    else:
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start, stage=stage)
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.metrics import CACHE_EVENTS, QUERY_EMBED_BATCH_FILL, QUERY_EMBED_BATCH_SIZE
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces concurrent query embeddings into small batches.
+    The first query of a batch waits at most `window_ms` for others (or until
+    `max_batch` are queued). The batch then runs as one forward pass on a dedicated
+    executor and each caller's future gets its own vector. While all `workers` are
+    busy, new queries keep queueing, so batches fill up under load.
+    Recent results are memoized, so the answer-cache lookup and the retriever
+    embed each question only once.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        max_batch: int = 32,
+        window_ms: float = 5.0,
+        workers: int = 1,
+        memo_size: int = 256,
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch = max(1, max_batch)
+        self.window = max(0.0, window_ms) / 1000
+        self.workers = max(1, workers)
+        self.memo_size = memo_size
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self._memo: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="query-embed")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set() # In-flight batches (the loop only keeps weak references)
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # (Re)bind to the running loop; a new loop (e.g. a test client) gets a fresh queue
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.workers)
+            self._task = loop.create_task(self._run(), name="query-embedding-batcher")
+
+    async def embed(self, text: str) -> List[float]:
+        vector = self._memo.get(text)
+        if vector is not None:
+            self._memo.move_to_end(text)
+            self.memo_hits += 1
+            return vector
+        self.memo_misses += 1
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire() # Wait for a free worker; queries pile up meanwhile
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = self._loop.create_task(self._embed(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _embed(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            texts = list(dict.fromkeys(text for text, _ in batch)) # Identical questions share a row
+            QUERY_EMBED_BATCH_SIZE.observe(len(texts))
+            QUERY_EMBED_BATCH_FILL.observe(len(texts) / self.max_batch)
+            try:
+                vectors = await self._loop.run_in_executor(self._executor, self.embed_batch, texts)
+            except Exception as e:
+                print(f"!!! Query embedding batch of {len(texts)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            by_text = dict(zip(texts, vectors))
+            for text, vector in by_text.items():
+                self._memo[text] = vector
+                self._memo.move_to_end(text)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+            for text, future in batch:
+                if not future.done(): # The caller may have gone away (cancelled)
+                    future.set_result(by_text[text])
+        finally:
+            self._slots.release()
+
+
+# --- Shared instance ---
+_query_embedder: Optional[QueryEmbeddingBatcher] = None
+_query_embedder_lock = threading.Lock()
+
+def _embed_query_batch(texts: List[str]) -> List[List[float]]:
+    from app.core.vector_store import get_embedding_function # Model loads on the executor, not the event loop
+    return get_embedding_function().embed_queries(texts)
+
+def get_query_embedder() -> QueryEmbeddingBatcher:
+    global _query_embedder
+    if _query_embedder is None:
+        with _query_embedder_lock:
+            if _query_embedder is None:
+                _query_embedder = QueryEmbeddingBatcher(
+                    _embed_query_batch,
+                    max_batch=settings.QUERY_EMBED_MAX_BATCH,
+                    window_ms=settings.QUERY_EMBED_WINDOW_MS,
+                    workers=settings.QUERY_EMBED_WORKERS,
+                )
+    return _query_embedder
+
+
+async def aembed_query(text: str) -> List[float]:
+    """Embeds a chat query: micro-batched with other concurrent queries when enabled."""
+    if settings.QUERY_EMBED_BATCHING_ENABLED:
+        return await get_query_embedder().embed(text)
+    from app.core.vector_store import get_embedding_function
+    return await asyncio.to_thread(get_embedding_function().embed_query, text)
+
+
+def _query_embedding_cache_events():
+    if _query_embedder is None:
+        return []
+    return [
+        ({"cache": "query_embedding", "event": "hit"}, _query_embedder.memo_hits),
+        ({"cache": "query_embedding", "event": "miss"}, _query_embedder.memo_misses),
+    ]
+
+CACHE_EVENTS.add_callback(_query_embedding_cache_events)
@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.core.hybrid_retriever import reciprocal_rank_fusion
+from app.core.lexical_index import LexicalIndex
+from app.core.metrics import RAG_STAGE_SECONDS, observe_stage
+from app.core.query_embedder import aembed_query
+from app.core.vector_store import get_embedding_function, similarity_search_with_ids
+
+# Shard searches are blocking vector store calls: they fan out on their own threads
+_shard_executor = ThreadPoolExecutor(max_workers=max(1, settings.SHARD_SEARCH_WORKERS), thread_name_prefix="shard-search")
+
+ShardKey = Tuple[str, str] # (collection, chunk ID): the same chunk may be stored in two courses
+ShardResult = Tuple[str, List[Tuple[str, Document, float]], List[Tuple[str, float]]]
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    Searches the selected collections (one per course) concurrently and merges
+    the results. Each shard returns its `fetch_k` nearest chunks, plus its BM25
+    hits if it has a lexical index. Dense hits are merged across shards by
+    distance (same embedding model, so comparable), BM25 hits by score, and the
+    two global rankings are fused with RRF as in HybridRetriever. Only the
+    chosen shards are searched, so latency follows the size of those courses.
+    """
+    shards: Dict[str, Any] # collection name -> vector store (Chroma or FlatVectorStore)
+    lexical_indexes: Dict[str, LexicalIndex] = {} # Empty: dense search only
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def _search_shard(self, name: str, query: str, query_embedding: List[float]) -> ShardResult:
+        with observe_stage(RAG_STAGE_SECONDS, "vector_search"):
+            dense = similarity_search_with_ids(self.shards[name], query_embedding, self.fetch_k)
+        lexical: List[Tuple[str, float]] = []
+        index = self.lexical_indexes.get(name)
+        if index is not None:
+            with observe_stage(RAG_STAGE_SECONDS, "lexical_search"):
+                lexical = index.search(query, self.fetch_k)
+        return name, dense, lexical
+
+    def _merge(self, results: List[ShardResult]) -> List[Document]:
+        dense = sorted(
+            ((distance, (name, chunk_id), doc) for name, hits, _ in results for chunk_id, doc, distance in hits),
+            key=lambda hit: hit[0],
+        )[: self.fetch_k]
+        lexical = sorted(
+            ((score, (name, chunk_id)) for name, _, hits in results for chunk_id, score in hits),
+            key=lambda hit: -hit[0],
+        )[: self.fetch_k]
+        fused = reciprocal_rank_fusion(([key for _, key, _ in dense], [key for _, key in lexical]), self.rrf_k)
+        top_keys = sorted(fused, key=fused.get, reverse=True)[: self.k]
+
+        documents: Dict[ShardKey, Document] = {key: doc for _, key, doc in dense}
+        missing: Dict[str, List[str]] = {}
+        for name, chunk_id in top_keys:
+            if (name, chunk_id) not in documents:
+                missing.setdefault(name, []).append(chunk_id)
+        for name, ids in missing.items():
+            found = self.shards[name].get(ids=ids, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                documents[(name, chunk_id)] = Document(id=chunk_id, page_content=text, metadata=metadata or {})
+
+        merged = []
+        for key in top_keys:
+            doc = documents.get(key)
+            if doc is not None: # IDs can be missing if the index is briefly ahead of a delete
+                merged.append(Document(id=key[1], page_content=doc.page_content, metadata={**doc.metadata, "collection": key[0]}))
+        return merged
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with observe_stage(RAG_STAGE_SECONDS, "query_embedding"):
+            query_embedding = get_embedding_function().embed_query(query)
+        with observe_stage(RAG_STAGE_SECONDS, "shard_search"):
+            results = list(_shard_executor.map(lambda name: self._search_shard(name, query, query_embedding), self.shards))
+        return self._merge(results)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with observe_stage(RAG_STAGE_SECONDS, "query_embedding"):
+            query_embedding = await aembed_query(query)
+        loop = asyncio.get_running_loop()
+        with observe_stage(RAG_STAGE_SECONDS, "shard_search"):
+            results = await asyncio.gather(*(
+                loop.run_in_executor(_shard_executor, self._search_shard, name, query, query_embedding)
+                for name in self.shards
+            ))
+        return self._merge(list(results))
@@ -0,0 +1,73 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# Startup/readiness bookkeeping. Heavy resources (embedding model, Chroma
+# client, LLM, QA chain) are created lazily; each records how long it took here.
+
+_lock = threading.Lock()
+_timings: Dict[str, float] = {}
+_state: Dict[str, Any] = {"status": "starting", "error": None, "started_at": time.time()}
+
+
+def record_phase(name: str, seconds: float):
+    with _lock:
+        _timings[name] = round(seconds * 1000, 1)
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Times a startup/initialization phase and records it in milliseconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def set_status(status: str, error: Optional[str] = None):
+    with _lock:
+        _state["status"] = status
+        _state["error"] = error
+
+
+def is_ready() -> bool:
+    return _state["status"] == "ready"
+
+
+def report() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "status": _state["status"],
+            "error": _state["error"],
+            "uptime_seconds": round(time.time() - _state["started_at"], 1),
+            "phases_ms": dict(_timings),
+        }
+
+
+def warm_up():
+    """
+    Builds every lazy resource and runs a dummy embedding so the first real
+    query does not pay model load / first-inference costs. Blocking; run it in a thread.
+    """
+    # Imported here: these modules are cheap to import, the resources are not
+    from app.core import store_sync
+    from app.core.vector_store import get_embedding_function, get_vector_store, list_collection_names, resolve_collection_name
+    from app.services.chatbot_service import get_default_qa_chain
+
+    set_status("warming")
+    try:
+        with timed_phase("warmup_total"):
+            embeddings = get_embedding_function()
+            with timed_phase("warmup_dummy_embed"):
+                embeddings.embed_query("warm up")
+            # A reader worker cannot create the default collection; the writer will
+            if store_sync.is_writer() or resolve_collection_name(None) in list_collection_names():
+                get_vector_store()
+                get_default_qa_chain()
+        set_status("ready")
+        print(f"Warm-up complete. Startup phases (ms): {report()['phases_ms']}")
+    except Exception as e:
+        set_status("failed", f"{type(e).__name__}: {e}")
+        print(f"!!! Warm-up failed: {e}")
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import STORE_RELOADS_TOTAL
+
+# Multi-worker coordination (uvicorn --workers N). The first process to take an
+# exclusive lock on STORE_WRITER_LOCK_PATH is the writer: it runs the ingestion
+# job queue and is the only process that modifies the vector store, the BM25
+# indexes and the collection stats. Every other process is a reader: it opens
+# the store read-only, hands uploads and deletes to the writer through the
+# shared jobs DB, and reloads a collection when the writer bumps its counter in
+# STORE_VERSION_PATH. A process that never elects (CLI, benchmarks) is a writer.
+
+WRITER = "writer"
+READER = "reader"
+
+_lock = threading.Lock()
+_role: Optional[str] = None
+_lock_file = None # Kept open: the OS releases the lock when the process exits
+_versions: Dict[str, int] = {} # Collection -> change counter (writer: written; reader: loaded)
+_versions_stamp: Optional[Tuple[int, int]] = None # (inode, mtime) of the version file last read
+_listeners: List[Callable[[List[str]], None]] = []
+_deferred = threading.local() # Per ingesting thread: open deferred_bumps() blocks and the names they collected
+
+
+def acquire_writer() -> bool:
+    """Tries (without blocking) to become the writer. Decided once per process."""
+    global _role, _lock_file
+    with _lock:
+        if _role is not None:
+            return _role == WRITER
+        try:
+            import fcntl
+        except ImportError: # No flock (Windows): single-worker only
+            _role = WRITER
+            return True
+        path = settings.STORE_WRITER_LOCK_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        lock_file = open(path, "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            _role = READER
+        else:
+            lock_file.truncate(0)
+            lock_file.write(f"{os.getpid()}\n")
+            lock_file.flush()
+            _lock_file = lock_file
+            _role = WRITER
+        _load_versions() # Baseline: what is on disk now is already loaded
+    print(f"Worker {os.getpid()} is the store {_role}.")
+    return _role == WRITER
+
+
+def role() -> str:
+    return _role or WRITER
+
+def is_writer() -> bool:
+    return _role != READER
+
+
+# --- Versions ---
+def _stamp() -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(settings.STORE_VERSION_PATH)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns # Every bump is an atomic replace: a new inode
+
+def _load_versions():
+    global _versions, _versions_stamp
+    _versions_stamp = _stamp()
+    try:
+        with open(settings.STORE_VERSION_PATH, "r", encoding="utf-8") as f:
+            _versions = json.load(f)["collections"]
+    except (OSError, ValueError, KeyError):
+        _versions = {}
+
+
+def bump(*collections: str):
+    """Writer: records that `collections` changed, so reader workers reload them."""
+    global _versions_stamp
+    if not collections:
+        return
+    if getattr(_deferred, "depth", 0):
+        _deferred.names.update(collections) # Published when the outermost deferred_bumps() block ends
+        return
+    with _lock:
+        _load_versions() # Another writer process (e.g. the bulk CLI) may have bumped since
+        for name in collections:
+            _versions[name] = _versions.get(name, 0) + 1
+        path = settings.STORE_VERSION_PATH
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"collections": _versions}, f, separators=(",", ":"))
+        os.replace(tmp_path, path) # Atomic swap
+        _versions_stamp = _stamp()
+
+
+@contextmanager
+def deferred_bumps():
+    """
+    Collects the bump() calls made inside (on this thread) and publishes them as
+    one bump when the outermost block ends, so readers reload once per document
+    or job instead of once per stored batch. Publishes on errors too: whatever
+    was written before the failure is in the store.
+    """
+    depth = getattr(_deferred, "depth", 0)
+    if not depth:
+        _deferred.names = set()
+    _deferred.depth = depth + 1
+    try:
+        yield
+    finally:
+        _deferred.depth = depth
+        if not depth:
+            names, _deferred.names = _deferred.names, set()
+            bump(*sorted(names))
+
+
+def version(collection: str) -> int:
+    """The collection's change counter as last written or loaded by this process."""
+    return _versions.get(collection, 0)
+
+
+def on_change(listener: Callable[[List[str]], None]):
+    """Registers `listener(collections)`, called in reader workers when collections changed."""
+    _listeners.append(listener)
+
+
+def check_for_updates() -> List[str]:
+    """
+    Reader: one stat() of the version file; if the writer bumped it, calls the
+    listeners with the collections whose counter changed. Returns those names.
+    """
+    with _lock:
+        if _stamp() == _versions_stamp:
+            return []
+        previous = _versions
+        _load_versions()
+        changed = sorted(name for name, version in _versions.items() if previous.get(name) != version)
+    if not changed:
+        return []
+    print(f"Store changed by the writer; reloading: {', '.join(changed)}")
+    for listener in _listeners:
+        try:
+            listener(changed)
+        except Exception as e:
+            print(f"!!! Store reload listener {getattr(listener, '__name__', listener)} failed: {e}")
+    STORE_RELOADS_TOTAL.inc(len(changed))
+    return changed
+
+
+async def watch_for_updates():
+    """Reader background task: checks the version file every STORE_RELOAD_CHECK_SECONDS."""
+    while True:
+        await asyncio.sleep(settings.STORE_RELOAD_CHECK_SECONDS)
+        try:
+            await asyncio.to_thread(check_for_updates)
+        except Exception as e:
+            print(f"!!! Store version check failed: {e}")
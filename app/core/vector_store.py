@@ -1,70 +1,257 @@
 import os
-import chromadb
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 
-# --- Use the chosen embedding class ---
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
+from langchain_core.vectorstores import VectorStore
+from langchain.schema import Document
 
+from app.core import store_sync
 from app.core.config import settings
+from app.core.embedding_cache import CachedEmbeddings
+from app.core.flat_index import FlatVectorStore
+from app.core.metrics import CACHE_EVENTS
+from app.core.startup import timed_phase
 
-# --- Initialize Embedding Model ---
-try:
-    print(f"Initializing HuggingFaceEmbeddings with model: {settings.EMBEDDING_MODEL_NAME}")
-    embedding_function = HuggingFaceEmbeddings(
-        model_name=settings.EMBEDDING_MODEL_NAME,
-        cache_folder="./embedding_cache"
-    )
-    print("HuggingFaceEmbeddings initialized.")
-except Exception as e:
-     print(f"!!! Error initializing HuggingFaceEmbeddings: {e}")
-     raise RuntimeError(f"Failed to initialize embeddings: {e}") from e
+# Nothing heavy happens at import time: the embedding model, the Chroma client
+# and the LangChain wrapper are created on first use (or by the startup warm-up).
+_init_lock = threading.RLock()
+embedding_function = None
+chroma_client = None
+chroma_collection = None
+vector_stores: Dict[str, VectorStore] = {} # One store per collection (course shard): Chroma or FlatVectorStore
 
-os.makedirs(settings.VECTOR_STORE_PATH, exist_ok=True) # Ensure path exists
+# Chroma's rule: 3-63 chars of [a-zA-Z0-9._-], starting and ending with a letter or digit
+_COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{1,61}[A-Za-z0-9]$")
 
-try:
-    print(f"Attempting to initialize ChromaDB PersistentClient at: {settings.VECTOR_STORE_PATH}")
 
-    chroma_client = chromadb.PersistentClient(
-        path=settings.VECTOR_STORE_PATH
-        # Optional: Pass settings ONLY if needed, e.g., for telemetry
-        # settings=chromadb.Settings(anonymized_telemetry=False)
-    )
-    print("ChromaDB PersistentClient initialized successfully.")
+def _init_embedding_function():
+    # --- Use the chosen embedding class ---
+    from langchain_huggingface import HuggingFaceEmbeddings
 
-    # Get or create the collection using the client
-    chroma_collection = chroma_client.get_or_create_collection(
-         name=settings.CHROMA_COLLECTION_NAME
-    )
-    print(f"ChromaDB collection '{settings.CHROMA_COLLECTION_NAME}' loaded/created.")
-    print(f"Collection document count: {chroma_collection.count()}")
-
-except Exception as e:
-    # This specific error shouldn't happen now, but keep general error handling
-    print(f"!!! Error initializing ChromaDB PersistentClient or collection: {e}")
-    print("!!! Please check ChromaDB documentation and ensure the path is accessible and valid.")
-    raise RuntimeError(f"Failed to initialize ChromaDB: {e}") from e
-
-try:
-    vector_store = Chroma(
-        client=chroma_client, # Pass the configured PersistentClient
-        collection_name=settings.CHROMA_COLLECTION_NAME,
-        embedding_function=embedding_function,
-    )
-    print("LangChain Chroma vector store wrapper initialized.")
-except Exception as e:
-    print(f"!!! Error initializing LangChain Chroma wrapper: {e}")
-    raise RuntimeError(f"Failed to initialize LangChain Chroma wrapper: {e}") from e
+    try:
+        print(f"Initializing HuggingFaceEmbeddings with model: {settings.EMBEDDING_MODEL_NAME}")
+        with timed_phase("embedding_model"):
+            base_embedding_function = HuggingFaceEmbeddings(
+                model_name=settings.EMBEDDING_MODEL_NAME,
+                cache_folder="./embedding_cache"
+            )
+        print("HuggingFaceEmbeddings initialized.")
+        # Chunk embeddings are cached on disk by content hash, so re-ingestion only embeds new text
+        cached = CachedEmbeddings(
+            base_embedding_function,
+            model_name=settings.EMBEDDING_MODEL_NAME,
+            db_path=settings.EMBEDDING_CACHE_DB_PATH,
+        )
+        print(f"Chunk embedding cache at: {settings.EMBEDDING_CACHE_DB_PATH}")
+        return cached
+    except Exception as e:
+         print(f"!!! Error initializing HuggingFaceEmbeddings: {e}")
+         raise RuntimeError(f"Failed to initialize embeddings: {e}") from e
+
+
+def _init_chroma():
+    import chromadb
+
+    os.makedirs(settings.VECTOR_STORE_PATH, exist_ok=True) # Ensure path exists
+    try:
+        print(f"Attempting to initialize ChromaDB PersistentClient at: {settings.VECTOR_STORE_PATH}")
+        with timed_phase("chroma_client"):
+            client = chromadb.PersistentClient(
+                path=settings.VECTOR_STORE_PATH
+                # Optional: Pass settings ONLY if needed, e.g., for telemetry
+                # settings=chromadb.Settings(anonymized_telemetry=False)
+            )
+        print("ChromaDB PersistentClient initialized successfully.")
+        # Get or create the collection using the client
+        with timed_phase("chroma_collection"):
+            collection = client.get_or_create_collection(
+                 name=settings.CHROMA_COLLECTION_NAME
+            )
+        print(f"ChromaDB collection '{settings.CHROMA_COLLECTION_NAME}' loaded/created.")
+        print(f"Collection document count: {collection.count()}")
+        return client, collection
+    except Exception as e:
+        print(f"!!! Error initializing ChromaDB PersistentClient or collection: {e}")
+        print("!!! Please check ChromaDB documentation and ensure the path is accessible and valid.")
+        raise RuntimeError(f"Failed to initialize ChromaDB: {e}") from e
 
-# --- Dependency Functions ---
-def get_vector_store() -> Chroma:
-    if 'vector_store' not in globals() or vector_store is None:
-        raise RuntimeError("Vector store not initialized or initialization failed.")
-    return vector_store
 
+# --- Dependency Functions ---
 def get_embedding_function():
-    if 'embedding_function' not in globals() or embedding_function is None:
-        raise RuntimeError("Embedding function not initialized or initialization failed.")
+    global embedding_function
+    if embedding_function is None:
+        with _init_lock:
+            if embedding_function is None:
+                embedding_function = _init_embedding_function()
     return embedding_function
 
-# --- Log final embedding model used ---
-print(f"Vector Store configured with embedding model: {settings.EMBEDDING_MODEL_NAME}")
+def check_reader_backend():
+    """Raises if this process is a reader and the store can't be opened read-only."""
+    if settings.VECTOR_BACKEND != "flat" and not store_sync.is_writer():
+        raise RuntimeError(
+            "Another process is the store writer, and a Chroma store can't be shared between processes. "
+            "Set VECTOR_BACKEND=flat to run several workers, or run a single worker."
+        )
+
+def get_chroma_client():
+    """The process-wide Chroma PersistentClient (shared by the vector store and the data routes)."""
+    global chroma_client, chroma_collection
+    if chroma_client is None:
+        # A Chroma client persists whatever it loads (HNSW segments, replayed log), so
+        # only one process may open the store: readers must use the flat backend
+        check_reader_backend()
+        with _init_lock:
+            if chroma_client is None:
+                chroma_client, chroma_collection = _init_chroma()
+    return chroma_client
+
+def resolve_collection_name(name: Optional[str] = None) -> str:
+    """
+    Collection holding a course's chunks: the course name itself, or
+    CHROMA_COLLECTION_NAME when none is given. Raises ValueError for names Chroma rejects.
+    """
+    name = (name or "").strip() or settings.CHROMA_COLLECTION_NAME
+    if not _COLLECTION_NAME_PATTERN.match(name) or ".." in name:
+        raise ValueError(
+            f"Invalid course/collection name '{name}': use 3-63 letters, digits, '.', '_' or '-'."
+        )
+    return name
+
+def collection_name_of(vector_db: VectorStore) -> str:
+    if isinstance(vector_db, FlatVectorStore):
+        return vector_db.name
+    return vector_db._collection.name
+
+def _init_flat_store(name: str) -> FlatVectorStore:
+    path = os.path.join(settings.FLAT_INDEX_DIR, name)
+    with timed_phase("flat_index"):
+        store = FlatVectorStore(
+            path=path,
+            name=name,
+            embedding_function=get_embedding_function(),
+            dtype=settings.FLAT_INDEX_DTYPE,
+            rescore_factor=settings.FLAT_INDEX_RESCORE_FACTOR,
+            read_only=not store_sync.is_writer(),
+        )
+    mode = ", read-only" if store.read_only else ""
+    print(f"Flat vector index '{name}' opened at {path} ({store.dtype}, {store.count()} chunks{mode}).")
+    return store
+
+def get_vector_store(collection_name: Optional[str] = None) -> VectorStore:
+    """The vector store for one collection (created if it does not exist yet), per VECTOR_BACKEND."""
+    name = resolve_collection_name(collection_name)
+    store = vector_stores.get(name)
+    if store is None:
+        with _init_lock:
+            store = vector_stores.get(name)
+            if store is None and settings.VECTOR_BACKEND == "flat":
+                store = vector_stores[name] = _init_flat_store(name)
+            elif store is None:
+                client = get_chroma_client()
+                embeddings = get_embedding_function()
+                try:
+                    with timed_phase("vector_store_wrapper"):
+                        store = Chroma(
+                            client=client, # Pass the configured PersistentClient
+                            collection_name=name,
+                            embedding_function=embeddings,
+                        )
+                    vector_stores[name] = store
+                    print(f"LangChain Chroma vector store wrapper initialized for collection '{name}'.")
+                    print(f"Vector Store configured with embedding model: {settings.EMBEDDING_MODEL_NAME}")
+                except Exception as e:
+                    print(f"!!! Error initializing LangChain Chroma wrapper: {e}")
+                    raise RuntimeError(f"Failed to initialize LangChain Chroma wrapper: {e}") from e
+    return store
+
+def list_collection_names() -> List[str]:
+    """Every collection (course shard) in the persistent store."""
+    if settings.VECTOR_BACKEND == "flat":
+        if not os.path.isdir(settings.FLAT_INDEX_DIR):
+            return []
+        return sorted(
+            name for name in os.listdir(settings.FLAT_INDEX_DIR)
+            if os.path.exists(os.path.join(settings.FLAT_INDEX_DIR, name, "meta.sqlite3"))
+        )
+    collections = get_chroma_client().list_collections()
+    # chromadb >= 0.6 returns names; older versions return Collection objects
+    return sorted(c if isinstance(c, str) else c.name for c in collections)
+
+
+def add_with_embeddings(
+    vector_db: VectorStore,
+    ids: List[str],
+    texts: List[str],
+    embeddings: List[List[float]],
+    metadatas: List[Dict[str, Any]],
+):
+    """Stores chunks whose embeddings were already computed (add_documents would embed them again)."""
+    if isinstance(vector_db, FlatVectorStore):
+        vector_db.upsert(ids, embeddings, texts, metadatas)
+    else:
+        vector_db._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+
+
+def count_chunks(vector_db: VectorStore) -> int:
+    if isinstance(vector_db, FlatVectorStore):
+        return vector_db.count()
+    return vector_db._collection.count()
+
+
+def delete_by_ids(vector_db: VectorStore, ids: List[str]):
+    if isinstance(vector_db, FlatVectorStore):
+        vector_db.delete(ids)
+    else:
+        vector_db._collection.delete(ids=ids)
+
+
+def update_metadatas(vector_db: VectorStore, ids: List[str], metadatas: List[Dict[str, Any]]):
+    """Replaces the metadata of stored chunks, keeping their text and embeddings."""
+    if isinstance(vector_db, FlatVectorStore):
+        vector_db.update_metadatas(ids, metadatas)
+    else:
+        vector_db._collection.update(ids=ids, metadatas=metadatas)
+
+
+def similarity_search_with_ids(
+    vector_db: VectorStore, query_embedding: List[float], k: int
+) -> List[Tuple[str, Document, float]]:
+    """Like similarity_search_by_vector_with_relevance_scores, but keeps each chunk's ID (distance, lower is closer)."""
+    if isinstance(vector_db, FlatVectorStore):
+        return vector_db.query_with_ids(query_embedding, k)
+    results = vector_db._collection.query(
+        query_embeddings=[query_embedding],
+        n_results=k,
+        include=["documents", "metadatas", "distances"],
+    )
+    return [
+        (chunk_id, Document(id=chunk_id, page_content=text, metadata=metadata or {}), distance)
+        for chunk_id, text, metadata, distance in zip(
+            results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+        )
+    ]
+
+
+def _reopen_collections(collections: List[str]):
+    """
+    Reader worker: drops the changed collections' flat stores so the next query
+    reopens them from disk. In-flight queries finish on the objects they already hold.
+    """
+    with _init_lock:
+        for name in collections:
+            vector_stores.pop(name, None)
+
+store_sync.on_change(_reopen_collections)
+
+
+def _chunk_embedding_cache_events():
+    if embedding_function is None: # Not loaded yet; nothing to report
+        return []
+    return [
+        ({"cache": "chunk_embedding", "event": "hit"}, embedding_function.hits),
+        ({"cache": "chunk_embedding", "event": "miss"}, embedding_function.misses),
+    ]
+
+CACHE_EVENTS.add_callback(_chunk_embedding_cache_events)
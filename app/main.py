@@ -1,15 +1,48 @@
+import time
+_import_started = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
 import os
 
 # Import your routers
-from app.routes import chat, data # <--- Import data router
+from app.routes import chat, data, health, metrics # <--- Import data router
 from app.core.config import settings
-# from app.core import vector_store # Optional: Trigger initialization if needed
+from app.core import startup, store_sync, vector_store
+from app.services.job_queue import get_job_queue
+# Heavy resources (embedding model, Chroma, LLM) are created lazily, not at import time
+
+# --- Startup / Shutdown ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("Application startup...")
+    watcher = None
+    # With uvicorn --workers N, one worker owns ingestion and writes; the rest read
+    if store_sync.acquire_writer():
+        with startup.timed_phase("job_queue"):
+            await get_job_queue().start() # Resumes jobs interrupted by the last shutdown
+    else:
+        vector_store.check_reader_backend() # Chroma can't be shared: fail now, not on the first query
+        watcher = asyncio.create_task(store_sync.watch_for_updates())
+    warmup_task = None
+    if settings.WARMUP_ON_STARTUP:
+        # Runs in a thread so the server accepts connections (and /health/live) immediately
+        warmup_task = asyncio.create_task(asyncio.to_thread(startup.warm_up))
+    else:
+        startup.set_status("ready") # Resources load on first request instead
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        await warmup_task
+    if watcher is not None:
+        watcher.cancel()
+    else:
+        await get_job_queue().stop()
 
 # Create FastAPI app instance
-app = FastAPI(title=settings.APP_TITLE)
+app = FastAPI(title=settings.APP_TITLE, lifespan=lifespan)
 
 # --- Mount Static Files ---
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,9 +57,22 @@ if os.path.exists(static_dir):
 else:
     print(f"Warning: Static directory not found at {static_dir}.")
 
+# --- Upload size guard (before multipart bodies are parsed) ---
+app.middleware("http")(data.reject_oversized_uploads)
+
 # --- Include Routers ---
 app.include_router(chat.router, prefix="", tags=["Chat"])
 app.include_router(data.router, prefix="", tags=["Data Management"]) # <--- Include data router
+app.include_router(health.router)
+app.include_router(metrics.router)
+
+# --- Optional: OpenTelemetry request spans ---
+if settings.ENABLE_TRACING:
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics,health")
+    except ImportError:
+        print("!!! ENABLE_TRACING is set but opentelemetry-instrumentation-fastapi is not installed.")
 
 # --- Optional: Root Redirect ---
 # @app.get("/", include_in_schema=False)
@@ -35,12 +81,7 @@ app.include_router(data.router, prefix="", tags=["Data Management"]) # <--- Incl
 #     # Adjust if your chat interface is under a different path prefix
 #     return RedirectResponse(url="/") # Or url=chat.router.url_path_for("get_chat_page") ?
 
-# --- Optional: Add startup event if needed for complex initializations ---
-# @app.on_event("startup")
-# async def startup_event():
-#     print("Application startup...")
-#     # Initialize things like DB connections, ML models if not done at import time
-#     # vector_store.initialize_store() # Example
+startup.record_phase("import_app", time.perf_counter() - _import_started)
 
 # --- Run with Uvicorn (for development) ---
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+
+class JobInfo(BaseModel):
+    """Status and progress of one ingestion job."""
+    id: str
+    kind: str
+    source: str
+    collection: Optional[str] = None # Course collection (None: CHROMA_COLLECTION_NAME)
+    replace_existing: bool = False # New version of a stored source: only changed chunks are re-embedded
+    status: str # queued | running | succeeded | failed
+    attempts: int
+    max_attempts: int
+    chunks_done: int
+    chunks_total: int
+    batches_done: int
+    batches_total: int
+    progress: Optional[float] = None # chunks_done / chunks_total; None while running with the total unknown
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    updated_at: float
@@ -5,11 +5,21 @@ from fastapi import (
     WebSocketDisconnect,
     Depends,
 )
+import asyncio
+import json
+import logging
+import time
+
 from fastapi.templating import Jinja2Templates
-from app.services.chatbot_service import get_bot_response
-from typing import List
+from app.services.chatbot_service import get_bot_response, llm_gateway, stream_bot_response
+from app.services.answer_cache import get_answer_cache
+from app.services.conversation import ConversationMemory
+from typing import Any, Dict, List, Optional, Tuple
 # In app/routes/chat.py
 from app.core.config import settings # Make sure settings is imported
+from app.core.metrics import ACTIVE_CONNECTIONS, CHAT_MESSAGES_TOTAL, CHAT_QUEUED_MESSAGES, RAG_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
 
 
 # ... (websocket endpoint) ...
@@ -19,24 +29,145 @@ templates = Jinja2Templates(directory="templates")
 
 router = APIRouter()
 
+class ChatSession:
+    """
+    Per-connection answer pipeline: questions queue here and one worker answers
+    them in order, each as its own task so it can be cancelled mid-generation.
+    `courses` is the connection's course selection (None: the default collection).
+    `memory` is its bounded conversation history (None with CONVERSATION_MEMORY_ENABLED off).
+    """
+    def __init__(self, websocket: WebSocket, courses: Optional[List[str]] = None):
+        self.websocket = websocket
+        self.client_id = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else str(id(websocket))
+        self.courses = courses
+        self.queue: "asyncio.Queue[Tuple[str, Optional[List[str]]]]" = asyncio.Queue()
+        self.current: Optional[asyncio.Task] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.memory = ConversationMemory.from_settings() if settings.CONVERSATION_MEMORY_ENABLED else None
+
+    @property
+    def busy(self) -> bool:
+        return self.current is not None and not self.current.done()
+
+    def drain(self) -> int:
+        dropped = 0
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            dropped += 1
+        return dropped
+
+
 class ConnectionManager:
     """Manages active WebSocket connections."""
     def __init__(self):
         self.active_connections: List[WebSocket] = []
+        self.sessions: Dict[WebSocket, ChatSession] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, courses: Optional[List[str]] = None):
         await websocket.accept()
         self.active_connections.append(websocket)
+        session = ChatSession(websocket, courses)
+        session.worker = asyncio.create_task(self._answer_loop(session), name=f"chat-{session.client_id}")
+        self.sessions[websocket] = session
         print(f"New connection: {websocket.client}. Total: {len(self.active_connections)}")
 
     def disconnect(self, websocket: WebSocket):
+         session = self.sessions.pop(websocket, None)
+         if session is not None:
+            # Stop generating for a client that is gone (unless we are that answer, sending its last frame)
+            for task in (session.current, session.worker):
+                if task is not None and task is not asyncio.current_task():
+                    task.cancel()
+            if session.memory is not None:
+                session.memory.close()
          if websocket in self.active_connections:
             self.active_connections.remove(websocket)
             print(f"Connection closed: {websocket.client}. Total: {len(self.active_connections)}")
 
+    # --- Per-connection queueing and cancellation ---
+    def select_courses(self, websocket: WebSocket, courses: Optional[List[str]]):
+        """Sets the courses later questions on this connection are answered from."""
+        session = self.sessions.get(websocket)
+        if session is not None:
+            session.courses = courses
+
+    def submit(self, websocket: WebSocket, message: str, courses: Optional[List[str]] = None) -> bool:
+        """
+        Queues a question. With CHAT_SUPERSEDE_IN_FLIGHT the unfinished answer and
+        anything queued are cancelled first; otherwise the question is rejected
+        (False) once CHAT_MAX_QUEUED_MESSAGES are already waiting.
+        `courses` overrides the connection's course selection for this question.
+        """
+        session = self.sessions.get(websocket)
+        if session is None:
+            return False
+        if settings.CHAT_SUPERSEDE_IN_FLIGHT:
+            dropped = session.drain()
+            if dropped:
+                CHAT_MESSAGES_TOTAL.inc(dropped, outcome="cancelled")
+            self.cancel_current(websocket)
+        elif session.queue.qsize() + session.busy > settings.CHAT_MAX_QUEUED_MESSAGES:
+            CHAT_MESSAGES_TOTAL.inc(outcome="rejected")
+            return False
+        session.queue.put_nowait((message, courses if courses is not None else session.courses))
+        return True
+
+    def cancel_current(self, websocket: WebSocket) -> bool:
+        """Cancels the answer being generated (its worker reports "cancelled"). False if idle."""
+        session = self.sessions.get(websocket)
+        if session is None or not session.busy:
+            return False
+        session.current.cancel()
+        return True
+
+    async def _answer_loop(self, session: ChatSession):
+        while True:
+            message, courses = await session.queue.get()
+            session.current = asyncio.create_task(self._answer(session, message, courses))
+            # wait() does not propagate the answer's cancellation, only the worker's own
+            await asyncio.wait({session.current})
+            if session.current.cancelled():
+                CHAT_MESSAGES_TOTAL.inc(outcome="cancelled")
+                logger.debug("[%s] Answer cancelled.", session.client_id)
+                await self.send_json_event({"type": "cancelled"}, session.websocket)
+            elif session.current.exception() is not None:
+                print(f"!!! Answer task failed ({session.client_id}): {session.current.exception()}")
+                CHAT_MESSAGES_TOTAL.inc(outcome="error")
+                # The client is waiting for this answer: end it instead of leaving the UI hanging
+                failed_message = "Sorry, an error occurred while answering. Please try again."
+                if settings.STREAM_RESPONSES:
+                    await self.send_json_event({"type": "error", "message": failed_message}, session.websocket)
+                else:
+                    await self.send_personal_message(f"Bot: {failed_message}", session.websocket)
+            session.current = None
+
+    async def _answer(self, session: ChatSession, data: str, courses: Optional[List[str]]):
+        websocket = session.websocket
+        if settings.STREAM_RESPONSES:
+            stream = stream_bot_response(data, client_id=session.client_id, collections=courses, memory=session.memory)
+            try:
+                async for event in stream:
+                    if not await self.send_json_event(event, websocket):
+                        break # Client is gone; stop generating
+            finally:
+                await stream.aclose()
+            logger.debug("[%s] Stream finished.", session.client_id)
+            return
+
+        # Call the RAG service
+        bot_response_text = await get_bot_response(
+            data, client_id=session.client_id, collections=courses, memory=session.memory
+        )
+        logger.debug("[%s] Got bot response (first 50 chars): %s...", session.client_id, bot_response_text[:50])
+
+        # Send bot's response back to the client
+        await self.send_personal_message(f"Bot: {bot_response_text}", websocket)
+
     async def send_personal_message(self, message: str, websocket: WebSocket):
         try:
+            start = time.perf_counter()
             await websocket.send_text(message)
+            RAG_STAGE_SECONDS.observe(time.perf_counter() - start, stage="ws_send")
         except RuntimeError as e:
             print(f"Failed to send message, websocket likely closed: {e}")
             await self.safe_disconnect(websocket) # Call safe_disconnect here
@@ -44,6 +175,21 @@ class ConnectionManager:
             print(f"Unexpected error sending message: {e}")
             await self.safe_disconnect(websocket)
 
+    async def send_json_event(self, event: Dict[str, Any], websocket: WebSocket) -> bool:
+        """Sends one framed JSON event. Returns False if the socket is gone."""
+        try:
+            start = time.perf_counter()
+            await websocket.send_json(event)
+            RAG_STAGE_SECONDS.observe(time.perf_counter() - start, stage="ws_send")
+            return True
+        except RuntimeError as e:
+            print(f"Failed to send event, websocket likely closed: {e}")
+            await self.safe_disconnect(websocket)
+        except Exception as e:
+            print(f"Unexpected error sending event: {e}")
+            await self.safe_disconnect(websocket)
+        return False
+
     async def safe_disconnect(self, websocket: WebSocket):
         """Disconnects safely, ignoring errors if already closed."""
         self.disconnect(websocket) # Remove from list first
@@ -58,6 +204,34 @@ class ConnectionManager:
 
 # --- Create ONE instance of the manager ---
 manager = ConnectionManager()
+ACTIVE_CONNECTIONS.add_callback(lambda: [({}, len(manager.active_connections))])
+CHAT_QUEUED_MESSAGES.add_callback(lambda: [({}, sum(s.queue.qsize() for s in list(manager.sessions.values())))])
+
+
+def _parse_courses(value: Any) -> Optional[List[str]]:
+    """Course selection from a list or a comma-separated string ("*" = all courses)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    courses = [str(course).strip() for course in value if str(course).strip()]
+    return courses or None
+
+
+def _parse_client_message(data: str) -> Dict[str, Any]:
+    """
+    Frames from the browser are plain question text, or JSON control messages:
+    {"type": "cancel"}, {"type": "courses", "courses": [...]} or
+    {"type": "message", "content": "...", "courses": [...]} ("courses" optional).
+    """
+    if data.startswith("{"):
+        try:
+            frame = json.loads(data)
+        except ValueError:
+            frame = None
+        if isinstance(frame, dict) and frame.get("type") in ("cancel", "courses", "message"):
+            return frame
+    return {"type": "message", "content": data}
 
 @router.get("/", tags=["Chat Interface"])
 async def get_chat_page(request: Request):
@@ -65,26 +239,45 @@ async def get_chat_page(request: Request):
     # Pass settings to the template context
     return templates.TemplateResponse("chat.html", {"request": request, "settings": settings})
 
+@router.get("/cache/stats", tags=["Chat"])
+async def get_answer_cache_stats():
+    """Hit/miss counters of the semantic answer cache (hits are LLM calls saved)."""
+    return get_answer_cache().stats()
+
+@router.get("/llm/stats", tags=["Chat"])
+async def get_llm_gateway_stats():
+    """LLM gateway state: calls running/waiting, circuit breaker, current hedge delay."""
+    return llm_gateway.stats()
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    # Course selection: /ws?course=cs101,ma201 (or "*" for every course); default collection otherwise
+    await manager.connect(websocket, _parse_courses(websocket.query_params.get("course")))
     client_addr = f"{websocket.client.host}:{websocket.client.port}"
-    print(f"--- WebSocket Connected: {client_addr} ---") # Log connection
+    # Per-message logging is at DEBUG level: printing every frame costs throughput under load
+    logger.debug("WebSocket connected: %s", client_addr)
     try:
         while True:
-            print(f"[{client_addr}] Waiting to receive text...") # Log before receive
-            data = await websocket.receive_text() # User message
-            print(f"[{client_addr}] Received text: {data}") # Log AFTER receive
-
-            print(f"[{client_addr}] >>> Calling get_bot_response...") # Log BEFORE service call
-            # Call the RAG service
-            bot_response_text = await get_bot_response(data)
-            print(f"[{client_addr}] <<< Got bot response (first 50 chars): {bot_response_text[:50]}...") # Log AFTER service call
-
-            print(f"[{client_addr}] Sending response back to client...") # Log before send
-            # Send bot's response back to the client
-            await manager.send_personal_message(f"Bot: {bot_response_text}", websocket)
-            print(f"[{client_addr}] Response sent.") # Log after send
+            data = await websocket.receive_text() # User message or control frame
+            logger.debug("[%s] Received text: %s", client_addr, data)
+            frame = _parse_client_message(data)
+
+            if frame["type"] == "cancel":
+                if not manager.cancel_current(websocket):
+                    # Nothing in flight (answer already sent): acknowledge so the client stops waiting
+                    await manager.send_json_event({"type": "cancelled"}, websocket)
+                continue
+            if frame["type"] == "courses":
+                manager.select_courses(websocket, _parse_courses(frame.get("courses")))
+                continue
+
+            # Answers run on the connection's worker, so this loop keeps reading (and can see a cancel)
+            if not manager.submit(websocket, str(frame.get("content", "")), _parse_courses(frame.get("courses"))):
+                busy_message = "Still answering your previous questions. Please wait and try again."
+                if settings.STREAM_RESPONSES:
+                    await manager.send_json_event({"type": "error", "message": busy_message}, websocket)
+                else:
+                    await manager.send_personal_message(f"Bot: {busy_message}", websocket)
 
     except WebSocketDisconnect:
         # Log the disconnect reason if available
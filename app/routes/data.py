@@ -1,43 +1,158 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, JSONResponse
+import asyncio
 import shutil
+import tempfile
 from pathlib import Path
+from typing import List, Optional, Tuple
 import os
+import time
 
-from app.services.data_processor import process_and_store_document
+from app.services.job_queue import (
+    FAILED, KIND_BULK, KIND_DELETE, KIND_DOCUMENT, KIND_SNAPSHOT_EXPORT, KIND_SNAPSHOT_IMPORT, KIND_STATS, SUCCEEDED,
+    get_job_queue,
+)
+from app.models.job_models import JobInfo
+from app.core import store_sync
 from app.core.config import settings
+from app.core.vector_store import resolve_collection_name
+from app.services.collection_stats import get_collection_stats, rebuild_collection_stats
+from app.services.snapshot import default_snapshot_name
 
 router = APIRouter(prefix="/data", tags=["Data Management"])
 
+_MULTIPART_SLACK_BYTES = 1024 * 1024 # Form boundaries and headers around the file bytes
+_WRITER_JOB_WAIT_SECONDS = 30.0 # Reader workers wait this long for the writer before answering 202
+
+
+async def reject_oversized_uploads(request: Request, call_next):
+    """
+    HTTP middleware: rejects uploads whose Content-Length is already over the
+    limit, before the multipart body is read. Chunked uploads without a
+    Content-Length are still capped while they are written (see _save_upload).
+    """
+    if request.method == "POST" and request.url.path.startswith("/data/upload"):
+        limit = settings.MAX_BULK_UPLOAD_BYTES if request.url.path.endswith("/bulk") else settings.MAX_UPLOAD_BYTES
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit + _MULTIPART_SLACK_BYTES:
+            return JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": f"Upload exceeds the {limit} byte limit."},
+            )
+    return await call_next(request)
+
+
+def _course_collection(course: Optional[str]) -> str:
+    """Collection an upload goes into; HTTP 400 for names Chroma would reject."""
+    try:
+        return resolve_collection_name(course)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _run_on_writer(kind: str, source: str, collection: Optional[str] = None) -> Tuple[str, Optional[dict]]:
+    """
+    Reader workers: hands a store write to the writer worker as a job and waits
+    for it. Returns (job_id, finished job), or (job_id, None) if it is still queued or running.
+    """
+    queue = get_job_queue()
+    job_id = queue.enqueue(kind, "", source, collection)
+    deadline = time.monotonic() + _WRITER_JOB_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+        job = await asyncio.to_thread(queue.get, job_id)
+        if job is not None and job["status"] in (SUCCEEDED, FAILED):
+            return job_id, job
+    return job_id, None
+
+
+def _still_running(job_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"message": "Queued on the writer worker.", "job_id": job_id, "status_url": f"/data/jobs/{job_id}"},
+    )
+
+
+async def _save_upload(file: UploadFile, target_dir: str, max_bytes: int, unique: bool = True) -> Tuple[Path, int]:
+    """
+    Streams an upload to disk in UPLOAD_CHUNK_BYTES pieces and returns (path, size).
+    With `unique`, the file gets a collision-free temp name that keeps the original
+    extension (loaders pick the parser by suffix), so concurrent uploads of the
+    same filename never clobber each other. Otherwise it keeps its name, with a
+    " (2)" suffix if that name is taken. Raises HTTP 413 past `max_bytes`.
+    """
+    filename = Path(file.filename).name
+    if unique:
+        fd, temp_path = tempfile.mkstemp(prefix="upload_", suffix=Path(filename).suffix.lower(), dir=target_dir)
+        target = Path(temp_path)
+        buffer = os.fdopen(fd, "wb")
+    else:
+        target = Path(target_dir) / filename
+        copy = 2
+        while target.exists(): # Same basename twice in one request: "name (2).pdf"
+            target = Path(target_dir) / f"{Path(filename).stem} ({copy}){Path(filename).suffix}"
+            copy += 1
+        buffer = target.open("xb")
+    size = 0
+    try:
+        with buffer:
+            while True:
+                piece = await file.read(settings.UPLOAD_CHUNK_BYTES)
+                if not piece:
+                    break
+                size += len(piece)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"{filename} exceeds the {max_bytes} byte upload limit.",
+                    )
+                buffer.write(piece)
+    except BaseException:
+        target.unlink(missing_ok=True)
+        raise
+    return target, size
+
+
 @router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    course: Optional[str] = Form(None),
+    replace: bool = Form(False),
 ):
     """
-    Uploads a document file (.pdf, .docx, .txt).
-    The file is processed and indexed in the background.
+    Uploads a document file (.pdf, .docx, .txt) into a course collection
+    (`course`, default CHROMA_COLLECTION_NAME).
+    With `replace`, the file is a new version of the stored document of the same
+    name: only changed chunks are embedded and added, removed ones are deleted.
+    The file is queued as an ingestion job; poll GET /data/jobs/{job_id} for progress.
     """
     if not file.filename:
          raise HTTPException(status_code=400, detail="No filename provided.")
+    collection = _course_collection(course)
 
     os.makedirs(settings.UPLOADS_DIR, exist_ok=True)
- 
-    temp_file_path = Path(settings.UPLOADS_DIR) / file.filename
+    source_name = Path(file.filename).name
+    temp_file_path = None
     try:
-        with temp_file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        print(f"File saved temporarily to: {temp_file_path}")
+        temp_file_path, size = await _save_upload(file, settings.UPLOADS_DIR, settings.MAX_UPLOAD_BYTES)
+        print(f"File saved temporarily to: {temp_file_path} ({size} bytes)")
 
-        # Add the processing task to run in the background
-        background_tasks.add_task(process_and_store_document, str(temp_file_path))
+        # Queue the processing job (persisted, retried, bounded concurrency)
+        job_id = get_job_queue().enqueue(KIND_DOCUMENT, str(temp_file_path), source_name, collection, replace)
 
         return {
-            "filename": file.filename,
+            "filename": source_name,
+            "collection": collection,
+            "replace": replace,
             "message": "File received and scheduled for processing.",
-            "temp_path": str(temp_file_path) 
+            "temp_path": str(temp_file_path),
+            "job_id": job_id,
+            "status_url": f"/data/jobs/{job_id}",
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        if temp_file_path.exists():
+        if temp_file_path is not None and temp_file_path.exists():
             os.remove(temp_file_path)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -46,26 +161,169 @@ async def upload_document(
     finally:
         await file.close()
 
-@router.get("/collections")
-async def get_collections_info():
-    """ Gets basic info about the ChromaDB collection. """
+@router.post("/upload/bulk", status_code=status.HTTP_202_ACCEPTED)
+async def upload_documents_bulk(
+    files: List[UploadFile] = File(...),
+    course: Optional[str] = Form(None),
+):
+    """
+    Uploads several documents and/or .zip archives at once into one course collection.
+    They are queued as one bulk job: files are parsed in a process pool and embedded in shared batches.
+    """
+    collection = _course_collection(course)
+    os.makedirs(settings.UPLOADS_DIR, exist_ok=True)
+    upload_dir = tempfile.mkdtemp(prefix="bulk_", dir=settings.UPLOADS_DIR)
+    saved = []
+    total_bytes = 0
     try:
-        import chromadb
-        client = chromadb.PersistentClient(path=settings.VECTOR_STORE_PATH)
-        collection = client.get_collection(name=settings.CHROMA_COLLECTION_NAME)
-        count = collection.count()
-        return {
-            "collection_name": settings.CHROMA_COLLECTION_NAME,
-            "vector_store_path": settings.VECTOR_STORE_PATH,
-            "document_count": count, # Approximate count of indexed chunks
-        }
+        for file in files:
+            if not file.filename:
+                continue
+            # Names inside a private job directory; they become the chunks' source names
+            remaining = settings.MAX_BULK_UPLOAD_BYTES - total_bytes
+            target, size = await _save_upload(
+                file, upload_dir, min(settings.MAX_UPLOAD_BYTES, remaining), unique=False
+            )
+            total_bytes += size
+            saved.append(target.name)
     except Exception as e:
-         # Handle case where collection might not exist yet
-        if "does not exist" in str(e).lower():
-             return {
-                "collection_name": settings.CHROMA_COLLECTION_NAME,
-                "vector_store_path": settings.VECTOR_STORE_PATH,
-                "document_count": 0,
-                "status": "Collection not found or empty."
-            }
-        raise HTTPException(status_code=500, detail=f"Error accessing vector store: {e}")
\ No newline at end of file
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Could not save uploaded files: {e}",
+        )
+    finally:
+        for file in files:
+            await file.close()
+
+    if not saved:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="No files provided.")
+
+    job_id = get_job_queue().enqueue(KIND_BULK, upload_dir, ", ".join(saved), collection)
+    return {
+        "filenames": saved,
+        "collection": collection,
+        "message": f"{len(saved)} file(s) received and scheduled for bulk processing.",
+        "job_id": job_id,
+        "status_url": f"/data/jobs/{job_id}",
+    }
+
+@router.delete("/documents/{source:path}")
+async def delete_document_by_source(source: str, course: Optional[str] = Query(None)):
+    """Removes every chunk of one source document (its upload filename) from a course collection."""
+    from app.services.data_processor import delete_document # Loader stack is imported lazily, as in the job queue
+
+    collection = _course_collection(course)
+    if store_sync.is_writer():
+        try:
+            deleted = await asyncio.to_thread(delete_document, source, collection)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Could not delete {source}: {e}")
+    else:
+        job_id, job = await _run_on_writer(KIND_DELETE, source, collection)
+        if job is None:
+            return _still_running(job_id)
+        if job["status"] == FAILED:
+            raise HTTPException(status_code=500, detail=f"Could not delete {source}: {job['error']}")
+        deleted = job["result"]["chunks_deleted"]
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"No chunks of '{source}' in collection '{collection}'.")
+    return {"source": source, "collection": collection, "chunks_deleted": deleted}
+
+@router.get("/jobs", response_model=List[JobInfo])
+async def list_jobs(status_filter: Optional[str] = Query(None, alias="status"), limit: int = 50):
+    """Lists recent ingestion jobs, newest first. Optionally filter by status."""
+    return get_job_queue().list(status=status_filter, limit=min(limit, 500))
+
+@router.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str):
+    """Status and progress (chunks embedded / total, batches) of one ingestion job."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
+
+@router.post("/snapshot", status_code=status.HTTP_202_ACCEPTED)
+async def create_snapshot(course: Optional[str] = Query(None)):
+    """
+    Exports collections (comma-separated `course`, default all) with their vectors,
+    texts and metadata to a bundle in SNAPSHOT_DIR, as a job. Download it from
+    `download_url` once the job has succeeded.
+    """
+    collections = [_course_collection(c) for c in (course or "").split(",") if c.strip()]
+    name = default_snapshot_name()
+    job_id = get_job_queue().enqueue(KIND_SNAPSHOT_EXPORT, "", name, ",".join(collections) or None)
+    return {
+        "snapshot": name,
+        "collections": collections or "all",
+        "job_id": job_id,
+        "status_url": f"/data/jobs/{job_id}",
+        "download_url": f"/data/snapshots/{name}",
+    }
+
+@router.get("/snapshots/{name}")
+async def download_snapshot(name: str):
+    """Downloads an exported snapshot bundle."""
+    path = Path(settings.SNAPSHOT_DIR) / Path(name).name
+    if path.suffix != ".zip" or not path.is_file():
+        raise HTTPException(status_code=404, detail=f"Snapshot {name} not found (is the export job finished?).")
+    return FileResponse(path, media_type="application/zip", filename=path.name)
+
+@router.post("/snapshot/import", status_code=status.HTTP_202_ACCEPTED)
+async def upload_snapshot(file: UploadFile = File(...), course: Optional[str] = Form(None)):
+    """
+    Uploads a snapshot bundle and queues its import: chunks are bulk-loaded with
+    their stored vectors, nothing is re-embedded. Fails if the bundle was made
+    with a different EMBEDDING_MODEL_NAME. `course` limits the import to those collections.
+    """
+    collections = [_course_collection(c) for c in (course or "").split(",") if c.strip()]
+    os.makedirs(settings.UPLOADS_DIR, exist_ok=True)
+    try:
+        temp_file_path, size = await _save_upload(file, settings.UPLOADS_DIR, settings.MAX_BULK_UPLOAD_BYTES)
+    finally:
+        await file.close()
+    job_id = get_job_queue().enqueue(
+        KIND_SNAPSHOT_IMPORT, str(temp_file_path), Path(file.filename or "snapshot.zip").name, ",".join(collections) or None
+    )
+    return {
+        "filename": file.filename,
+        "bytes": size,
+        "message": "Snapshot received and scheduled for import.",
+        "job_id": job_id,
+        "status_url": f"/data/jobs/{job_id}",
+    }
+
+@router.get("/collections")
+async def get_collections_info(include_sources: bool = True, refresh: bool = False):
+    """
+    Chunks, text bytes, last ingestion time and embedding model per collection
+    (and per source), from the summary ingestion keeps up to date: cheap enough
+    to poll. `refresh=true` recounts from the vector store (on the writer worker).
+    """
+    stats = get_collection_stats()
+    if not store_sync.is_writer():
+        if refresh:
+            job_id, job = await _run_on_writer(KIND_STATS, "collection stats")
+            if job is None:
+                return _still_running(job_id)
+            if job["status"] == FAILED:
+                raise HTTPException(status_code=500, detail=f"Error accessing vector store: {job['error']}")
+    elif refresh or not stats.exists: # First call on a store populated before the summary existed
+        try:
+            await asyncio.to_thread(rebuild_collection_stats)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error accessing vector store: {e}")
+    summary = stats.summary()
+    if not include_sources:
+        summary = {**summary, "collections": [
+            {key: value for key, value in c.items() if key != "sources"} for c in summary["collections"]
+        ]}
+    return {
+        "collection_name": settings.CHROMA_COLLECTION_NAME, # Default collection
+        "vector_backend": settings.VECTOR_BACKEND,
+        "vector_store_path": settings.FLAT_INDEX_DIR if settings.VECTOR_BACKEND == "flat" else settings.VECTOR_STORE_PATH,
+        **summary,
+    }
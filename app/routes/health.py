@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.core import startup, store_sync
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+@router.get("/live")
+async def liveness():
+    """The process is up and serving requests."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness():
+    """
+    200 once the warm-up has loaded the embedding model, vector store and QA chain;
+    503 while warming up or if it failed. Includes the per-phase startup timings
+    and whether this worker is the store writer or a reader.
+    """
+    report = {**startup.report(), "worker_role": store_sync.role()}
+    return JSONResponse(status_code=200 if startup.is_ready() else 503, content=report)
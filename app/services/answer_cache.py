@@ -0,0 +1,227 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core import store_sync
+from app.core.config import settings
+from app.core.metrics import CACHE_EVENTS
+
+
+def normalize_query(query: str) -> str:
+    """Lower-cases, collapses whitespace and drops trailing punctuation for exact matching."""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    embedding: np.ndarray # Unit-normalized float32 query embedding
+    answer: str
+    sources: List[Dict[str, Any]]
+    scope: str = "" # Collections the answer was retrieved from (comma-joined)
+    created_at: float = field(default_factory=time.monotonic)
+    size_bytes: int = 0
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of final answers keyed by query and scope (the course
+    collections searched). Looks up exact (normalized) matches first, then
+    near-duplicates by cosine similarity of query embeddings in the same scope.
+    Entries are evicted LRU-first when the entry count or memory cap is
+    exceeded, and expire after `ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float,
+        max_entries: int,
+        ttl_seconds: float,
+        max_bytes: int,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._matrix: Optional[np.ndarray] = None # Stacked embeddings, rebuilt lazily
+        self._matrix_keys: List[str] = []
+        self._matrix_scopes: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0 # Bumped on invalidate; stale in-flight answers are not stored
+
+    # --- Internal helpers (caller holds the lock) ---
+    def _is_expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size_bytes
+            self._matrix = None
+
+    def _evict_to_limits(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _purge_expired(self, now: float):
+        expired = [k for k, e in self._entries.items() if self._is_expired(e, now)]
+        for key in expired:
+            self._remove(key)
+            self.evictions += 1
+
+    @staticmethod
+    def _key(query: str, scope: str) -> str:
+        key = normalize_query(query)
+        return f"{scope}\x00{key}" if scope else key
+
+    def _nearest(self, embedding: np.ndarray, scope: str) -> Optional[CacheEntry]:
+        if not self._entries:
+            return None
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[k].embedding for k in self._matrix_keys])
+            self._matrix_scopes = np.array([self._entries[k].scope for k in self._matrix_keys], dtype=object)
+        scores = self._matrix @ embedding
+        scores[self._matrix_scopes != scope] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return self._entries[self._matrix_keys[best]]
+        return None
+
+    @staticmethod
+    def _as_unit_vector(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # --- Public API ---
+    def lookup_exact(self, query: str, scope: str = "") -> Optional[CacheEntry]:
+        """Cheap exact-match probe that needs no embedding. Misses are not counted."""
+        key = self._key(query, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry, time.monotonic()):
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry
+
+    def lookup(self, query: str, embedding: Optional[List[float]] = None, scope: str = "") -> Optional[CacheEntry]:
+        """Returns a cached entry for an exact or near-duplicate query in `scope`, or None."""
+        key = self._key(query, scope)
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry
+            if embedding is not None:
+                entry = self._nearest(self._as_unit_vector(embedding), scope)
+                if entry is not None:
+                    self._entries.move_to_end(entry.key)
+                    self.semantic_hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        query: str,
+        embedding: List[float],
+        answer: str,
+        sources: List[Dict[str, Any]],
+        generation: Optional[int] = None,
+        scope: str = "",
+    ):
+        """
+        Adds or refreshes the answer for a query. If `generation` is given and the
+        cache was invalidated since, the answer was built from stale data and is dropped.
+        """
+        key = self._key(query, scope)
+        vector = self._as_unit_vector(embedding)
+        size = vector.nbytes + sys.getsizeof(key) + sys.getsizeof(answer) + 64 * len(sources)
+        entry = CacheEntry(key=key, embedding=vector, answer=answer, sources=sources, scope=scope, size_bytes=size)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            self._matrix = None
+            self._evict_to_limits()
+
+    def invalidate(self, collection: Optional[str] = None):
+        """
+        Drops the entries answered from `collection` (every entry if None).
+        Called whenever a collection changes.
+        """
+        with self._lock:
+            if collection is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                stale = [k for k, e in self._entries.items() if collection in e.scope.split(",")]
+                for key in stale:
+                    self._remove(key)
+            self._matrix = None
+            self.invalidations += 1
+            self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": settings.ANSWER_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "llm_calls_saved": hits,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# --- Shared instance ---
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+)
+
+def get_answer_cache() -> SemanticAnswerCache:
+    return answer_cache
+
+CACHE_EVENTS.add_callback(lambda: [
+    ({"cache": "answer", "event": "exact_hit"}, answer_cache.exact_hits),
+    ({"cache": "answer", "event": "semantic_hit"}, answer_cache.semantic_hits),
+    ({"cache": "answer", "event": "miss"}, answer_cache.misses),
+])
+
+# Reader workers: answers from a collection the writer changed are stale
+store_sync.on_change(lambda collections: [answer_cache.invalidate(name) for name in collections])
@@ -0,0 +1,169 @@
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from app.core import store_sync
+from app.core.config import settings
+from app.services.collection_stats import flushing_stats
+from app.services.document_loader import SUPPORTED_EXTENSIONS, parse_file
+
+
+def collect_input_files(path: str, extract_dir: str) -> List[Tuple[str, str]]:
+    """
+    Expands a file, directory or .zip archive into (file_path, source_name) pairs.
+    Archives are extracted into `extract_dir`. Source names are paths relative to
+    the directory/archive root so same-named files in different folders stay distinct.
+    """
+    root = Path(path)
+    if root.is_dir():
+        inputs = []
+        for p in sorted(root.rglob("*")):
+            if not p.is_file():
+                continue
+            if p.suffix.lower() == ".zip": # Archives next to documents (e.g. a mixed bulk upload)
+                inputs.extend(collect_input_files(str(p), extract_dir))
+            elif p.suffix.lower() in SUPPORTED_EXTENSIONS:
+                inputs.append((str(p), p.relative_to(root).as_posix()))
+        return inputs
+    if root.suffix.lower() == ".zip":
+        target = Path(extract_dir) / root.stem
+        suffix = 2
+        while target.exists(): # Same-named archives from different folders
+            target = Path(extract_dir) / f"{root.stem}_{suffix}"
+            suffix += 1
+        with zipfile.ZipFile(root) as archive:
+            archive.extractall(target) # zipfile strips absolute paths and ".." components
+        return collect_input_files(str(target), extract_dir)
+    if root.is_file() and root.suffix.lower() in SUPPORTED_EXTENSIONS:
+        return [(str(root), root.name)]
+    print(f"Skipping unsupported input: {path}")
+    return []
+
+
+@store_sync.deferred_bumps() # Readers reload once when the job ends, not per batch
+@flushing_stats
+def ingest_paths(
+    paths: List[str],
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[..., None]] = None,
+    collection_name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Bulk-ingests files, directories and zip archives.
+    Files are parsed and split in a process pool; finished chunks stream into a
+    single embedding stage in this process that embeds and stores them in
+    batches of `batch_size`, so embedding overlaps with parsing of the remaining files.
+    `progress`, if given, receives chunks_done/chunks_total/batches_done/batches_total
+    counters after each batch (totals grow as files finish parsing).
+    Everything goes into one course collection (default CHROMA_COLLECTION_NAME).
+    Returns a throughput report.
+    """
+    # Imported here so parser processes never load the embedding model or open the store
+    from app.core.vector_store import collection_name_of, get_vector_store
+    from app.services.data_processor import store_chunks
+
+    workers = workers or settings.INGEST_PROCESS_WORKERS or os.cpu_count() or 1
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    vector_db = get_vector_store(collection_name)
+
+    start = time.perf_counter()
+    report: Dict[str, Any] = {
+        "files": 0,
+        "files_failed": [],
+        "chunks": 0,
+        "chunks_added": 0,
+        "chunks_failed": 0,
+        "workers": workers,
+        "batch_size": batch_size,
+        "collection": collection_name_of(vector_db),
+    }
+    embed_seconds = 0.0
+    batches_done = 0
+    chunks_done = 0
+    pending: Dict[str, Document] = {} # Shared buffer across files
+
+    def flush(force: bool = False):
+        nonlocal embed_seconds, batches_done, chunks_done
+        while pending and (force or len(pending) >= batch_size):
+            batch_ids = list(pending.keys())[:batch_size]
+            batch = {chunk_id: pending.pop(chunk_id) for chunk_id in batch_ids}
+            t0 = time.perf_counter()
+            added, failed = store_chunks(vector_db, batch, batch_size)
+            embed_seconds += time.perf_counter() - t0
+            report["chunks_added"] += added
+            report["chunks_failed"] += failed
+            batches_done += 1
+            chunks_done += len(batch) - failed
+            if progress:
+                progress(
+                    chunks_done=chunks_done,
+                    chunks_total=report["chunks"],
+                    batches_done=batches_done,
+                    batches_total=batches_done + (len(pending) + batch_size - 1) // batch_size,
+                )
+
+    with tempfile.TemporaryDirectory(prefix="bulk_ingest_") as extract_dir:
+        inputs: List[Tuple[str, str]] = []
+        for path in paths:
+            inputs.extend(collect_input_files(path, extract_dir))
+        print(f"Bulk ingestion: {len(inputs)} files, {workers} parser processes, batch size {batch_size}")
+
+        # "spawn" keeps children free of the parent's model threads and open DB handles
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {
+                pool.submit(parse_file, file_path, source_name): source_name
+                for file_path, source_name in inputs
+            }
+            for future in as_completed(futures):
+                source_name = futures[future]
+                try:
+                    unique_chunks = future.result()
+                except Exception as e:
+                    print(f"!!! Failed to parse {source_name}: {e}")
+                    report["files_failed"].append(source_name)
+                    continue
+                if not unique_chunks:
+                    report["files_failed"].append(source_name)
+                    continue
+                report["files"] += 1
+                report["chunks"] += len(unique_chunks)
+                pending.update(unique_chunks)
+                flush()
+        flush(force=True)
+
+    elapsed = time.perf_counter() - start
+    report.update({
+        "elapsed_seconds": round(elapsed, 2),
+        "embed_store_seconds": round(embed_seconds, 2),
+        "docs_per_sec": round(report["files"] / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_sec": round(report["chunks"] / elapsed, 2) if elapsed else 0.0,
+    })
+    print(f"Bulk ingestion finished: {report['files']} files, {report['chunks']} chunks "
+          f"({report['chunks_added']} new) in {elapsed:.1f}s - "
+          f"{report['docs_per_sec']} docs/sec, {report['chunks_per_sec']} chunks/sec")
+    return report
+
+
+if __name__ == "__main__":
+    # Example: python -m app.services.bulk_ingest ./semester_materials lecture_slides.zip --workers 8
+    parser = argparse.ArgumentParser(description="Bulk-ingest course materials into the vector store.")
+    parser.add_argument("paths", nargs="+", help="Files, directories or .zip archives")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: one per core)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks per embedding batch")
+    parser.add_argument("--course", default=None, help="Course collection to ingest into (default: CHROMA_COLLECTION_NAME)")
+    args = parser.parse_args()
+    if not store_sync.acquire_writer():
+        # A running server owns the store; writing next to it could corrupt it
+        raise SystemExit("!!! The server's writer worker holds the store. Upload through POST /data/upload/bulk instead.")
+    print(json.dumps(ingest_paths(args.paths, args.workers, args.batch_size, collection_name=args.course), indent=2))
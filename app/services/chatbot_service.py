@@ -1,36 +1,110 @@
 import asyncio
-from langchain.chains import RetrievalQA
-from langchain_google_genai import ChatGoogleGenerativeAI
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
 from langchain.prompts import PromptTemplate
 from langchain_community.vectorstores import Chroma
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler # For console streaming
-from langchain.callbacks.base import AsyncCallbackHandler # For WebSocket streaming (more advanced)
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain.schema import Document
 
+from app.core import store_sync
 from app.core.config import settings
-from app.core.vector_store import get_vector_store
+from app.core.startup import timed_phase
+from app.core.vector_store import get_vector_store, get_embedding_function, list_collection_names, resolve_collection_name
+from app.core.hybrid_retriever import HybridRetriever
+from app.core.sharded_retriever import ShardedRetriever
+from app.core.context_packer import ContextPackingRetriever
+from app.core.lexical_index import ensure_lexical_index
+from app.core.query_embedder import aembed_query
+from app.core.fair_limiter import FairLimiter
+from app.core.llm_gateway import LLMGateway, LLMUnavailableError, ResilientChatModel
+from app.core.metrics import CHAT_MESSAGES_TOTAL, CONVERSATION_HISTORY_TOKENS, LLM_GATEWAY, RAG_EXECUTIONS, RAG_STAGE_SECONDS
+from app.services.answer_cache import CacheEntry, get_answer_cache
+from app.services.conversation import ConversationMemory, ConversationalRetrievalQA
 
+logger = logging.getLogger(__name__)
 
-print(f"Initializing ChatGoogleGenerativeAI with model: {settings.LLM_MODEL_NAME}")
-# --- Initialize LLM ---
-try:
-    # LangChain automatically uses GOOGLE_API_KEY from environment
-    llm = ChatGoogleGenerativeAI(
-        model=settings.LLM_MODEL_NAME,
-        temperature=0.7,
-        convert_system_message_to_human=True # Often needed for Gemini compatibility with generic prompts
-    )
-    print("ChatGoogleGenerativeAI initialized.")
-    # Optional: Test call (check quotas)
-    # try:
-    #     print("Testing Gemini connection...")
-    #     llm.invoke("Hello!")
-    #     print("Gemini connection test successful.")
-    # except Exception as test_e:
-    #     print(f"!!! Warning: Gemini connection test failed: {test_e}")
-except Exception as e:
-    print(f"!!! Error initializing ChatGoogleGenerativeAI: {e}")
-    print("!!! Ensure 'GOOGLE_API_KEY' is set correctly in .env and the model name is valid.")
-    llm = None # Or raise error
+
+# --- LLM (created lazily on first use or by the startup warm-up) ---
+_init_lock = threading.RLock()
+llm = None
+_llm_initialized = False
+
+# Every LLM call goes through one gateway: quota-shaped rate limits, retries, hedging, circuit breaker
+llm_gateway = LLMGateway(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    requests_per_minute=settings.LLM_RATE_LIMIT_RPM,
+    tokens_per_minute=settings.LLM_RATE_LIMIT_TPM,
+    retry_attempts=settings.LLM_RETRY_ATTEMPTS,
+    retry_base_seconds=settings.LLM_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.LLM_RETRY_MAX_SECONDS,
+    attempt_timeout_seconds=settings.LLM_ATTEMPT_TIMEOUT_SECONDS,
+    hedge_enabled=settings.LLM_HEDGE_ENABLED,
+    hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+    hedge_min_delay_seconds=settings.LLM_HEDGE_MIN_DELAY_SECONDS,
+    breaker_window=settings.LLM_BREAKER_WINDOW,
+    breaker_failure_ratio=settings.LLM_BREAKER_FAILURE_RATIO,
+    breaker_cooldown_seconds=settings.LLM_BREAKER_COOLDOWN_SECONDS,
+)
+
+LLM_GATEWAY.add_callback(lambda: [
+    ({"state": "running"}, llm_gateway.limiter.active),
+    ({"state": "waiting"}, llm_gateway.limiter.waiting),
+    ({"state": "circuit_open"}, int(llm_gateway.breaker.state == "open")),
+])
+
+LLM_UNAVAILABLE_MESSAGE = "The assistant is busy or temporarily unavailable. Please try again in a moment."
+
+def _init_llm():
+    print(f"Initializing ChatGoogleGenerativeAI with model: {settings.LLM_MODEL_NAME}")
+    try:
+        with timed_phase("llm_client"):
+            if settings.LLM_MODEL_NAME == "fake":
+                # Local stand-in for offline development and streaming tests
+                from app.services.fake_llm import FakeStreamingChatModel
+                chat_llm = FakeStreamingChatModel.from_profile(settings.FAKE_LLM_PROFILE, settings.FAKE_LLM_ERROR_RATE)
+                print(f"Using local FakeStreamingChatModel (LLM_MODEL_NAME=fake, profile {settings.FAKE_LLM_PROFILE}).")
+            else:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+
+                # LangChain automatically uses GOOGLE_API_KEY from environment
+                chat_llm = ChatGoogleGenerativeAI(
+                    model=settings.LLM_MODEL_NAME,
+                    temperature=0.7,
+                    convert_system_message_to_human=True, # Often needed for Gemini compatibility with generic prompts
+                    # The gateway retries with backoff; the client's own retries would multiply its attempts
+                    max_retries=1 if settings.LLM_GATEWAY_ENABLED else 6,
+                )
+                print("ChatGoogleGenerativeAI initialized.")
+            if settings.LLM_GATEWAY_ENABLED:
+                chat_llm = ResilientChatModel(
+                    llm=chat_llm, gateway=llm_gateway, chars_per_token=settings.CONTEXT_CHARS_PER_TOKEN
+                )
+        # Optional: Test call (check quotas)
+        # try:
+        #     print("Testing Gemini connection...")
+        #     chat_llm.invoke("Hello!")
+        #     print("Gemini connection test successful.")
+        # except Exception as test_e:
+        #     print(f"!!! Warning: Gemini connection test failed: {test_e}")
+        return chat_llm
+    except Exception as e:
+        print(f"!!! Error initializing ChatGoogleGenerativeAI: {e}")
+        print("!!! Ensure 'GOOGLE_API_KEY' is set correctly in .env and the model name is valid.")
+        return None # Or raise error
+
+def get_llm():
+    global llm, _llm_initialized
+    if not _llm_initialized:
+        with _init_lock:
+            if not _llm_initialized:
+                llm = _init_llm()
+                _llm_initialized = True
+    return llm
 
 # --- Define Custom Prompt (Optional but Recommended) ---
 prompt_template = """Use the following context from the course materials to answer the user's question.
@@ -49,28 +123,94 @@ Ensure your answer is concise, clear, and informative."
 Context:
 {context}
 
-Question: {question}
+{history}Question: {question}
 
 Answer:"""
 
 QA_PROMPT = PromptTemplate(
-    template=prompt_template, input_variables=["context", "question"]
-)
+    template=prompt_template, input_variables=["context", "history", "question"]
+) # "history": the connection's conversation (see ConversationMemory.render), "" without one
+
+
+# --- Course selection ---
+ALL_COURSES = "*"
 
+def resolve_collections(courses: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    Collections a chat searches: the named courses, every collection for "*",
+    or CHROMA_COLLECTION_NAME when none are given. Raises ValueError for
+    invalid or unknown course names.
+    """
+    names = [c.strip() for c in courses or [] if c and c.strip()]
+    if not names:
+        return [resolve_collection_name(None)]
+    existing = list_collection_names()
+    if ALL_COURSES in names:
+        return existing or [resolve_collection_name(None)]
+    collections = sorted({resolve_collection_name(name) for name in names})
+    unknown = [name for name in collections if name not in existing]
+    if unknown:
+        raise ValueError(f"Unknown course(s): {', '.join(unknown)}")
+    return collections
 
-# --- Build RetrievalQA Chain ---
-def get_qa_chain():
-    if llm is None: # Check LLM init
+
+# --- Build RetrievalQA Chain (retrieves with the standalone question, prompts with history) ---
+def get_qa_chain(chat_llm=None, collections: Optional[Sequence[str]] = None):
+    """
+    Builds the RetrievalQA chain over `collections` (default: CHROMA_COLLECTION_NAME).
+    Pass `chat_llm` to override the module LLM (e.g. a fake model).
+    """
+    chat_llm = chat_llm or get_llm()
+    if chat_llm is None: # Check LLM init
          print("!!! Cannot create QA chain: LLM not initialized.")
          return None
-    vector_db = get_vector_store()
-    retriever = vector_db.as_retriever(
-        search_type="similarity", # Or "mmr" for Maximal Marginal Relevance
-        search_kwargs={"k": settings.RETRIEVED_DOCS_COUNT} # Number of chunks to retrieve
-    )
+    collections = list(collections or [resolve_collection_name(None)])
+    use_mmr = settings.CONTEXT_PACKING_ENABLED and settings.CONTEXT_MMR_ENABLED
+    retrieve_k = settings.CONTEXT_MMR_FETCH_K if use_mmr else settings.RETRIEVED_DOCS_COUNT
+    vector_db = get_vector_store(collections[0])
+    if len(collections) > 1:
+        # Several courses: search their collections in parallel and merge by score
+        shards = {name: get_vector_store(name) for name in collections}
+        retriever = ShardedRetriever(
+            shards=shards,
+            lexical_indexes=(
+                {name: ensure_lexical_index(store) for name, store in shards.items()}
+                if settings.HYBRID_RETRIEVAL_ENABLED else {}
+            ),
+            k=retrieve_k,
+            fetch_k=max(settings.HYBRID_FETCH_K, retrieve_k),
+            rrf_k=settings.HYBRID_RRF_K,
+        )
+    elif settings.HYBRID_RETRIEVAL_ENABLED:
+        # BM25 + vector search fused with RRF: catches course codes, theorem names and symbols
+        retriever = HybridRetriever(
+            vector_store=vector_db,
+            lexical_index=ensure_lexical_index(vector_db),
+            k=retrieve_k,
+            fetch_k=max(settings.HYBRID_FETCH_K, retrieve_k),
+            rrf_k=settings.HYBRID_RRF_K,
+        )
+    else:
+        retriever = vector_db.as_retriever(
+            search_type="similarity", # Or "mmr" for Maximal Marginal Relevance
+            search_kwargs={"k": retrieve_k} # Number of chunks to retrieve
+        )
+    if settings.CONTEXT_PACKING_ENABLED:
+        # Overlapping chunks merged, near-duplicates dropped, context cut to a token budget
+        retriever = ContextPackingRetriever(
+            base_retriever=retriever,
+            token_budget=settings.CONTEXT_TOKEN_BUDGET,
+            dedup_threshold=settings.CONTEXT_DEDUP_THRESHOLD,
+            chars_per_token=settings.CONTEXT_CHARS_PER_TOKEN,
+            max_overlap=2 * settings.CHUNK_OVERLAP,
+            mmr_k=settings.RETRIEVED_DOCS_COUNT if use_mmr else None,
+            mmr_lambda=settings.CONTEXT_MMR_LAMBDA,
+            embeddings=get_embedding_function(),
+            vector_stores={name: get_vector_store(name) for name in collections},
+        )
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
+    qa_chain = ConversationalRetrievalQA.from_chain_type(
+        llm=chat_llm,
         chain_type="stuff",  # "stuff": Puts all context in the prompt (simplest, works for small contexts)
                              # Other types: "map_reduce", "refine", "map_rerank" for larger contexts
         retriever=retriever,
@@ -79,52 +219,352 @@ def get_qa_chain():
     )
     return qa_chain
 
-# --- Store the chain globally (or use Depends in FastAPI) ---
-qa_chain_instance = get_qa_chain()
+# --- Store the chains globally (or use Depends in FastAPI) ---
+qa_chains: Dict[Tuple[str, ...], Any] = {} # One chain per course selection
+
+def get_default_qa_chain(collections: Optional[Sequence[str]] = None):
+    """The shared QA chain for a course selection (resolved collections), built on first use."""
+    key = tuple(collections or [resolve_collection_name(None)])
+    qa_chain = qa_chains.get(key)
+    if qa_chain is None:
+        with _init_lock:
+            qa_chain = qa_chains.get(key)
+            if qa_chain is None:
+                with timed_phase("qa_chain"):
+                    qa_chain = get_qa_chain(collections=key)
+                if qa_chain is not None:
+                    qa_chains[key] = qa_chain
+    return qa_chain
+
+def _drop_chains(collections: List[str]):
+    """Reader worker: chains over changed collections are rebuilt on the next question."""
+    with _init_lock:
+        for key in list(qa_chains):
+            if not set(key).isdisjoint(collections):
+                del qa_chains[key]
+
+store_sync.on_change(_drop_chains)
+
+
+# --- Global RAG concurrency (fair across clients) ---
+rag_limiter = FairLimiter(settings.RAG_MAX_CONCURRENCY, wait_stage="queue_wait")
+
+RAG_EXECUTIONS.add_callback(lambda: [
+    ({"state": "running"}, rag_limiter.active),
+    ({"state": "waiting"}, rag_limiter.waiting),
+])
+
+
+# --- Per-request stage timing ---
+class RagMetricsCallbackHandler(AsyncCallbackHandler):
+    """
+    Records retrieval, prompt assembly (retriever end -> LLM start), LLM
+    time-to-first-token and LLM total into RAG_STAGE_SECONDS. One per request.
+    """
+
+    def __init__(self):
+        self.retriever_run_id = None # Outermost retriever (the packer wraps the hybrid retriever)
+        self.retrieval_start: Optional[float] = None
+        self.retrieval_end: Optional[float] = None
+        self.llm_start: Optional[float] = None
+        self.first_token: Optional[float] = None
+
+    async def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        if self.retriever_run_id is None:
+            self.retriever_run_id = run_id
+            self.retrieval_start = time.perf_counter()
+
+    async def on_retriever_end(self, documents, *, run_id, **kwargs):
+        if run_id == self.retriever_run_id:
+            self.retrieval_end = time.perf_counter()
+            RAG_STAGE_SECONDS.observe(self.retrieval_end - self.retrieval_start, stage="retrieval")
+
+    def _on_model_start(self):
+        self.llm_start = time.perf_counter()
+        if self.retrieval_end is not None:
+            RAG_STAGE_SECONDS.observe(self.llm_start - self.retrieval_end, stage="prompt_assembly")
 
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._on_model_start()
 
-# In app/services/chatbot_service.py
+    async def on_llm_start(self, serialized, prompts, **kwargs):
+        self._on_model_start()
 
-async def get_bot_response(user_message: str) -> str:
-    """Generates a response using the RAG pipeline."""
-    print(f"\n--- RAG Start ---") # Mark start
-    print(f"Received query: {user_message}")
-    if not qa_chain_instance:
+    async def on_llm_new_token(self, token, **kwargs):
+        if self.first_token is None and self.llm_start is not None:
+            self.first_token = time.perf_counter()
+            RAG_STAGE_SECONDS.observe(self.first_token - self.llm_start, stage="llm_ttft")
+
+    async def on_llm_end(self, response, **kwargs):
+        if self.llm_start is not None:
+            end = time.perf_counter()
+            if self.first_token is None: # Non-streaming call: the whole answer arrives at once
+                RAG_STAGE_SECONDS.observe(end - self.llm_start, stage="llm_ttft")
+            RAG_STAGE_SECONDS.observe(end - self.llm_start, stage="llm_total")
+
+
+def _check_ready(qa_chain) -> Optional[str]:
+    """Returns an error message if the pipeline cannot run, otherwise None."""
+    if not qa_chain:
         print("!!! Error: QA Chain not initialized.")
         return "Error: QA Chain not initialized."
+    if settings.LLM_MODEL_NAME == "fake":
+        return None
     if not settings.GOOGLE_API_KEY or "your_openai_api_key_here" in settings.GOOGLE_API_KEY:
          print("!!! Error: GOOGLE API Key not configured.")
          return "Error: GOOGLE API Key not configured. Cannot generate response."
+    return None
+
+
+def _summarize_sources(source_docs: List[Document]) -> List[Dict[str, Any]]:
+    """Unique (source, page) pairs of the retrieved chunks, in retrieval order."""
+    seen = set()
+    sources = []
+    for doc in source_docs:
+        key = (doc.metadata.get("source", "N/A"), doc.metadata.get("page"))
+        if key in seen:
+            continue
+        seen.add(key)
+        sources.append({"source": key[0], "page": key[1]})
+    return sources
+
+
+async def _cache_lookup(user_message: str, scope: str) -> Tuple[Optional[CacheEntry], Optional[Tuple[List[float], int]]]:
+    """
+    Checks the answer cache for answers from the same collections (`scope`).
+    Returns (entry, store_token); the token carries the query embedding and
+    cache generation needed to store the answer on a miss.
+    Exact hits skip embedding entirely.
+    """
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None, None
+    cache = get_answer_cache()
+    generation = cache.generation
+    entry = cache.lookup_exact(user_message, scope)
+    if entry is not None:
+        return entry, None
+    try:
+        embedding = await aembed_query(user_message)
+    except Exception as e:
+        print(f"!!! Answer cache: failed to embed query, skipping semantic lookup: {e}")
+        return None, None
+    return cache.lookup(user_message, embedding, scope), (embedding, generation)
+
+
+def _cache_store(user_message: str, scope: str, store_token: Optional[Tuple[List[float], int]], answer: str, source_docs: List[Document]):
+    if settings.ANSWER_CACHE_ENABLED and store_token is not None:
+        embedding, generation = store_token
+        get_answer_cache().store(user_message, embedding, answer, _summarize_sources(source_docs), generation, scope)
+
+
+async def _get_chain(collections: Optional[Sequence[str]]) -> Tuple[Any, str]:
+    """Resolves the course selection to (qa_chain, cache scope). Raises ValueError for unknown courses."""
+    resolved = await asyncio.to_thread(resolve_collections, collections)
+    qa_chain = await asyncio.to_thread(get_default_qa_chain, resolved)
+    return qa_chain, ",".join(resolved)
+
+
+async def _chain_inputs(user_message: str, memory: Optional[ConversationMemory], client_id: str) -> Dict[str, str]:
+    """
+    Chain inputs for a question: with a conversation, its bounded history and the
+    standalone query retrieval runs with (differs from the question for follow-ups).
+    An LLM query rewrite waits for a RAG slot like the chain itself.
+    """
+    inputs = {"query": user_message}
+    if memory is not None:
+        inputs["history"] = memory.render()
+        inputs["retrieval_query"] = await memory.standalone_question(
+            user_message, get_llm(), slot=lambda: rag_limiter.slot(client_id)
+        )
+        CONVERSATION_HISTORY_TOKENS.observe(memory.history_tokens(inputs["history"]))
+    return inputs
+
+
+def _cache_key(user_message: str, inputs: Dict[str, str]) -> str:
+    """Follow-ups are cached under their standalone query, not the bare "explain that more"."""
+    return inputs.get("retrieval_query") or user_message
+
+
+async def stream_bot_response(
+    user_message: str,
+    qa_chain=None,
+    client_id: str = "default",
+    collections: Optional[Sequence[str]] = None,
+    memory: Optional[ConversationMemory] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs the RAG pipeline and yields framed events as they happen:
+      {"type": "retrieval", "count": n}       - retrieval finished
+      {"type": "token", "content": "..."}     - one LLM token delta
+      {"type": "sources", "sources": [...]}   - sources used for the answer
+      {"type": "final", "content": "...", "ttft_ms": ..., "total_ms": ...}
+      {"type": "error", "message": "..."}     - pipeline failed (terminal)
+    Answers served from the answer cache carry "cached": true. Cache misses wait
+    for a RAG_MAX_CONCURRENCY slot, shared round-robin between `client_id`s.
+    Closing or cancelling the generator cancels the chain (and the LLM call).
+    `collections` selects the courses searched (see resolve_collections).
+    `memory` is the connection's conversation: it is used for the prompt and
+    query rewrite, and the answered turn is recorded in it.
+    """
+    scope = resolve_collection_name(None)
+    if qa_chain is None:
+        try:
+            qa_chain, scope = await _get_chain(collections)
+        except ValueError as e:
+            CHAT_MESSAGES_TOTAL.inc(outcome="error")
+            yield {"type": "error", "message": str(e)}
+            return
+    error = _check_ready(qa_chain)
+    if error:
+        CHAT_MESSAGES_TOTAL.inc(outcome="error")
+        yield {"type": "error", "message": error}
+        return
+
+    start = time.perf_counter()
+    inputs = await _chain_inputs(user_message, memory, client_id)
+    cached, cache_token = await _cache_lookup(_cache_key(user_message, inputs), scope)
+    if cached is not None:
+        elapsed = time.perf_counter() - start
+        RAG_STAGE_SECONDS.observe(elapsed, stage="request_total")
+        CHAT_MESSAGES_TOTAL.inc(outcome="cache")
+        if memory is not None:
+            memory.record(user_message, cached.answer, get_llm())
+        elapsed_ms = round(elapsed * 1000, 1)
+        yield {"type": "retrieval", "count": len(cached.sources), "cached": True}
+        yield {"type": "token", "content": cached.answer}
+        yield {"type": "sources", "sources": cached.sources}
+        yield {"type": "final", "content": cached.answer, "ttft_ms": elapsed_ms, "total_ms": elapsed_ms, "cached": True}
+        return
+
+    first_token_at = None
+    retriever_runs = set()
+    answer_parts: List[str] = []
+    source_docs: List[Document] = []
+    result = None
+
+    try:
+        async with rag_limiter.slot(client_id):
+            async for event in qa_chain.astream_events(
+                inputs, config={"callbacks": [RagMetricsCallbackHandler()]}, version="v2"
+            ):
+                kind = event["event"]
+                if kind == "on_retriever_start":
+                    retriever_runs.add(event["run_id"])
+                elif kind == "on_retriever_end" and not retriever_runs.intersection(event.get("parent_ids", [])):
+                    # Only the outermost retriever: inner ones (wrapped by context packing) are not final
+                    source_docs = event["data"].get("output") or []
+                    yield {"type": "retrieval", "count": len(source_docs)}
+                elif kind == "on_chat_model_stream":
+                    token = event["data"]["chunk"].content
+                    if isinstance(token, str) and token:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        answer_parts.append(token)
+                        yield {"type": "token", "content": token}
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    output = event["data"].get("output") or {}
+                    result = output.get("result")
+                    source_docs = output.get("source_documents", source_docs)
+    except LLMUnavailableError as e:
+        print(f"!!! LLM unavailable: {e}") # Already retried or shed by the gateway; no traceback needed
+        CHAT_MESSAGES_TOTAL.inc(outcome="error")
+        yield {"type": "error", "message": LLM_UNAVAILABLE_MESSAGE}
+        return
+    except Exception as e:
+        print(f"!!! Error during streaming RAG pipeline execution: {e}")
+        import traceback
+        traceback.print_exc()
+        CHAT_MESSAGES_TOTAL.inc(outcome="error")
+        yield {"type": "error", "message": f"Sorry, an error occurred ({type(e).__name__}). Please check server logs."}
+        return
+
+    answer = result or "".join(answer_parts)
+    if not answer:
+        CHAT_MESSAGES_TOTAL.inc(outcome="error")
+        yield {"type": "error", "message": "Sorry, I received a response but couldn't extract the answer."}
+        return
+
+    _cache_store(_cache_key(user_message, inputs), scope, cache_token, answer, source_docs)
+    if memory is not None:
+        memory.record(user_message, answer, get_llm())
+    end = time.perf_counter()
+    RAG_STAGE_SECONDS.observe(end - start, stage="request_total")
+    CHAT_MESSAGES_TOTAL.inc(outcome="llm")
+    yield {"type": "sources", "sources": _summarize_sources(source_docs)}
+    yield {
+        "type": "final",
+        "content": answer,
+        "ttft_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+        "total_ms": round((end - start) * 1000, 1),
+    }
+
+
+async def get_bot_response(
+    user_message: str,
+    client_id: str = "default",
+    collections: Optional[Sequence[str]] = None,
+    memory: Optional[ConversationMemory] = None,
+) -> str:
+    """Generates a response using the RAG pipeline over the selected courses (and conversation `memory`)."""
+    logger.debug("RAG start, query: %s", user_message)
+    try:
+        qa_chain, scope = await _get_chain(collections)
+    except ValueError as e:
+        CHAT_MESSAGES_TOTAL.inc(outcome="error")
+        return str(e)
+    error = _check_ready(qa_chain)
+    if error:
+        CHAT_MESSAGES_TOTAL.inc(outcome="error")
+        return error
 
+    start = time.perf_counter()
+    inputs = await _chain_inputs(user_message, memory, client_id)
+    cached, cache_token = await _cache_lookup(_cache_key(user_message, inputs), scope)
+    if cached is not None:
+        RAG_STAGE_SECONDS.observe(time.perf_counter() - start, stage="request_total")
+        CHAT_MESSAGES_TOTAL.inc(outcome="cache")
+        if memory is not None:
+            memory.record(user_message, cached.answer, get_llm())
+        logger.debug("RAG end (answer cache hit)")
+        return cached.answer
     try:
-        print(">>> Calling qa_chain_instance.ainvoke...")
         # Use await for the async invocation
-        response = await qa_chain_instance.ainvoke({"query": user_message})
-        print("<<< qa_chain_instance.ainvoke completed.") # Check if it gets past this
+        async with rag_limiter.slot(client_id):
+            response = await qa_chain.ainvoke(
+                inputs, config={"callbacks": [RagMetricsCallbackHandler()]}
+            )
 
         answer = response.get("result", None) # Get result or None
         source_docs = response.get("source_documents", [])
 
-        print(f"Retrieved {len(source_docs)} source documents.")
+        logger.debug("Retrieved %d source documents.", len(source_docs))
         # Log sources if needed for debugging context length
         # for i, doc in enumerate(source_docs):
         #     print(f"  Source {i+1}: {doc.metadata.get('source', 'N/A')} (Len: {len(doc.page_content)})")
 
         if answer:
-            print(f"Generated Answer: {answer[:200]}...") # Log partial answer
-            print("--- RAG End (Success) ---")
+            logger.debug("Generated answer: %s...", answer[:200])
+            _cache_store(_cache_key(user_message, inputs), scope, cache_token, answer, source_docs)
+            if memory is not None:
+                memory.record(user_message, answer, get_llm())
+            RAG_STAGE_SECONDS.observe(time.perf_counter() - start, stage="request_total")
+            CHAT_MESSAGES_TOTAL.inc(outcome="llm")
             return answer
         else:
             print("!!! Error: No 'result' key found in LLM response.")
             print(f"Full Response Received: {response}") # Log the raw response
-            print("--- RAG End (Failure: No Result) ---")
+            CHAT_MESSAGES_TOTAL.inc(outcome="error")
             return "Sorry, I received a response but couldn't extract the answer."
 
+    except LLMUnavailableError as e:
+        print(f"!!! LLM unavailable: {e}")
+        CHAT_MESSAGES_TOTAL.inc(outcome="error")
+        return LLM_UNAVAILABLE_MESSAGE
     except Exception as e:
         print(f"!!! Error during RAG pipeline execution: {e}")
         import traceback
         traceback.print_exc() # Print detailed traceback
-        print("--- RAG End (Failure: Exception) ---")
+        CHAT_MESSAGES_TOTAL.inc(outcome="error")
         # Provide a more informative error message if possible
         error_type = type(e).__name__
-        return f"Sorry, an error occurred ({error_type}). Please check server logs."
\ No newline at end of file
+        return f"Sorry, an error occurred ({error_type}). Please check server logs."
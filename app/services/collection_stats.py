@@ -0,0 +1,215 @@
+import copy
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+
+STATS_VERSION = 1
+FLUSH_INTERVAL_SECONDS = 5.0 # Long jobs still write their progress at most this often
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class CollectionStats:
+    """
+    Running summary of what is stored in each collection: chunks and text bytes
+    per source, last ingestion time and embedding model. Ingestion updates the
+    counts in memory as batches are added or deleted, and they are saved to a
+    small JSON file once per document or job (see flushing_stats), so reading
+    it never touches the vector store. If the file was written by another
+    process (e.g. the bulk CLI), it is reloaded on the next access.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._collections: Dict[str, Dict[str, Any]] = {}
+        self._mtime: Optional[float] = None
+        self._snapshot: Optional[Dict[str, Any]] = None # Built once per change, served to every poll
+        self._dirty = False # Counted in memory, not saved yet
+        self._saved_at = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._load()
+
+    # --- Persistence ---
+    def _load(self):
+        try:
+            self._mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("version") == STATS_VERSION:
+            self._collections = state["collections"]
+            self._snapshot = None
+
+    def _reload_if_changed(self):
+        if self._dirty: # Unsaved counts here are newer (only the writer process ingests)
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": STATS_VERSION, "collections": self._collections}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path) # Atomic swap
+        self._mtime = os.path.getmtime(self.path)
+        self._snapshot = None
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def flush(self):
+        """Saves counts recorded since the last save (end of a document or job)."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _changed(self):
+        self._dirty = True
+        self._snapshot = None
+        if time.monotonic() - self._saved_at >= FLUSH_INTERVAL_SECONDS:
+            self._save()
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    # --- Updates (called by ingestion) ---
+    def _collection(self, name: str) -> Dict[str, Any]:
+        return self._collections.setdefault(name, {
+            "chunks": 0, "bytes": 0, "last_ingested_at": None, "embedding_model": None, "sources": {},
+        })
+
+    def _apply(self, collection: str, source_counts: Dict[str, Tuple[int, int]], sign: int, now: float):
+        entry = self._collection(collection)
+        for source, (chunks, size) in source_counts.items():
+            stats = entry["sources"].setdefault(source, {"chunks": 0, "bytes": 0, "last_ingested_at": None})
+            stats["chunks"] = max(0, stats["chunks"] + sign * chunks)
+            stats["bytes"] = max(0, stats["bytes"] + sign * size)
+            entry["chunks"] = max(0, entry["chunks"] + sign * chunks)
+            entry["bytes"] = max(0, entry["bytes"] + sign * size)
+            if sign > 0:
+                stats["last_ingested_at"] = now
+            elif stats["chunks"] == 0:
+                del entry["sources"][source]
+        if sign > 0:
+            entry["last_ingested_at"] = now
+            entry["embedding_model"] = settings.EMBEDDING_MODEL_NAME
+
+    @staticmethod
+    def _count(chunks: Iterable[Tuple[str, str]]) -> Dict[str, Tuple[int, int]]:
+        counts: Dict[str, Tuple[int, int]] = {}
+        for source, text in chunks:
+            chunks_so_far, bytes_so_far = counts.get(source, (0, 0))
+            counts[source] = (chunks_so_far + 1, bytes_so_far + len(text.encode("utf-8")))
+        return counts
+
+    def record_added(self, collection: str, chunks: Iterable[Tuple[str, str]]):
+        """Counts newly stored chunks, given as (source, text) pairs."""
+        counts = self._count(chunks)
+        if not counts:
+            return
+        with self._lock:
+            self._reload_if_changed()
+            self._apply(collection, counts, +1, time.time())
+            self._changed()
+
+    def record_deleted(self, collection: str, chunks: Iterable[Tuple[str, str]]):
+        """Un-counts deleted chunks, given as (source, text) pairs."""
+        counts = self._count(chunks)
+        if not counts:
+            return
+        with self._lock:
+            self._reload_if_changed()
+            self._apply(collection, counts, -1, time.time())
+            self._changed()
+
+    def rebuild(self, vector_stores: Dict[str, Any], batch_size: int = 1000):
+        """Recounts every collection from the stored chunks (first start, or after drift)."""
+        collections: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            previous, self._collections = self._collections, collections
+            try:
+                for name, vector_db in vector_stores.items():
+                    self._collection(name)
+                    offset = 0
+                    while True:
+                        page = vector_db.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+                        if not page["ids"]:
+                            break
+                        pairs = (((m or {}).get("source", "N/A"), t or "") for t, m in zip(page["documents"], page["metadatas"]))
+                        self._apply(name, self._count(pairs), +1, None)
+                        offset += len(page["ids"])
+                    collections[name]["last_ingested_at"] = previous.get(name, {}).get("last_ingested_at")
+                    for source, stats in collections[name]["sources"].items():
+                        stats["last_ingested_at"] = previous.get(name, {}).get("sources", {}).get(source, {}).get("last_ingested_at")
+            except Exception:
+                self._collections = previous
+                raise
+            self._save()
+        print(f"Collection stats rebuilt for {len(collections)} collection(s).")
+
+    # --- Reads ---
+    def summary(self) -> Dict[str, Any]:
+        """The current summary (shared; do not modify). Rebuilt only when something changed."""
+        with self._lock:
+            self._reload_if_changed()
+            if self._snapshot is None:
+                collections = copy.deepcopy(self._collections)
+                self._snapshot = {
+                    "embedding_model": settings.EMBEDDING_MODEL_NAME,
+                    "document_count": sum(c["chunks"] for c in collections.values()),
+                    "bytes": sum(c["bytes"] for c in collections.values()),
+                    "collections": [
+                        {
+                            "name": name,
+                            "document_count": c["chunks"],
+                            "bytes": c["bytes"],
+                            "last_ingested_at": c["last_ingested_at"],
+                            "embedding_model": c["embedding_model"],
+                            "source_count": len(c["sources"]),
+                            "sources": c["sources"],
+                        }
+                        for name, c in sorted(collections.items())
+                    ],
+                }
+            return self._snapshot
+
+
+# --- Shared instance ---
+_collection_stats: Optional[CollectionStats] = None
+_collection_stats_lock = threading.Lock()
+
+def get_collection_stats() -> CollectionStats:
+    global _collection_stats
+    with _collection_stats_lock:
+        if _collection_stats is None:
+            _collection_stats = CollectionStats(settings.COLLECTION_STATS_PATH)
+        return _collection_stats
+
+
+def flushing_stats(func: F) -> F:
+    """Decorator for one unit of ingestion (a document, bulk job, delete or import): saves the stats once it ends."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            get_collection_stats().flush()
+    return wrapper # type: ignore[return-value]
+
+
+def rebuild_collection_stats():
+    """Recounts the summary from every collection in the vector store. Blocking."""
+    from app.core.vector_store import get_vector_store, list_collection_names
+
+    get_collection_stats().rebuild({name: get_vector_store(name) for name in list_collection_names()})
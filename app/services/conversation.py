@@ -0,0 +1,275 @@
+import asyncio
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncContextManager, Callable, Deque, Dict, List, Optional
+
+from langchain.chains import RetrievalQA
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+
+from app.core.config import settings
+from app.core.context_packer import estimate_tokens
+from app.core.metrics import CONVERSATION_EVENTS, RAG_STAGE_SECONDS
+
+# Per-connection conversation state. A prompt gets at most CONVERSATION_TOKEN_BUDGET
+# tokens of history: a running summary plus the last CONVERSATION_WINDOW_TURNS turns.
+# Turns leaving the window are folded into the summary in the background, after the
+# answer was sent, so prompt size stays constant however long the conversation runs.
+
+# A question that leans on earlier turns: opens as a continuation or refers back.
+# Short or imperative questions ("define entropy") are not follow-ups by themselves.
+_FOLLOW_UP_START = re.compile(
+    r"^\s*(and|or|but|so|also|then|what about|how about|why not|how so|elaborate|"
+    r"tell me more|more on|continue|go on|give (me )?another example|what else)\b",
+    re.IGNORECASE,
+)
+# Explicit references to the conversation count anywhere in the question
+_FOLLOW_UP_EXPLICIT = re.compile(r"\b(you said|you mentioned|the above|as above)\b", re.IGNORECASE)
+# Words like "that" or "the last" also open standalone questions ("Show that every DAG...",
+# "Explain the last step of..."), so they only count in short questions
+_FOLLOW_UP_REFERENCE = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|the previous|the last|the same|"
+    r"the former|the latter|earlier|again)\b",
+    re.IGNORECASE,
+)
+_SHORT_QUESTION_WORDS = 6
+# ...or as a pronoun among the first words ("How does it compare to mergesort in practice?")
+_LEADING_PRONOUN = re.compile(r"^\s*(\S+\s+){0,2}(it|its|this|these|those|they|them|their)\b", re.IGNORECASE)
+_MAX_REWRITE_CHARS = 500
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a student and a course assistant.
+Keep the topics, definitions and conclusions a later question could refer back to. Use at most {words} words.
+Reply with the updated summary only.
+
+Current summary:
+{summary}
+
+New exchange:
+Student: {question}
+Assistant: {answer}
+
+Updated summary:"""
+
+REWRITE_PROMPT = """Rewrite the student's follow-up question as a standalone question about the course material,
+resolving references like "it" or "that" from the conversation. Reply with the question only.
+
+{history}Follow-up question: {question}
+Standalone question:"""
+
+
+def is_follow_up(question: str) -> bool:
+    """Cheap check for questions that need the conversation to be understood."""
+    if _FOLLOW_UP_START.match(question) or _FOLLOW_UP_EXPLICIT.search(question):
+        return True
+    if len(question.split()) <= _SHORT_QUESTION_WORDS:
+        return bool(_FOLLOW_UP_REFERENCE.search(question))
+    return bool(_LEADING_PRONOUN.match(question))
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars - 3)
+    return text[:cut if cut > 0 else max_chars - 3] + "..."
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    match = re.search(r"(?<=[.!?])\s", text)
+    return _clip(text[:match.start()] if match else text, max_chars)
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+
+
+class ConversationMemory:
+    """
+    Bounded history of one chat connection: a rolling window of recent turns and
+    an incrementally updated summary of everything before it.
+    """
+
+    def __init__(
+        self,
+        window_turns: int = 4,
+        token_budget: int = 600,
+        summary_tokens: int = 200,
+        summary_mode: str = "llm",
+        rewrite_mode: str = "heuristic",
+        chars_per_token: float = 4.0,
+    ):
+        self.window_turns = max(1, window_turns)
+        self.summary_mode = summary_mode
+        self.rewrite_mode = rewrite_mode
+        self.chars_per_token = chars_per_token
+        self.budget_chars = int(token_budget * chars_per_token)
+        self.summary_chars = min(int(summary_tokens * chars_per_token), self.budget_chars // 2)
+        self.summary_words = max(20, int(summary_tokens * 0.75))
+        self.summary = ""
+        self.turns: Deque[Turn] = deque()
+        self.pending: Deque[Turn] = deque() # Left the window, not folded into the summary yet
+        self.topic: Optional[str] = None # Last question that was not a follow-up (or LLM rewrite)
+        self._fold_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_settings(cls) -> "ConversationMemory":
+        return cls(
+            window_turns=settings.CONVERSATION_WINDOW_TURNS,
+            token_budget=settings.CONVERSATION_TOKEN_BUDGET,
+            summary_tokens=settings.CONVERSATION_SUMMARY_TOKENS,
+            summary_mode=settings.CONVERSATION_SUMMARY_MODE,
+            rewrite_mode=settings.CONVERSATION_REWRITE_MODE,
+            chars_per_token=settings.CONTEXT_CHARS_PER_TOKEN,
+        )
+
+    @property
+    def empty(self) -> bool:
+        return not (self.summary or self.turns or self.pending)
+
+    # --- Prompt history ---
+    def render(self) -> str:
+        """History for the QA prompt, within the token budget ("" before the first turn)."""
+        if self.empty:
+            return ""
+        turns = list(self.pending) + list(self.turns)
+        remaining = self.budget_chars - len(self.summary)
+        per_turn = max(80, remaining // self.window_turns) # Recent turns share what the summary leaves
+        lines: List[str] = []
+        for turn in reversed(turns): # Newest first: older turns are dropped when the budget runs out
+            text = f"Student: {_clip(turn.question, per_turn // 3)}\nAssistant: {_clip(turn.answer, per_turn)}"
+            if len(text) > remaining:
+                break
+            lines.append(text)
+            remaining -= len(text)
+        parts = ["Conversation so far (use it only to understand the question; answer from the context):"]
+        if self.summary:
+            parts.append(f"Summary of earlier turns: {self.summary}")
+        parts.extend(reversed(lines))
+        return "\n".join(parts) + "\n\n"
+
+    def history_tokens(self, history: str) -> int:
+        return estimate_tokens(history, self.chars_per_token)
+
+    # --- Query rewrite ---
+    async def standalone_question(
+        self, question: str, llm: Any = None, slot: Optional[Callable[[], AsyncContextManager]] = None
+    ) -> str:
+        """
+        The query retrieval should run with. Follow-ups get the conversation's
+        topic prepended ("heuristic") or are rewritten by the LLM ("llm"), so the
+        retriever sees what "that" refers to. Other questions are returned as-is.
+        `slot`, if given, returns the concurrency slot held during the LLM call.
+        """
+        if self.rewrite_mode == "off":
+            return question
+        if self.topic is None or not is_follow_up(question):
+            self.topic = _clip(question, _MAX_REWRITE_CHARS) # Heuristic rewrites anchor on the last new topic
+            return question
+        start = time.perf_counter()
+        standalone = None
+        if self.rewrite_mode == "llm" and llm is not None:
+            try:
+                prompt = REWRITE_PROMPT.format(history=self.render(), question=question)
+                if slot is None:
+                    response = await llm.ainvoke(prompt)
+                else:
+                    async with slot():
+                        response = await llm.ainvoke(prompt)
+                standalone = _clip(str(response.content).strip(), _MAX_REWRITE_CHARS)
+                if standalone:
+                    self.topic = standalone
+                    CONVERSATION_EVENTS.inc(event="rewrite_llm")
+            except Exception as e:
+                print(f"!!! Query rewrite failed, prepending the topic instead: {e}")
+                CONVERSATION_EVENTS.inc(event="rewrite_failed")
+        if not standalone:
+            standalone = f"{self.topic} {question}"
+            CONVERSATION_EVENTS.inc(event="rewrite_heuristic")
+        RAG_STAGE_SECONDS.observe(time.perf_counter() - start, stage="query_rewrite")
+        return standalone
+
+    # --- Recording turns ---
+    def record(self, question: str, answer: str, llm: Any = None):
+        """Adds a finished turn; turns pushed out of the window are summarized in the background."""
+        self.turns.append(Turn(_clip(question, self.budget_chars // 2), _clip(answer, self.budget_chars)))
+        while len(self.turns) > self.window_turns:
+            self.pending.append(self.turns.popleft())
+        while len(self.pending) > self.window_turns: # Summaries lagging far behind: catch up without the LLM
+            self._fold_extractive(self.pending.popleft())
+        if self.pending and (self._fold_task is None or self._fold_task.done()):
+            try:
+                self._fold_task = asyncio.get_running_loop().create_task(self._fold_pending(llm))
+            except RuntimeError: # No event loop (sync caller)
+                while self.pending:
+                    self._fold_extractive(self.pending.popleft())
+
+    async def _fold_pending(self, llm: Any):
+        while self.pending:
+            turn = self.pending[0]
+            summary = None
+            if self.summary_mode == "llm" and llm is not None:
+                try:
+                    prompt = SUMMARY_PROMPT.format(
+                        words=self.summary_words, summary=self.summary or "(none)",
+                        question=turn.question, answer=turn.answer,
+                    )
+                    summary = _clip(str((await llm.ainvoke(prompt)).content).strip(), self.summary_chars)
+                    CONVERSATION_EVENTS.inc(event="summary_llm")
+                except Exception as e:
+                    print(f"!!! Conversation summary failed, keeping an extractive summary: {e}")
+                    CONVERSATION_EVENTS.inc(event="summary_failed")
+            if self.pending and self.pending[0] is turn: # Not already folded by record() meanwhile
+                self.pending.popleft()
+                if summary:
+                    self.summary = summary
+                else:
+                    self._fold_extractive(turn)
+
+    def _fold_extractive(self, turn: Turn):
+        """Appends "question - first sentence of the answer", dropping the oldest lines past the cap."""
+        line = f"{_clip(turn.question, 120)} - {_first_sentence(turn.answer, 160)}"
+        lines = [l for l in self.summary.split(" | ") if l] + [line]
+        while len(lines) > 1 and len(" | ".join(lines)) > self.summary_chars:
+            lines.pop(0)
+        self.summary = _clip(" | ".join(lines), self.summary_chars)
+        CONVERSATION_EVENTS.inc(event="summary_extractive")
+
+    def close(self):
+        """Stops a background summary (the connection is gone)."""
+        if self._fold_task is not None:
+            self._fold_task.cancel()
+
+
+class ConversationalRetrievalQA(RetrievalQA):
+    """
+    RetrievalQA that retrieves with `retrieval_query` (the standalone question)
+    and passes `history` to the prompt. Both inputs are optional: without them
+    it behaves exactly like RetrievalQA.
+    """
+
+    def _call(
+        self, inputs: Dict[str, Any], run_manager: Optional[CallbackManagerForChainRun] = None
+    ) -> Dict[str, Any]:
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question = inputs[self.input_key]
+        docs = self._get_docs(inputs.get("retrieval_query") or question, run_manager=_run_manager)
+        answer = self.combine_documents_chain.run(
+            input_documents=docs, question=question, history=inputs.get("history", ""),
+            callbacks=_run_manager.get_child(),
+        )
+        return {self.output_key: answer, "source_documents": docs} if self.return_source_documents else {self.output_key: answer}
+
+    async def _acall(
+        self, inputs: Dict[str, Any], run_manager: Optional[AsyncCallbackManagerForChainRun] = None
+    ) -> Dict[str, Any]:
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        question = inputs[self.input_key]
+        docs = await self._aget_docs(inputs.get("retrieval_query") or question, run_manager=_run_manager)
+        answer = await self.combine_documents_chain.arun(
+            input_documents=docs, question=question, history=inputs.get("history", ""),
+            callbacks=_run_manager.get_child(),
+        )
+        return {self.output_key: answer, "source_documents": docs} if self.return_source_documents else {self.output_key: answer}
@@ -1,104 +1,259 @@
 import os
 import shutil
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 
-from langchain_community.document_loaders import (
-    UnstructuredFileLoader,
-    DirectoryLoader,
-    TextLoader,
-    PyPDFLoader
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
 
+from app.core import store_sync
 from app.core.config import settings
-from app.core.vector_store import get_vector_store, get_embedding_function # Assuming these still work
+from app.core.vector_store import (
+    add_with_embeddings, collection_name_of, delete_by_ids, get_embedding_function, get_vector_store, update_metadatas,
+)
+from app.core.lexical_index import get_lexical_index
+from app.core.metrics import INGEST_CHUNKS_TOTAL, INGEST_STAGE_SECONDS, observe_stage
+from app.services.answer_cache import get_answer_cache
+from app.services.collection_stats import flushing_stats, get_collection_stats
+from app.services.document_loader import ( # Re-exported for existing imports
+    iter_document_chunks,
+    load_and_split_document,
+    make_chunk_id,
+    prepare_chunk,
+    prepare_chunks,
+)
 
-# --- Keep load_and_split_document as it was ---
-def load_and_split_document(file_path: str) -> List[Document]:
-    """Loads a document and splits it into chunks."""
-    print(f"Loading document: {file_path}")
-    file_extension = Path(file_path).suffix.lower()
+def get_existing_ids(vector_db, ids: List[str]) -> set:
+    """Returns the subset of `ids` already present in the vector store."""
+    if not ids:
+        return set()
+    return set(vector_db.get(ids=ids, include=[])["ids"])
 
-    try:
-        if file_extension == ".pdf":
-            loader = PyPDFLoader(file_path)
-        elif file_extension == ".txt":
-            loader = TextLoader(file_path, encoding='utf-8')
-        else:
-             loader = UnstructuredFileLoader(file_path, mode="single", strategy="fast")
 
-        documents = loader.load()
+def get_source_chunks(vector_db, source: str) -> Dict[str, dict]:
+    """Chunk ID -> metadata of every stored chunk of one source document."""
+    stored = vector_db.get(where={"source": source}, include=["metadatas"])
+    return {chunk_id: metadata or {} for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])}
 
-        if not documents:
-             print(f"Warning: No content loaded from {file_path}")
-             return []
 
-    except Exception as e:
-        print(f"Error loading {file_path}: {e}")
+def delete_chunks(vector_db, chunk_ids: List[str], batch_size: Optional[int] = None) -> int:
+    """
+    Removes chunks from the vector store and the BM25 index and drops the
+    collection's cached answers. Other chunks (and their HNSW entries) are untouched.
+    """
+    if not chunk_ids:
+        return 0
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    collection = collection_name_of(vector_db)
+    with observe_stage(INGEST_STAGE_SECONDS, "delete"):
+        for i in range(0, len(chunk_ids), batch_size):
+            batch = chunk_ids[i:i + batch_size]
+            found = vector_db.get(ids=batch, include=["documents", "metadatas"]) # Sizes for the stats summary
+            delete_by_ids(vector_db, batch)
+            get_collection_stats().record_deleted(
+                collection,
+                (((metadata or {}).get("source", "N/A"), text or "") for text, metadata in zip(found["documents"], found["metadatas"])),
+            )
+        get_lexical_index(collection).delete(chunk_ids)
+    get_answer_cache().invalidate(collection)
+    store_sync.bump(collection)
+    INGEST_CHUNKS_TOTAL.inc(len(chunk_ids), result="deleted")
+    return len(chunk_ids)
+
+
+@flushing_stats
+def delete_document(source: str, collection_name: Optional[str] = None) -> int:
+    """Deletes every chunk of `source` from a collection. Returns the number of chunks removed."""
+    vector_db = get_vector_store(collection_name)
+    chunk_ids = list(get_source_chunks(vector_db, source))
+    deleted = delete_chunks(vector_db, chunk_ids)
+    print(f"Deleted {deleted} chunks of {source} from '{collection_name_of(vector_db)}'.")
+    return deleted
+
+
+def finish_replace(vector_db, stored: Dict[str, dict], kept: Dict[str, dict]) -> int:
+    """
+    Completes a replace-on-upload once every new chunk is stored: deletes the
+    stored chunks that are not in the new version, and refreshes the metadata
+    (page, start_index) of unchanged chunks that moved. Returns chunks deleted.
+    """
+    moved = [chunk_id for chunk_id, metadata in kept.items() if stored.get(chunk_id) != metadata]
+    for i in range(0, len(moved), settings.EMBEDDING_BATCH_SIZE):
+        batch = moved[i:i + settings.EMBEDDING_BATCH_SIZE]
+        update_metadatas(vector_db, batch, [kept[chunk_id] for chunk_id in batch]) # No re-embedding
+    if moved:
+        store_sync.bump(collection_name_of(vector_db))
+    return delete_chunks(vector_db, [chunk_id for chunk_id in stored if chunk_id not in kept])
+
+
+def add_embedded_chunks(
+    vector_db,
+    ids: List[str],
+    texts: List[str],
+    embeddings: List[List[float]],
+    metadatas: List[dict],
+):
+    """
+    Stores new chunks whose embeddings are already computed and updates the
+    BM25 index, the collection stats and the answer cache to match.
+    """
+    collection = collection_name_of(vector_db)
+    with observe_stage(INGEST_STAGE_SECONDS, "add"):
+        add_with_embeddings(vector_db, ids, texts, embeddings, metadatas)
+        get_lexical_index(collection).add(zip(ids, texts))
+    INGEST_CHUNKS_TOTAL.inc(len(ids), result="added")
+    get_collection_stats().record_added(collection, (((m or {}).get("source", "N/A"), t) for t, m in zip(texts, metadatas)))
+    get_answer_cache().invalidate(collection) # Cached answers from this course may now be stale
+
+
+def store_chunks(
+    vector_db,
+    unique_chunks: Dict[str, Document],
+    batch_size: int,
+    progress: Optional[Callable[..., None]] = None,
+) -> Tuple[int, int]:
+    """
+    Adds the chunks whose IDs are not stored yet, in batches of `batch_size`.
+    `progress`, if given, is called with chunks_done/chunks_total/batches_done/batches_total
+    keyword counters after each batch. Returns (chunks added, chunks in failed batches).
+    """
+    # Skip chunks that are already stored (re-uploads of the same or a lightly edited file)
+    all_ids = list(unique_chunks.keys())
+    existing_ids = set()
+    for i in range(0, len(all_ids), batch_size):
+        existing_ids |= get_existing_ids(vector_db, all_ids[i:i + batch_size])
+    new_ids = [chunk_id for chunk_id in all_ids if chunk_id not in existing_ids]
+    if existing_ids:
+        print(f"  {len(existing_ids)} of {len(all_ids)} chunks already stored, skipping them.")
+        INGEST_CHUNKS_TOTAL.inc(len(existing_ids), result="skipped")
+
+    total_chunks = len(new_ids)
+    total_batches = (total_chunks + batch_size - 1) // batch_size
+    added = 0
+    failed = 0
+    collection = collection_name_of(vector_db)
+    embeddings = get_embedding_function()
+    if progress:
+        progress(chunks_done=len(existing_ids), chunks_total=len(all_ids), batches_done=0, batches_total=total_batches)
+    for i in range(0, total_chunks, batch_size):
+        batch_ids = new_ids[i:i + batch_size]
+        batch = [unique_chunks[chunk_id] for chunk_id in batch_ids]
+        print(f"  Adding batch {i//batch_size + 1}/{total_batches} ({len(batch)} chunks)...")
         try:
-             print("Attempting fallback with basic UnstructuredFileLoader...")
-             loader = UnstructuredFileLoader(file_path)
-             documents = loader.load()
-             if not documents:
-                 print(f"Fallback loader also failed for {file_path}")
-                 return []
-        except Exception as fallback_e:
-             print(f"Fallback loader failed for {file_path}: {fallback_e}")
-             return []
-
-    print(f"Splitting document sections...") # Removed count here as it might not be accurate pre-split
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.CHUNK_SIZE,
-        chunk_overlap=settings.CHUNK_OVERLAP,
-        length_function=len,
-    )
-    chunks = text_splitter.split_documents(documents)
-    print(f"Document split into {len(chunks)} chunks.")
-    return chunks
+            texts = [doc.page_content for doc in batch]
+            # Embed and add are separate steps so each can be timed on its own
+            with observe_stage(INGEST_STAGE_SECONDS, "embed"):
+                vectors = embeddings.embed_documents(texts)
+            add_embedded_chunks(vector_db, batch_ids, texts, vectors, [doc.metadata for doc in batch])
+            added += len(batch)
+        except Exception as batch_e:
+            print(f"  !!! Error adding batch starting at index {i}: {batch_e}")
+            failed += len(batch)
+            INGEST_CHUNKS_TOTAL.inc(len(batch), result="failed")
+            # Optionally decide whether to continue with next batch or fail entirely
+            # For now, we'll just log the error and continue
+            # If you want to stop on first batch error, uncomment the next line:
+            # raise batch_e # Re-raise the exception to stop processing
+        if progress:
+            progress(
+                chunks_done=len(existing_ids) + added,
+                chunks_total=len(all_ids),
+                batches_done=i // batch_size + 1,
+                batches_total=total_batches,
+            )
+    if added:
+        store_sync.bump(collection) # Reader workers reload the collection
+    return added, failed
 
 
 # --- Modify process_and_store_document ---
-def process_and_store_document(file_path: str):
-    """Processes a single document and stores it in the vector store in batches."""
-    # Define a reasonable batch size (less than the reported max of 166)
-    # Let's choose 100, but you can tune this.
-    BATCH_SIZE = 100
-    source_filename = Path(file_path).name
+@store_sync.deferred_bumps() # Readers reload once per document, not per batch
+@flushing_stats
+def process_and_store_document(
+    file_path: str,
+    progress: Optional[Callable[..., None]] = None,
+    cleanup: bool = True,
+    source_name: Optional[str] = None,
+    collection_name: Optional[str] = None,
+    replace: bool = False,
+) -> bool:
+    """
+    Processes a single document and stores it in the vector store in batches.
+    Pages are loaded, split, embedded and stored as a stream: at most one batch
+    of chunks (plus the page being split) is in memory, whatever the document size.
+    `source_name` is the name recorded on the chunks (defaults to the file name;
+    uploads are saved under unique temp names, so they pass the original one).
+    `collection_name` is the course collection to store into (default CHROMA_COLLECTION_NAME).
+    With `replace`, this is a new version of an already stored source: chunks are
+    diffed by their content-addressed IDs, only new chunks are embedded and added,
+    and chunks missing from the new version are deleted once everything is stored.
+    Returns False if the document could not be loaded or any batch failed to store.
+    With `cleanup=False` the file is kept (the job queue removes it after the last attempt).
+    """
+    batch_size = settings.EMBEDDING_BATCH_SIZE
+    source_filename = source_name or Path(file_path).name
 
     try:
-        # 1. Load and Split
-        chunks = load_and_split_document(file_path)
-        if not chunks:
-            print(f"Skipping storing for {file_path} due to loading/splitting issues.")
-            return False
+        # 1. Get Vector Store
+        vector_db = get_vector_store(collection_name)
+        print(f"Processing {source_filename} into '{collection_name_of(vector_db)}' in batches of {batch_size}...")
 
-        total_chunks = len(chunks)
-        print(f"Preparing to add {total_chunks} chunks for {source_filename} in batches of {BATCH_SIZE}...")
+        # Chunks of the previous version, if replacing (IDs hash source + text)
+        stored_chunks = get_source_chunks(vector_db, source_filename) if replace else {}
+        kept: Dict[str, dict] = {}
 
-        # Add source metadata to each chunk
-        for chunk in chunks:
-            chunk.metadata["source"] = source_filename
+        # 2. Load, split and store page by page
+        pending: Dict[str, Document] = {}
+        seen = 0
+        stored = 0
+        added_total = 0
+        failed_total = 0
+        batches_done = 0
 
-        # 2. Get Vector Store
-        vector_db = get_vector_store()
+        def flush():
+            nonlocal pending, stored, added_total, failed_total, batches_done
+            added, failed = store_chunks(vector_db, pending, batch_size)
+            added_total += added
+            failed_total += failed
+            stored += len(pending) - failed
+            batches_done += 1
+            pending = {}
+            if progress: # Totals are unknown (0) until the whole document has been read
+                progress(chunks_done=stored, chunks_total=0, batches_done=batches_done, batches_total=0)
 
-        # 3. Add to Vector Store IN BATCHES
-        for i in range(0, total_chunks, BATCH_SIZE):
-            batch = chunks[i:i + BATCH_SIZE]
-            print(f"  Adding batch {i//BATCH_SIZE + 1}/{(total_chunks + BATCH_SIZE - 1)//BATCH_SIZE} ({len(batch)} chunks)...")
-            try:
-                vector_db.add_documents(batch)
-            except Exception as batch_e:
-                print(f"  !!! Error adding batch starting at index {i}: {batch_e}")
-                # Optionally decide whether to continue with next batch or fail entirely
-                # For now, we'll just log the error and continue
-                # If you want to stop on first batch error, uncomment the next line:
-                # raise batch_e # Re-raise the exception to stop processing
-
-        print(f"Successfully processed and stored {total_chunks} chunks for: {source_filename}")
+        for chunk in iter_document_chunks(file_path):
+            # Add source metadata and content-addressed IDs to each chunk
+            chunk_id = prepare_chunk(chunk, source_filename)
+            if chunk_id in pending or chunk_id in kept:
+                continue
+            if chunk_id in stored_chunks:
+                kept[chunk_id] = chunk.metadata # Unchanged text: stays in the index as is
+                seen += 1
+                stored += 1
+                continue
+            pending[chunk_id] = chunk
+            seen += 1
+            if len(pending) >= batch_size:
+                flush()
+        if pending:
+            flush()
+        if progress and seen:
+            progress(chunks_done=stored, chunks_total=seen, batches_done=batches_done, batches_total=batches_done)
+        if kept:
+            INGEST_CHUNKS_TOTAL.inc(len(kept), result="skipped")
+
+        if not seen:
+            print(f"Skipping storing for {file_path} due to loading/splitting issues.")
+            return False
+        if failed_total:
+            # The previous version stays complete; a retry finishes the replace
+            print(f"!!! {failed_total} chunks for {source_filename} could not be stored.")
+            return False
+
+        if replace and stored_chunks:
+            deleted = finish_replace(vector_db, stored_chunks, kept)
+            print(f"Replaced {source_filename}: {len(kept)} chunks unchanged, {added_total} added, {deleted} deleted.")
+        print(f"Successfully processed and stored {added_total} chunks for: {source_filename}")
         return True
 
     except Exception as e:
@@ -107,9 +262,10 @@ def process_and_store_document(file_path: str):
         return False
     finally:
         # Clean up the temporary uploaded file
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"Removed temporary file: {file_path}")
-        except Exception as cleanup_e:
-            print(f"Error cleaning up file {file_path}: {cleanup_e}")
\ No newline at end of file
+        if cleanup:
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    print(f"Removed temporary file: {file_path}")
+            except Exception as cleanup_e:
+                print(f"Error cleaning up file {file_path}: {cleanup_e}")
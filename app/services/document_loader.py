@@ -0,0 +1,127 @@
+import hashlib
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from langchain_community.document_loaders import (
+    UnstructuredFileLoader,
+    TextLoader,
+    PyPDFLoader
+)
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.core.embedding_cache import content_hash
+from app.core.metrics import INGEST_STAGE_SECONDS
+
+# Parsing and splitting only: this module must stay importable without loading
+# the embedding model or opening the vector store, so it can run in worker processes.
+
+SUPPORTED_EXTENSIONS = {".pdf", ".txt", ".md", ".docx", ".doc", ".pptx", ".html"}
+
+
+def _make_loader(file_path: str):
+    file_extension = Path(file_path).suffix.lower()
+    if file_extension == ".pdf":
+        return PyPDFLoader(file_path)
+    elif file_extension == ".txt":
+        return TextLoader(file_path, encoding='utf-8')
+    else:
+        return UnstructuredFileLoader(file_path, mode="single", strategy="fast")
+
+
+def _make_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        length_function=len,
+        add_start_index=True, # Lets context packing merge overlapping/adjacent chunks exactly
+    )
+
+
+def _split_pages(loader, splitter, timings: Dict[str, float]) -> Iterator[Document]:
+    pages = loader.lazy_load()
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        timings["load"] += time.perf_counter() - start
+        if page is None:
+            return
+        start = time.perf_counter()
+        chunks = splitter.split_documents([page])
+        timings["split"] += time.perf_counter() - start
+        yield from chunks
+
+
+def iter_document_chunks(file_path: str) -> Iterator[Document]:
+    """
+    Loads and splits a document page by page (lazy_load), yielding chunks as
+    each page is split, so only one page is held in memory at a time.
+    If the primary loader fails before producing anything, the basic
+    UnstructuredFileLoader is tried; a failure mid-document is raised.
+    """
+    print(f"Loading document: {file_path}")
+    splitter = _make_splitter()
+    timings = {"load": 0.0, "split": 0.0}
+    produced = 0
+    try:
+        try:
+            for chunk in _split_pages(_make_loader(file_path), splitter, timings):
+                produced += 1
+                yield chunk
+        except Exception as e:
+            if produced:
+                raise
+            print(f"Error loading {file_path}: {e}")
+            print("Attempting fallback with basic UnstructuredFileLoader...")
+            try:
+                for chunk in _split_pages(UnstructuredFileLoader(file_path), splitter, timings):
+                    produced += 1
+                    yield chunk
+            except Exception as fallback_e:
+                if produced:
+                    raise
+                print(f"Fallback loader failed for {file_path}: {fallback_e}")
+                return
+    finally:
+        INGEST_STAGE_SECONDS.observe(timings["load"], stage="load")
+        INGEST_STAGE_SECONDS.observe(timings["split"], stage="split")
+
+    if not produced:
+        print(f"Warning: No content loaded from {file_path}")
+    else:
+        print(f"Document split into {produced} chunks.")
+
+
+def load_and_split_document(file_path: str) -> List[Document]:
+    """Loads a document and splits it into chunks."""
+    return list(iter_document_chunks(file_path))
+
+
+def make_chunk_id(source: str, text: str) -> str:
+    """Deterministic chunk ID: the same text from the same source always maps to the same ID."""
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def prepare_chunk(chunk: Document, source_filename: str) -> str:
+    """Tags one chunk with its source and content hash and returns its chunk ID."""
+    chunk.metadata["source"] = source_filename
+    chunk.metadata["content_hash"] = content_hash(chunk.page_content)
+    return make_chunk_id(source_filename, chunk.page_content)
+
+
+def prepare_chunks(chunks: List[Document], source_filename: str) -> Dict[str, Document]:
+    """
+    Tags chunks with their source and content hash and keys them by chunk ID.
+    Identical chunks within the same source collapse to one entry.
+    """
+    unique_chunks: Dict[str, Document] = {}
+    for chunk in chunks:
+        unique_chunks.setdefault(prepare_chunk(chunk, source_filename), chunk)
+    return unique_chunks
+
+
+def parse_file(file_path: str, source_filename: str) -> Dict[str, Document]:
+    """Load + split + prepare in one call; the unit of work for the bulk ingestion process pool."""
+    return prepare_chunks(load_and_split_document(file_path), source_filename)
@@ -0,0 +1,142 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+@dataclass(frozen=True)
+class LatencyProfile:
+    """How a hosted model's answers arrive over time (one word counts as one token)."""
+    ttft_seconds: float # Median time to first token for a short prompt
+    ttft_sigma: float # Log-normal spread of TTFT (0: constant)
+    prefill_tokens_per_second: float # Prompt processing rate; long contexts delay the first token
+    tokens_per_second: float # Output rate once streaming
+    tokens_per_chunk: int # Tokens per streamed chunk (Gemini sends text in bursts, not word by word)
+    answer_tokens: Tuple[int, int] # Answer length range, sampled uniformly
+
+
+# Rough published/observed figures for the hosted API; tune them to your own measurements
+PROFILES = {
+    "gemini-flash": LatencyProfile(0.45, 0.35, 20000.0, 160.0, 12, (80, 350)),
+    "gemini-pro": LatencyProfile(1.1, 0.4, 8000.0, 60.0, 12, (120, 500)),
+}
+
+
+class SimulatedLLMError(RuntimeError):
+    """Injected failure (FAKE_LLM_ERROR_RATE), standing in for quota or 5xx errors."""
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Local stand-in for Gemini. Streams a canned answer word by word so the
+    streaming path can be exercised without network access or API keys.
+    Select it with LLM_MODEL_NAME="fake".
+    With a `profile` it instead imitates the hosted model's timing: a TTFT that
+    grows with the prompt, then answers of realistic length streamed in chunks
+    at the profile's token rate, so load tests see production-like latencies.
+    """
+    response: str = (
+        "This is a placeholder answer from the local fake model. "
+        "It is based on the retrieved course material."
+    )
+    token_delay: float = 0.02  # Seconds between streamed tokens
+    profile: Optional[LatencyProfile] = None
+    error_rate: float = 0.0 # Fraction of calls that fail before the first token
+
+    @classmethod
+    def from_profile(cls, name: str, error_rate: float = 0.0) -> "FakeStreamingChatModel":
+        """The model for a FAKE_LLM_PROFILE name: "fixed" (canned answer) or a key of PROFILES."""
+        if name == "fixed":
+            return cls(error_rate=error_rate)
+        if name not in PROFILES:
+            raise ValueError(f"Unknown fake LLM profile '{name}' (use fixed, {', '.join(PROFILES)})")
+        return cls(profile=PROFILES[name], error_rate=error_rate)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _tokens(self) -> List[str]:
+        words = self.response.split(" ")
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def _plan(self, messages: List[BaseMessage]) -> Tuple[float, List[str], float]:
+        """(delay before the first chunk, chunks, delay between chunks) for one call."""
+        if self.error_rate and random.random() < self.error_rate:
+            raise SimulatedLLMError("Simulated LLM failure (429 Resource has been exhausted)")
+        if self.profile is None:
+            return self.token_delay, self._tokens(), self.token_delay
+        profile = self.profile
+        prompt = " ".join(str(m.content) for m in messages)
+        ttft = profile.ttft_seconds * random.lognormvariate(0, profile.ttft_sigma) if profile.ttft_sigma else profile.ttft_seconds
+        ttft += len(prompt.split()) / profile.prefill_tokens_per_second
+        # Words of the prompt as vocabulary: answers look like course text and vary in size
+        vocabulary = prompt.split()[-400:] or self.response.split()
+        words = random.choices(vocabulary, k=random.randint(*profile.answer_tokens))
+        chunks = [
+            (" " if i else "") + " ".join(words[i:i + profile.tokens_per_chunk])
+            for i in range(0, len(words), profile.tokens_per_chunk)
+        ]
+        return ttft, chunks, profile.tokens_per_chunk / profile.tokens_per_second
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        first_delay, chunks, delay = self._plan(messages)
+        time.sleep(first_delay + delay * (len(chunks) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(chunks)))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Sleeps on the event loop like _astream: concurrent calls never queue for executor threads
+        first_delay, chunks, delay = self._plan(messages)
+        await asyncio.sleep(first_delay + delay * (len(chunks) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(chunks)))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        first_delay, chunks, delay = self._plan(messages)
+        for i, token in enumerate(chunks):
+            time.sleep(first_delay if i == 0 else delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        first_delay, chunks, delay = self._plan(messages)
+        for i, token in enumerate(chunks):
+            await asyncio.sleep(first_delay if i == 0 else delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
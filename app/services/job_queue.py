@@ -0,0 +1,336 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import INGEST_JOBS
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Job kinds
+KIND_DOCUMENT = "document" # One uploaded file
+KIND_BULK = "bulk"         # A directory of uploaded files/archives
+KIND_DELETE = "delete"     # Delete a source's chunks (queued by reader workers)
+KIND_STATS = "stats"       # Recount the collection stats (queued by reader workers)
+KIND_SNAPSHOT_EXPORT = "snapshot_export" # Write collections to a bundle in SNAPSHOT_DIR
+KIND_SNAPSHOT_IMPORT = "snapshot_import" # Bulk-load an uploaded bundle without re-embedding
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    source TEXT NOT NULL,
+    collection TEXT,
+    replace_existing INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    chunks_done INTEGER NOT NULL DEFAULT 0,
+    chunks_total INTEGER NOT NULL DEFAULT 0,
+    batches_done INTEGER NOT NULL DEFAULT 0,
+    batches_total INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at);
+"""
+
+# Columns added after the first release: created in place on older job databases
+_ADDED_COLUMNS = {
+    "collection": "TEXT",
+    "replace_existing": "INTEGER NOT NULL DEFAULT 0",
+}
+
+ProgressCallback = Callable[..., None]
+
+
+class JobQueue:
+    """
+    Persistent ingestion job queue backed by SQLite.
+    Jobs survive restarts (running jobs are re-queued on startup), run on a
+    bounded pool of INGEST_WORKERS threads separate from FastAPI's threadpool,
+    and are retried with jittered exponential backoff up to INGEST_MAX_ATTEMPTS.
+    Any worker process may enqueue; only the writer worker starts the queue and runs jobs.
+    """
+
+    def __init__(self, db_path: str, workers: int, max_attempts: int):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in _ADDED_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived autocommit connection per operation: safe across threads and processes
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["replace_existing"] = bool(job.get("replace_existing"))
+        total = job["chunks_total"]
+        if total:
+            job["progress"] = round(job["chunks_done"] / total, 4)
+        else: # A running job with no total yet (streaming ingestion) has indeterminate progress
+            job["progress"] = None if job["status"] == RUNNING else 0.0
+        return job
+
+    # --- Job table operations ---
+    def enqueue(
+        self, kind: str, file_path: str, source: str, collection: Optional[str] = None, replace: bool = False
+    ) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, file_path, source, collection, replace_existing, status, max_attempts,"
+                " created_at, available_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, file_path, source, collection, int(replace), QUEUED, self.max_attempts, now, now, now),
+            )
+        print(f"Queued {kind} job {job_id} for {source}")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM jobs"
+        params: Tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._connect() as conn:
+            rows = conn.execute(query, (*params, limit)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically moves the oldest runnable queued job to RUNNING and returns it."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND available_at <= ?"
+                    " ORDER BY created_at LIMIT 1",
+                    (QUEUED, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?,"
+                        " error = NULL, updated_at = ? WHERE id = ?",
+                        (RUNNING, now, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._row_to_dict(row)
+        job["attempts"] += 1
+        return job
+
+    def recover(self) -> int:
+        """Re-queues jobs left RUNNING by a previous process (crash or restart)."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, updated_at = ? WHERE status = ?",
+                (QUEUED, now, now, RUNNING),
+            )
+        if cursor.rowcount:
+            print(f"Re-queued {cursor.rowcount} interrupted ingestion job(s).")
+        return cursor.rowcount
+
+    # --- Execution ---
+    def _progress_callback(self, job_id: str) -> ProgressCallback:
+        def report(**counters):
+            self._update(job_id, **counters)
+        return report
+
+    def _run_job(self, job: Dict[str, Any]):
+        """Runs one job to completion on an ingestion thread and records the outcome."""
+        from app.services.bulk_ingest import ingest_paths
+        from app.services.collection_stats import rebuild_collection_stats
+        from app.services.data_processor import delete_document, process_and_store_document
+        from app.services.snapshot import export_snapshot, import_snapshot
+
+        job_id = job["id"]
+        print(f"Running {job['kind']} job {job_id} ({job['source']}), attempt {job['attempts']}/{job['max_attempts']}")
+        progress = self._progress_callback(job_id)
+        ok, result, error = False, None, None
+        try:
+            if job["kind"] == KIND_DOCUMENT:
+                ok = process_and_store_document(
+                    job["file_path"], progress=progress, cleanup=False,
+                    source_name=job["source"], collection_name=job["collection"],
+                    replace=job["replace_existing"],
+                )
+                if not ok:
+                    error = "Document could not be loaded or not all chunks were stored."
+            elif job["kind"] == KIND_BULK:
+                result = ingest_paths([job["file_path"]], progress=progress, collection_name=job["collection"])
+                ok = result["files"] > 0 and not result["chunks_failed"]
+                if not ok:
+                    error = "No files could be ingested or not all chunks were stored."
+            elif job["kind"] == KIND_DELETE:
+                result = {"chunks_deleted": delete_document(job["source"], job["collection"])}
+                ok = True
+            elif job["kind"] == KIND_STATS:
+                rebuild_collection_stats()
+                ok = True
+            elif job["kind"] in (KIND_SNAPSHOT_EXPORT, KIND_SNAPSHOT_IMPORT):
+                collections = job["collection"].split(",") if job["collection"] else None
+                if job["kind"] == KIND_SNAPSHOT_EXPORT:
+                    manifest = export_snapshot(os.path.join(settings.SNAPSHOT_DIR, job["source"]), collections, progress)
+                    result = {"path": os.path.join(settings.SNAPSHOT_DIR, job["source"]), "collections": manifest["collections"]}
+                else:
+                    result = import_snapshot(job["file_path"], collections, progress)
+                ok = True
+            else:
+                error = f"Unknown job kind: {job['kind']}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"!!! Job {job_id} raised: {error}")
+
+        now = time.time()
+        result_json = json.dumps(result) if result is not None else None
+        if ok:
+            self._update(job_id, status=SUCCEEDED, finished_at=now, result=result_json)
+            print(f"Job {job_id} succeeded.")
+        elif job["attempts"] < job["max_attempts"]:
+            backoff = settings.INGEST_RETRY_BACKOFF_SECONDS * (2 ** (job["attempts"] - 1))
+            backoff *= random.uniform(0.5, 1.5) # Jitter
+            self._update(job_id, status=QUEUED, error=error, available_at=now + backoff, result=result_json)
+            print(f"Job {job_id} failed ({error}); retrying in {backoff:.1f}s.")
+            return
+        else:
+            self._update(job_id, status=FAILED, error=error, finished_at=now, result=result_json)
+            print(f"!!! Job {job_id} failed permanently: {error}")
+        self._cleanup(job)
+
+    @staticmethod
+    def _cleanup(job: Dict[str, Any]):
+        """Removes the job's uploaded file or directory once the job is finished."""
+        path = job["file_path"]
+        if not path: # Delete, stats and export jobs have no upload
+            return
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+            print(f"Removed temporary upload: {path}")
+        except Exception as cleanup_e:
+            print(f"Error cleaning up {path}: {cleanup_e}")
+
+    async def _worker_loop(self, worker_index: int):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                job = await loop.run_in_executor(self._executor, self.claim_next)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=settings.INGEST_POLL_INTERVAL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await loop.run_in_executor(self._executor, self._run_job, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"!!! Ingestion worker {worker_index} error: {e}")
+                await asyncio.sleep(settings.INGEST_POLL_INTERVAL_SECONDS)
+
+    async def start(self):
+        """Recovers interrupted jobs and starts the worker tasks. Call from app startup."""
+        if self._tasks:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        self.recover()
+        self._tasks = [asyncio.create_task(self._worker_loop(i)) for i in range(self.workers)]
+        print(f"Ingestion job queue started with {self.workers} worker(s). DB: {self.db_path}")
+
+    async def stop(self):
+        """Stops accepting work. Running jobs finish in their threads; queued jobs stay persisted."""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        print("Ingestion job queue stopped.")
+
+
+# --- Shared instance ---
+job_queue = JobQueue(
+    db_path=settings.JOBS_DB_PATH,
+    workers=settings.INGEST_WORKERS,
+    max_attempts=settings.INGEST_MAX_ATTEMPTS,
+)
+
+def get_job_queue() -> JobQueue:
+    return job_queue
+
+def _job_counts_by_status():
+    counts = job_queue.counts()
+    return [({"status": status}, counts.get(status, 0)) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)]
+
+INGEST_JOBS.add_callback(_job_counts_by_status)
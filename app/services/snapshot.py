@@ -0,0 +1,261 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.collection_stats import flushing_stats
+
+# Snapshot bundle: one zip file that a new or recovering node can load without
+# re-parsing or re-embedding anything.
+#   manifest.json                     format, version, embedding model, dimension, collections
+#   collections/<name>/chunks.jsonl   {"id", "document", "metadata"} per chunk (deflated)
+#   collections/<name>/vectors.npy    float32 [chunks, dimension], same order (stored)
+SNAPSHOT_FORMAT = "course-rag-snapshot"
+SNAPSHOT_VERSION = 1
+_EXPORT_PAGE_ROWS = 1000
+_IMPORT_BATCH_ROWS = 1000
+
+
+def default_snapshot_name() -> str:
+    return f"snapshot-{time.strftime('%Y%m%d-%H%M%S')}.zip"
+
+
+def _member(collection: str, filename: str) -> str:
+    return f"collections/{collection}/{filename}"
+
+
+def _pages(vector_db) -> Iterator[Dict[str, Any]]:
+    offset = 0
+    while True:
+        page = vector_db.get(include=["documents", "metadatas", "embeddings"], limit=_EXPORT_PAGE_ROWS, offset=offset)
+        if not len(page["ids"]):
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def _export_collection(bundle: zipfile.ZipFile, name: str, vector_db, spool_dir: str) -> Dict[str, Any]:
+    """Writes one collection into the bundle. Vectors are spooled to disk: the row count goes in the .npy header."""
+    chunks = 0
+    dimension = None
+    spool_path = os.path.join(spool_dir, f"{name}.f32")
+    with bundle.open(_member(name, "chunks.jsonl"), "w", force_zip64=True) as raw, open(spool_path, "wb") as spool:
+        lines = io.TextIOWrapper(raw, encoding="utf-8")
+        for page in _pages(vector_db):
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            dimension = vectors.shape[1]
+            spool.write(vectors.tobytes())
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                lines.write(json.dumps({"id": chunk_id, "document": text, "metadata": metadata or {}}) + "\n")
+            chunks += len(page["ids"])
+        lines.flush()
+        lines.detach()
+    # Stored, not deflated: float vectors barely compress and this keeps import streaming cheap
+    vectors_info = zipfile.ZipInfo(_member(name, "vectors.npy"), date_time=time.localtime()[:6])
+    with bundle.open(vectors_info, "w", force_zip64=True) as out, open(spool_path, "rb") as spool:
+        np.lib.format.write_array_header_1_0(
+            out, {"descr": "<f4", "fortran_order": False, "shape": (chunks, dimension or 0)}
+        )
+        shutil.copyfileobj(spool, out, 16 * 1024 * 1024)
+    os.remove(spool_path)
+    print(f"  Exported '{name}': {chunks} chunks.")
+    return {"chunks": chunks, "dimension": dimension}
+
+
+def export_snapshot(
+    output_path: str,
+    collections: Optional[List[str]] = None,
+    progress: Optional[Callable[..., None]] = None,
+) -> Dict[str, Any]:
+    """
+    Exports collections (default: all) with their vectors, texts and metadata
+    to a bundle at `output_path`. The file appears only once it is complete.
+    `progress` receives chunks_done/chunks_total/batches_done/batches_total (one batch per collection).
+    Returns the manifest.
+    """
+    from app.core import store_sync
+    from app.core.vector_store import count_chunks, get_vector_store, list_collection_names, resolve_collection_name
+
+    names = [resolve_collection_name(c) for c in collections] if collections else list_collection_names()
+    missing = [name for name in names if name not in list_collection_names()]
+    if missing:
+        raise ValueError(f"Unknown collection(s): {', '.join(missing)}")
+    stores = {name: get_vector_store(name) for name in names}
+    total = sum(count_chunks(store) for store in stores.values())
+
+    start = time.perf_counter()
+    manifest: Dict[str, Any] = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "embedding_model": settings.EMBEDDING_MODEL_NAME,
+        "dimension": None,
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "vector_backend": settings.VECTOR_BACKEND, # Of the exporting node; any backend can import it
+        "collections": {},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    done = 0
+    with tempfile.TemporaryDirectory(prefix="snapshot_") as spool_dir:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as bundle:
+            for i, (name, vector_db) in enumerate(stores.items()):
+                info = _export_collection(bundle, name, vector_db, spool_dir)
+                info["store_version"] = store_sync.version(name) # Change counter at export time
+                manifest["collections"][name] = info
+                manifest["dimension"] = manifest["dimension"] or info["dimension"]
+                done += info["chunks"]
+                if progress:
+                    progress(chunks_done=done, chunks_total=total, batches_done=i + 1, batches_total=len(stores))
+            bundle.writestr("manifest.json", json.dumps(manifest, indent=2))
+    os.replace(tmp_path, output_path) # Atomic: a half-written bundle is never visible
+    size = os.path.getsize(output_path)
+    print(f"Snapshot of {len(stores)} collection(s), {done} chunks written to {output_path} "
+          f"({size / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
+    return manifest
+
+
+def read_manifest(bundle: zipfile.ZipFile) -> Dict[str, Any]:
+    """The bundle's manifest. Raises ValueError if it is not a snapshot this version can load."""
+    try:
+        manifest = json.loads(bundle.read("manifest.json"))
+    except (KeyError, ValueError):
+        raise ValueError("Not a snapshot bundle (no valid manifest.json).")
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot {manifest.get('format')} v{manifest.get('version')} "
+            f"(this version reads {SNAPSHOT_FORMAT} v{SNAPSHOT_VERSION})."
+        )
+    return manifest
+
+
+def _read_rows(bundle: zipfile.ZipFile, name: str) -> Iterator[Tuple[List[dict], np.ndarray]]:
+    """(chunks, vectors) batches of one collection, streamed from the bundle."""
+    with bundle.open(_member(name, "chunks.jsonl")) as raw, bundle.open(_member(name, "vectors.npy")) as vectors_file:
+        lines = io.TextIOWrapper(raw, encoding="utf-8")
+        np.lib.format.read_magic(vectors_file)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(vectors_file)
+        rows, dimension = shape
+        row_bytes = dimension * dtype.itemsize
+        for start in range(0, rows, _IMPORT_BATCH_ROWS):
+            count = min(_IMPORT_BATCH_ROWS, rows - start)
+            vectors = np.frombuffer(vectors_file.read(count * row_bytes), dtype=dtype).reshape(count, dimension)
+            chunks = [json.loads(lines.readline()) for _ in range(count)]
+            yield chunks, vectors
+
+
+@flushing_stats
+def import_snapshot(
+    bundle_path: str,
+    collections: Optional[List[str]] = None,
+    progress: Optional[Callable[..., None]] = None,
+) -> Dict[str, Any]:
+    """
+    Bulk-loads a snapshot bundle into the vector store without re-embedding:
+    collections (default: all in the bundle) are created as needed, chunks
+    already stored are skipped, and the BM25 indexes and collection stats are
+    updated as with normal ingestion. Refuses bundles made with another embedding
+    model. `progress` receives chunks_done/chunks_total/batches_done/batches_total.
+    Returns an import report.
+    """
+    from app.core import store_sync
+    from app.core.vector_store import get_vector_store
+    from app.services.data_processor import add_embedded_chunks, get_existing_ids
+
+    start = time.perf_counter()
+    with zipfile.ZipFile(bundle_path) as bundle:
+        manifest = read_manifest(bundle)
+        if manifest["embedding_model"] != settings.EMBEDDING_MODEL_NAME:
+            raise ValueError(
+                f"Snapshot was embedded with '{manifest['embedding_model']}' but EMBEDDING_MODEL_NAME is "
+                f"'{settings.EMBEDDING_MODEL_NAME}': its vectors are not comparable. Re-ingest the sources instead."
+            )
+        if (manifest.get("chunk_size"), manifest.get("chunk_overlap")) != (settings.CHUNK_SIZE, settings.CHUNK_OVERLAP):
+            print(f"!!! Snapshot was chunked with size {manifest.get('chunk_size')}/overlap {manifest.get('chunk_overlap')}; "
+                  f"re-uploads here will chunk differently and not match its chunk IDs.")
+        names = collections or list(manifest["collections"])
+        missing = [name for name in names if name not in manifest["collections"]]
+        if missing:
+            raise ValueError(f"Collection(s) not in the snapshot: {', '.join(missing)}")
+
+        total = sum(manifest["collections"][name]["chunks"] for name in names)
+        report: Dict[str, Any] = {"collections": {}, "chunks": total, "chunks_added": 0, "chunks_skipped": 0}
+        done = 0
+        batches_done = 0
+        for name in names:
+            vector_db = get_vector_store(name)
+            added = skipped = 0
+            for chunks, vectors in _read_rows(bundle, name):
+                ids = [chunk["id"] for chunk in chunks]
+                existing = get_existing_ids(vector_db, ids) # Re-importing the same bundle is a no-op
+                new = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+                if new:
+                    add_embedded_chunks(
+                        vector_db,
+                        [ids[i] for i in new],
+                        [chunks[i]["document"] for i in new],
+                        vectors[new].tolist(),
+                        [chunks[i]["metadata"] for i in new],
+                    )
+                added += len(new)
+                skipped += len(ids) - len(new)
+                done += len(ids)
+                batches_done += 1
+                if progress:
+                    progress(chunks_done=done, chunks_total=total, batches_done=batches_done,
+                             batches_total=batches_done + (total - done + _IMPORT_BATCH_ROWS - 1) // _IMPORT_BATCH_ROWS)
+            if added:
+                store_sync.bump(name) # Reader workers reload the collection
+            report["collections"][name] = {"chunks_added": added, "chunks_skipped": skipped}
+            report["chunks_added"] += added
+            report["chunks_skipped"] += skipped
+            print(f"  Imported '{name}': {added} chunks added, {skipped} already stored.")
+
+    elapsed = time.perf_counter() - start
+    report.update({
+        "embedding_model": manifest["embedding_model"],
+        "created_at": manifest["created_at"],
+        "elapsed_seconds": round(elapsed, 2),
+        "chunks_per_sec": round(total / elapsed, 2) if elapsed else 0.0,
+    })
+    print(f"Snapshot import finished: {report['chunks_added']} of {total} chunks added in {elapsed:.1f}s "
+          f"({report['chunks_per_sec']} chunks/sec)")
+    return report
+
+
+if __name__ == "__main__":
+    # Examples:
+    #   python -m app.services.snapshot export --output backups/courses.zip --course cs101,ma201
+    #   python -m app.services.snapshot import backups/courses.zip
+    parser = argparse.ArgumentParser(description="Export or import a vector store snapshot bundle.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write collections to a bundle")
+    export_parser.add_argument("--output", default=None, help="Bundle path (default: SNAPSHOT_DIR/snapshot-<time>.zip)")
+    export_parser.add_argument("--course", default=None, help="Comma-separated collections (default: all)")
+    import_parser = commands.add_parser("import", help="Bulk-load a bundle without re-embedding")
+    import_parser.add_argument("bundle")
+    import_parser.add_argument("--course", default=None, help="Comma-separated collections to load (default: all)")
+    args = parser.parse_args()
+    courses = [c for c in (args.course or "").split(",") if c] or None
+
+    from app.core import store_sync
+    is_writer = store_sync.acquire_writer() # Export also works next to a running server, read-only (flat backend)
+    if args.command == "export":
+        if not is_writer and settings.VECTOR_BACKEND != "flat":
+            raise SystemExit("!!! The server's writer worker holds the Chroma store. Export through POST /data/snapshot instead.")
+        output = args.output or os.path.join(settings.SNAPSHOT_DIR, default_snapshot_name())
+        print(json.dumps(export_snapshot(output, courses), indent=2))
+    else:
+        if not is_writer:
+            raise SystemExit("!!! The server's writer worker holds the store. Upload through POST /data/snapshot/import instead.")
+        print(json.dumps(import_snapshot(args.bundle, courses), indent=2))
@@ -0,0 +1 @@
+"""Reproducible ingestion/retrieval benchmarks. Run `python -m benchmarks.run --help`."""
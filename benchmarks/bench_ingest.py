@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Sequence
+
+from app.core.config import settings
+from app.core.embedding_cache import CachedEmbeddings
+from app.services.document_loader import load_and_split_document, prepare_chunks
+
+from benchmarks.corpus import generate_corpus, iter_chunks
+
+
+def _rate(count: float, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds else 0.0
+
+
+def load_model():
+    """The raw (uncached) embedding model from ./embedding_cache, as the app loads it."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    start = time.perf_counter()
+    model = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL_NAME, cache_folder="./embedding_cache")
+    return model, time.perf_counter() - start
+
+
+def bench_load_split(work_dir: str, files: int, doc_chars: int, formats: Sequence[str], seed: int) -> Dict[str, Any]:
+    """load_and_split_document throughput per file format."""
+    results = {}
+    for fmt in formats:
+        paths = generate_corpus(os.path.join(work_dir, f"corpus_{fmt}"), files, doc_chars, fmt, seed)
+        total_bytes = sum(os.path.getsize(p) for p in paths)
+        chunks = 0
+        start = time.perf_counter()
+        for path in paths:
+            chunks += len(load_and_split_document(path))
+        elapsed = time.perf_counter() - start
+        results[fmt] = {
+            "files": files,
+            "bytes": total_bytes,
+            "chunks": chunks,
+            "seconds": round(elapsed, 3),
+            "files_per_sec": _rate(files, elapsed),
+            "chunks_per_sec": _rate(chunks, elapsed),
+            "mb_per_sec": _rate(total_bytes / 1e6, elapsed),
+        }
+    return results
+
+
+def bench_embed(model, chunks: int, batch_sizes: Sequence[int], seed: int) -> Dict[str, Any]:
+    """
+    Raw model throughput at each encode batch size, then the app's on-disk
+    embedding cache cold (all misses) and warm (all hits) at EMBEDDING_BATCH_SIZE.
+    """
+    texts = list(iter_chunks(chunks, settings.CHUNK_SIZE, seed))
+    model.embed_documents(texts[:8]) # First-inference cost is not throughput
+    by_batch = {}
+    for batch_size in batch_sizes:
+        model.encode_kwargs = {**getattr(model, "encode_kwargs", {}), "batch_size": batch_size}
+        start = time.perf_counter()
+        model.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        by_batch[str(batch_size)] = {"seconds": round(elapsed, 3), "chunks_per_sec": _rate(chunks, elapsed)}
+
+    cache_results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_embed_cache_") as cache_dir:
+        cached = CachedEmbeddings(model, settings.EMBEDDING_MODEL_NAME, os.path.join(cache_dir, "cache.sqlite3"))
+        step = settings.EMBEDDING_BATCH_SIZE
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            for i in range(0, len(texts), step):
+                cached.embed_documents(texts[i:i + step])
+            elapsed = time.perf_counter() - start
+            cache_results[label] = {"seconds": round(elapsed, 3), "chunks_per_sec": _rate(chunks, elapsed)}
+    return {"chunks": chunks, "chunk_chars": settings.CHUNK_SIZE, "by_batch_size": by_batch, "cache": cache_results}
+
+
+def bench_add_documents(model, chunks: int, seed: int) -> Dict[str, Any]:
+    """
+    Chroma add_documents throughput (embedding included, as in the app), into a
+    throwaway collection. Embeddings go through a warm cache so the number
+    isolates the store; run bench_embed for model cost.
+    """
+    import chromadb
+    from langchain.schema import Document
+    from langchain_community.vectorstores import Chroma
+
+    texts = list(iter_chunks(chunks, settings.CHUNK_SIZE, seed))
+    store_dir = tempfile.mkdtemp(prefix="bench_add_")
+    try:
+        cached = CachedEmbeddings(model, settings.EMBEDDING_MODEL_NAME, os.path.join(store_dir, "cache.sqlite3"))
+        cached.embed_documents(texts) # Warm the cache
+        client = chromadb.PersistentClient(path=os.path.join(store_dir, "chroma"))
+        vector_db = Chroma(client=client, collection_name="bench_add", embedding_function=cached)
+        docs = prepare_chunks([Document(page_content=t, metadata={"page": 0}) for t in texts], "bench.txt")
+        ids: List[str] = list(docs.keys())
+        batch_size = settings.EMBEDDING_BATCH_SIZE
+        start = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            batch_ids = ids[i:i + batch_size]
+            vector_db.add_documents([docs[chunk_id] for chunk_id in batch_ids], ids=batch_ids)
+        elapsed = time.perf_counter() - start
+        return {
+            "chunks": len(ids),
+            "batch_size": batch_size,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": _rate(len(ids), elapsed),
+        }
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
@@ -0,0 +1,149 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.lexical_index import LexicalIndex
+from app.core.vector_store import add_with_embeddings, similarity_search_with_ids
+from app.services.document_loader import make_chunk_id
+
+from benchmarks.corpus import iter_chunks, paragraph
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, float]:
+    ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+class SyntheticVectors:
+    """
+    Clustered unit vectors standing in for chunk embeddings, so the store can be
+    grown to 1M chunks without hours of model inference. Clusters mimic topics;
+    queries are drawn from the same distribution.
+    """
+
+    def __init__(self, dim: int, clusters: int = 256, spread: float = 0.35, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        centers = self.rng.standard_normal((clusters, dim)).astype(np.float32)
+        self.centers = centers / np.linalg.norm(centers, axis=1, keepdims=True)
+        self.spread = spread
+
+    def sample(self, n: int) -> np.ndarray:
+        picks = self.centers[self.rng.integers(0, len(self.centers), n)]
+        noise = self.rng.standard_normal(picks.shape).astype(np.float32) * self.spread / np.sqrt(picks.shape[1])
+        vectors = picks + noise
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_search_growth(
+    checkpoints: Sequence[int],
+    queries: int,
+    k: int,
+    model=None,
+    dim: int = 384,
+    with_lexical: bool = False,
+    insert_batch: int = 2000, # Stays under Chroma's max batch size
+    seed: int = 0,
+    backend: str = "chroma",
+    flat_dtype: str = "float32",
+) -> Dict[str, Any]:
+    """
+    Grows a throwaway collection through `checkpoints` chunk counts and, at
+    each one, measures vector search latency (and BM25 search with `with_lexical`).
+    With `model`, chunks and queries are embedded for real (slow beyond ~100k);
+    otherwise SyntheticVectors are used. `backend` is "chroma" or "flat"
+    (FlatVectorStore stored as `flat_dtype`).
+    """
+
+    checkpoints = sorted(checkpoints)
+    rng = np.random.default_rng(seed)
+    synthetic = None if model is not None else SyntheticVectors(dim, seed=seed)
+    query_texts = [paragraph(random.Random(seed + i), 1) for i in range(queries)]
+    if model is not None:
+        query_vectors = [model.embed_query(q) for q in query_texts]
+    else:
+        query_vectors = synthetic.sample(queries).tolist()
+
+    store_dir = tempfile.mkdtemp(prefix="bench_search_")
+    results: List[Dict[str, Any]] = []
+    try:
+        if backend == "flat":
+            from app.core.flat_index import FlatVectorStore
+
+            vector_db = FlatVectorStore(
+                os.path.join(store_dir, "flat"), "bench_search", embedding_function=model,
+                dtype=flat_dtype, rescore_factor=settings.FLAT_INDEX_RESCORE_FACTOR,
+            )
+        else:
+            import chromadb
+            from langchain_community.vectorstores import Chroma
+
+            client = chromadb.PersistentClient(path=os.path.join(store_dir, "chroma"))
+            vector_db = Chroma(client=client, collection_name="bench_search", embedding_function=model)
+        lexical: Optional[LexicalIndex] = None
+        if with_lexical:
+            lexical = LexicalIndex(os.path.join(store_dir, "bm25", "bench_search"))
+
+        chunks = iter_chunks(checkpoints[-1], settings.CHUNK_SIZE, seed)
+        stored = 0
+        insert_seconds = 0.0
+        for target in checkpoints:
+            while stored < target:
+                n = min(insert_batch, target - stored)
+                texts = [next(chunks) for _ in range(n)]
+                ids = [make_chunk_id("bench.txt", t) for t in texts]
+                start = time.perf_counter()
+                if model is not None:
+                    vectors = model.embed_documents(texts)
+                else:
+                    vectors = synthetic.sample(n).tolist()
+                add_with_embeddings(vector_db, ids, texts, vectors, [{"source": "bench.txt"}] * n)
+                if lexical is not None:
+                    lexical.add(zip(ids, texts))
+                insert_seconds += time.perf_counter() - start
+                stored += n
+
+            order = rng.permutation(queries)
+            similarity_search_with_ids(vector_db, query_vectors[0], k) # Warm-up
+            samples = []
+            for i in order:
+                start = time.perf_counter()
+                similarity_search_with_ids(vector_db, query_vectors[i], k)
+                samples.append(time.perf_counter() - start)
+            point: Dict[str, Any] = {
+                "chunks": stored,
+                "insert_seconds_cumulative": round(insert_seconds, 2),
+                "vector_search": latency_summary(samples),
+            }
+            if lexical is not None:
+                samples = []
+                for i in order:
+                    start = time.perf_counter()
+                    lexical.search(query_texts[i], k)
+                    samples.append(time.perf_counter() - start)
+                point["lexical_search"] = latency_summary(samples)
+            results.append(point)
+            print(f"  {stored} chunks: vector p50 {point['vector_search']['p50_ms']} ms, "
+                  f"p99 {point['vector_search']['p99_ms']} ms")
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    return {
+        "backend": backend if backend != "flat" else f"flat-{flat_dtype}",
+        "vectors": "model" if model is not None else "synthetic",
+        "dim": len(query_vectors[0]),
+        "queries": queries,
+        "k": k,
+        "checkpoints": results,
+    }
@@ -0,0 +1,61 @@
+import argparse
+import json
+import sys
+from typing import Any, Dict, Optional
+
+
+def flatten(node: Any, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves keyed by dotted path; search checkpoints are keyed by chunk count."""
+    flat: Dict[str, float] = {}
+    if isinstance(node, dict):
+        for key, value in node.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(node, list):
+        for i, item in enumerate(node):
+            label = item.get("chunks", i) if isinstance(item, dict) else i
+            flat.update(flatten(item, f"{prefix}[{label}]"))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        flat[prefix] = float(node)
+    return flat
+
+
+def direction(metric: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None for counts and sizes."""
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith("_per_sec"):
+        return 1
+    if name.endswith("_ms") or "seconds" in name or name == "error_rate":
+        return -1
+    return None
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float) -> int:
+    old = flatten(baseline["results"])
+    new = flatten(candidate["results"])
+    regressions = 0
+    for metric in sorted(old.keys() & new.keys()):
+        better = direction(metric)
+        if better is None or old[metric] == 0:
+            continue
+        change = (new[metric] - old[metric]) / old[metric]
+        worse = change * better < -threshold
+        marker = "REGRESSION" if worse else ("improved" if change * better > threshold else "")
+        regressions += worse
+        print(f"{metric:70s} {old[metric]:>12.3f} -> {new[metric]:>12.3f} ({change:+.1%}) {marker}")
+    print(f"\n{regressions} regression(s) beyond {threshold:.0%} "
+          f"({baseline['meta'].get('git_commit')} -> {candidate['meta'].get('git_commit')})")
+    return regressions
+
+
+if __name__ == "__main__":
+    # Example: python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+    sys.exit(1 if compare(baseline, candidate, args.threshold) else 0)
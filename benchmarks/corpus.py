@@ -0,0 +1,170 @@
+import os
+import random
+from typing import Dict, Iterator, List
+
+# Deterministic synthetic course material: lecture-note style prose mixed with
+# course codes, symbols and inline LaTeX, so splitting, BM25 and embeddings see
+# text that looks like the real uploads. The same seed always yields the same corpus.
+
+COURSES = ["CS-101", "CS-240", "MATH-221", "STAT-302", "PHYS-150", "ECE-310", "ML-410"]
+TOPICS = [
+    "gradient descent", "backpropagation", "eigenvalues", "singular value decomposition",
+    "Bayes' theorem", "the central limit theorem", "dynamic programming", "hash tables",
+    "binary search trees", "Fourier transforms", "Lagrange multipliers", "Markov chains",
+    "convolutional networks", "maximum likelihood estimation", "the Cauchy-Schwarz inequality",
+    "Dijkstra's algorithm", "Newton's method", "principal component analysis", "entropy",
+    "the divergence theorem", "regularization", "k-means clustering", "red-black trees",
+]
+FORMULAS = [
+    r"$\sum_{i=1}^{n} x_i$", r"$\nabla f(x) = 0$", r"$P(A|B) = \frac{P(B|A)P(A)}{P(B)}$",
+    r"$\int_0^\infty e^{-x} dx = 1$", r"$\|x\|_2 \le \|x\|_1$", r"$O(n \log n)$",
+    r"$\lambda_{max}$", r"$\mathbb{E}[X] = \mu$", r"$\theta_{t+1} = \theta_t - \eta \nabla L$",
+]
+TEMPLATES = [
+    "In {course} we study {topic}, which appears again when we discuss {other}.",
+    "Recall that {topic} is defined so that {formula} holds for every input.",
+    "A common exam question asks how {topic} relates to {other}; the key identity is {formula}.",
+    "Lecture {lecture} introduces {topic} and proves its running time is {formula}.",
+    "Students often confuse {topic} with {other}, but only the former satisfies {formula}.",
+    "Homework {lecture} for {course} asks you to implement {topic} from scratch.",
+    "The intuition behind {topic} is that each step reduces the error, as {formula} shows.",
+    "See the {course} notes, section {lecture}.{section}, for a worked example of {topic}.",
+]
+
+
+def _sentence(rng: random.Random) -> str:
+    topic, other = rng.sample(TOPICS, 2)
+    return rng.choice(TEMPLATES).format(
+        course=rng.choice(COURSES),
+        topic=topic,
+        other=other,
+        formula=rng.choice(FORMULAS),
+        lecture=rng.randint(1, 24),
+        section=rng.randint(1, 9),
+    )
+
+
+def paragraph(rng: random.Random, sentences: int = 6) -> str:
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+
+def document_text(rng: random.Random, approx_chars: int) -> str:
+    """One document of roughly `approx_chars` characters, in paragraphs."""
+    parts: List[str] = []
+    size = 0
+    while size < approx_chars:
+        text = paragraph(rng, rng.randint(3, 8))
+        parts.append(text)
+        size += len(text) + 2
+    return "\n\n".join(parts)
+
+
+QUESTION_TEMPLATES = [
+    "What is {topic}?",
+    "How does {topic} relate to {other}?",
+    "Can you explain {topic} with an example from {course}?",
+    "Why does {formula} hold for {topic}?",
+    "What is the running time of {topic}?",
+    "What is the difference between {topic} and {other}?",
+]
+
+
+def questions(count: int, seed: int = 0) -> List[str]:
+    """
+    Up to `count` distinct student-style questions about the corpus topics (for chat
+    load tests). The templates allow about 1,400 distinct questions.
+    """
+    rng = random.Random(seed)
+    found: Dict[str, None] = {} # Insertion-ordered set
+    for _ in range(50 * count):
+        if len(found) >= count:
+            break
+        topic, other = rng.sample(TOPICS, 2)
+        found[rng.choice(QUESTION_TEMPLATES).format(
+            topic=topic, other=other, course=rng.choice(COURSES), formula=rng.choice(FORMULAS)
+        )] = None
+    return list(found)
+
+
+def iter_chunks(count: int, chunk_chars: int, seed: int = 0) -> Iterator[str]:
+    """`count` chunk-sized texts, for benchmarks that skip loading and splitting."""
+    rng = random.Random(seed)
+    for i in range(count):
+        text = ""
+        while len(text) < chunk_chars:
+            text += _sentence(rng) + " "
+        # A unique suffix keeps chunk IDs (and embedding cache keys) distinct
+        yield f"{text[:chunk_chars - 12].rstrip()} [chunk {i}]"
+
+
+# --- File writers ---
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    lines: List[str] = []
+    for block in text.split("\n"):
+        line = ""
+        for word in block.split():
+            if line and len(line) + 1 + len(word) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path: str, text: str, lines_per_page: int = 55, width: int = 95):
+    """
+    Writes `text` as a minimal text-only PDF (Helvetica, one content stream per page).
+    Hand-rolled so the benchmark needs no PDF-writing dependency; pypdf reads it like any other PDF.
+    """
+    lines = [line.encode("latin-1", "replace").decode("latin-1") for line in _wrap(text, width)]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # Object numbers: 1 catalog, 2 page tree, 3 font, then (page, contents) pairs
+    objects: List[bytes] = [b"", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for page_lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in page_lines) + " ET"
+        stream_bytes = stream.encode("latin-1")
+        page_number = len(objects) + 1
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_number + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream_bytes) + stream_bytes + b"\nendstream")
+        page_refs.append(f"{page_number} 0 R")
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(out_dir: str, files: int, approx_chars: int, fmt: str = "txt", seed: int = 0) -> List[str]:
+    """Writes `files` synthetic course documents (fmt "txt" or "pdf") and returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        text = f"{rng.choice(COURSES)} lecture notes {i + 1}\n\n" + document_text(rng, approx_chars)
+        path = os.path.join(out_dir, f"lecture_{i + 1:05d}.{fmt}")
+        if fmt == "pdf":
+            write_pdf(path, text)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        paths.append(path)
+    return paths
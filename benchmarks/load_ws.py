@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from benchmarks.corpus import questions as generate_questions
+
+# Closed-loop chat load test: each simulated user holds one /ws connection, asks a
+# question, waits for the answer, thinks, and asks again. Only talks to the server
+# over the network, so it needs neither the app settings nor a model.
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+@dataclass
+class Sample:
+    user: int
+    started: float # Seconds since the test started
+    outcome: str # ok, cached, error, timeout, disconnected
+    latency: float # Send -> final/error (or -> give up)
+    ttft: Optional[float] = None # Send -> first token
+    chunks: int = 0
+    detail: str = ""
+
+
+@dataclass
+class LoadState:
+    deadline: float
+    start: float = field(default_factory=time.perf_counter)
+    samples: List[Sample] = field(default_factory=list)
+    connect_errors: Counter = field(default_factory=Counter)
+    open_connections: int = 0
+    peak_connections: int = 0
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, float]:
+    if not len(samples):
+        return {}
+    ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "mean_ms": round(float(ms.mean()), 1),
+        "max_ms": round(float(ms.max()), 1),
+    }
+
+
+def load_questions(path: Optional[str], pool: int, seed: int) -> List[str]:
+    """Questions from a file (one per line) or from the synthetic benchmark corpus."""
+    if path is None:
+        return generate_questions(pool, seed)
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if not lines:
+        raise SystemExit(f"No questions in {path}")
+    return lines
+
+
+async def _read_answer(ws, sent: float) -> Dict[str, Any]:
+    """Reads events until the answer to the question sent at `sent` ends."""
+    result: Dict[str, Any] = {"ttft": None, "chunks": 0}
+    while True:
+        raw = await ws.recv()
+        if not raw.startswith("{"): # Legacy (STREAM_RESPONSES=false) "Bot: ..." reply
+            result.update(outcome="ok", latency=time.perf_counter() - sent)
+            return result
+        event = json.loads(raw)
+        kind = event.get("type")
+        if kind == "token":
+            if result["ttft"] is None:
+                result["ttft"] = time.perf_counter() - sent
+            result["chunks"] += 1
+        elif kind == "final":
+            result.update(outcome="cached" if event.get("cached") else "ok", latency=time.perf_counter() - sent)
+            return result
+        elif kind == "error":
+            result.update(outcome="error", latency=time.perf_counter() - sent, detail=event.get("message", ""))
+            return result
+
+
+async def _ask(ws, question: str, courses: Optional[List[str]], timeout: float) -> Dict[str, Any]:
+    """Sends one question and waits for its answer. Raises asyncio.TimeoutError."""
+    frame: Dict[str, Any] = {"type": "message", "content": question}
+    if courses:
+        frame["courses"] = courses
+    sent = time.perf_counter()
+    await ws.send(json.dumps(frame))
+    return await asyncio.wait_for(_read_answer(ws, sent), timeout)
+
+
+async def _skip_to_cancelled(ws):
+    while json.loads(await ws.recv()).get("type") != "cancelled":
+        pass
+
+
+async def _cancel(ws, timeout: float = 5.0):
+    """Cancels a timed-out answer and waits for the ack, so the next question starts clean."""
+    await ws.send(json.dumps({"type": "cancel"}))
+    await asyncio.wait_for(_skip_to_cancelled(ws), timeout)
+
+
+async def _user(user: int, url: str, question_pool: List[str], args: argparse.Namespace, state: LoadState):
+    import websockets
+
+    rng = random.Random(args.seed * 100003 + user)
+    await asyncio.sleep(args.ramp_up * user / max(1, args.users)) # Stagger connects over the ramp-up
+    asked = 0
+    while time.perf_counter() < state.deadline and (not args.messages_per_user or asked < args.messages_per_user):
+        try:
+            async with websockets.connect(url, max_size=None, open_timeout=args.timeout) as ws:
+                state.open_connections += 1
+                state.peak_connections = max(state.peak_connections, state.open_connections)
+                try:
+                    while time.perf_counter() < state.deadline and (
+                        not args.messages_per_user or asked < args.messages_per_user
+                    ):
+                        question = rng.choice(question_pool)
+                        started = time.perf_counter()
+                        asked += 1
+                        try:
+                            result = await _ask(ws, question, args.courses, args.timeout)
+                        except (asyncio.TimeoutError, TimeoutError):
+                            state.samples.append(Sample(user, started - state.start, "timeout", args.timeout))
+                            await _cancel(ws)
+                            continue
+                        state.samples.append(Sample(
+                            user, started - state.start, result["outcome"], result["latency"],
+                            result["ttft"], result["chunks"], result.get("detail", ""),
+                        ))
+                        think = rng.expovariate(1 / args.think_time) if args.think_time > 0 else 0.0
+                        await asyncio.sleep(min(think, max(0.0, state.deadline - time.perf_counter())))
+                finally:
+                    state.open_connections -= 1
+        except (OSError, asyncio.TimeoutError, TimeoutError, websockets.exceptions.WebSocketException) as e:
+            if time.perf_counter() >= state.deadline:
+                break
+            state.connect_errors[type(e).__name__] += 1
+            state.samples.append(Sample(user, time.perf_counter() - state.start, "disconnected", 0.0, detail=str(e)))
+            await asyncio.sleep(1.0) # Back off before reconnecting
+
+
+def summarize(state: LoadState, elapsed: float) -> Dict[str, Any]:
+    outcomes = Counter(s.outcome for s in state.samples)
+    answered = [s for s in state.samples if s.outcome in ("ok", "cached")]
+    llm = [s for s in answered if s.outcome == "ok"]
+    total = len(state.samples)
+    failed = total - len(answered)
+    errors = Counter(s.detail[:80] for s in state.samples if s.outcome == "error")
+    return {
+        "duration_s": round(elapsed, 2),
+        "messages": total,
+        "answered": len(answered),
+        "outcomes": dict(outcomes),
+        "answers_per_sec": round(len(answered) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(failed / total, 4) if total else 0.0,
+        "cache_hit_rate": round(outcomes["cached"] / len(answered), 4) if answered else 0.0,
+        "peak_connections": state.peak_connections,
+        "connect_errors": dict(state.connect_errors),
+        "top_errors": dict(errors.most_common(5)),
+        # End to end as the user sees it: send -> final event
+        "latency": latency_summary([s.latency for s in answered]),
+        "llm_latency": latency_summary([s.latency for s in llm]),
+        "ttft": latency_summary([s.ttft for s in llm if s.ttft is not None]),
+    }
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    question_pool = load_questions(args.questions, args.question_pool, args.seed)
+    url = args.url
+    state = LoadState(deadline=time.perf_counter() + args.ramp_up + args.duration)
+    print(f"[load] {args.users} users -> {url}, {args.duration}s (+{args.ramp_up}s ramp-up), "
+          f"think time {args.think_time}s, {len(question_pool)} distinct questions")
+
+    async def progress():
+        while True:
+            await asyncio.sleep(args.report_every)
+            done = [s for s in state.samples if s.outcome in ("ok", "cached")]
+            recent = [s.latency for s in done[-200:]]
+            print(f"  t={time.perf_counter() - state.start:6.1f}s connections={state.open_connections:4d} "
+                  f"answered={len(done):6d} failed={len(state.samples) - len(done):5d} "
+                  f"p50={latency_summary(recent).get('p50_ms', 0):8.1f}ms")
+
+    reporter = asyncio.create_task(progress())
+    try:
+        await asyncio.gather(*(_user(i, url, question_pool, args, state) for i in range(args.users)))
+    finally:
+        reporter.cancel()
+    elapsed = time.perf_counter() - state.start
+    # Throughput over the steady-state window only, so the ramp-up does not dilute it
+    result = summarize(state, elapsed)
+    if args.ramp_up and args.messages_per_user == 0:
+        steady = [s for s in state.samples if s.started >= args.ramp_up and s.outcome in ("ok", "cached")]
+        result["steady_answers_per_sec"] = round(len(steady) / max(1e-9, elapsed - args.ramp_up), 3)
+    return result
+
+
+def main():
+    # Example (server started with LLM_MODEL_NAME=fake FAKE_LLM_PROFILE=gemini-flash):
+    #   python -m benchmarks.load_ws --users 100 --duration 120 --think-time 5
+    parser = argparse.ArgumentParser(description="Concurrent /ws chat load test (results as JSON).")
+    parser.add_argument("--url", default="ws://localhost:8000/ws")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent connections (simulated users)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of load after the ramp-up")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="Seconds over which users connect")
+    parser.add_argument("--think-time", type=float, default=3.0,
+                        help="Mean pause between a user's answer and next question (exponential; 0 = none)")
+    parser.add_argument("--messages-per-user", type=int, default=0, help="Stop each user after N questions (0 = run for --duration)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds before an answer counts as timed out")
+    parser.add_argument("--questions", default=None, help="Question file, one per line (default: synthetic corpus)")
+    parser.add_argument("--question-pool", type=int, default=500,
+                        help="Distinct synthetic questions; a smaller pool means more answer cache hits")
+    parser.add_argument("--course", dest="courses", type=lambda v: [c for c in v.split(",") if c], default=None,
+                        help="Comma-separated courses each question is asked against")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--output", default=None, help="JSON path (default: benchmarks/results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(), # Of the load generator's checkout; run it next to the server's
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": {"load": asyncio.run(run_load(args))},
+    }
+    load = report["results"]["load"]
+    print(f"[load] {load['answered']} answered, {load['answers_per_sec']} answers/s, "
+          f"error rate {load['error_rate']:.2%}, cache hits {load['cache_hit_rate']:.2%}")
+    print(f"[load] latency {load['latency']}")
+    print(f"[load] ttft    {load['ttft']}")
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"load-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Load test results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+
+# Offline by default: the model must come from ./embedding_cache, never the Hub
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from app.core.config import settings
+
+SUITES = ("load_split", "embed", "add", "search")
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(float(v)) for v in value.split(",") if v]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks import bench_ingest, bench_search
+
+    suites = SUITES if args.suite == ["all"] else args.suite
+    report: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedding_model": settings.EMBEDDING_MODEL_NAME,
+            "chunk_size": settings.CHUNK_SIZE,
+            "chunk_overlap": settings.CHUNK_OVERLAP,
+            "embedding_batch_size": settings.EMBEDDING_BATCH_SIZE,
+            "args": vars(args),
+        },
+        "results": {},
+    }
+
+    model = None
+    if {"embed", "add"} & set(suites) or ("search" in suites and args.vectors == "model"):
+        model, load_seconds = bench_ingest.load_model()
+        report["results"]["model_load_seconds"] = round(load_seconds, 3)
+
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as work_dir:
+        if "load_split" in suites:
+            print(f"[load_split] {args.files} files x ~{args.doc_chars} chars, formats {args.formats}")
+            report["results"]["load_split"] = bench_ingest.bench_load_split(
+                work_dir, args.files, args.doc_chars, args.formats, args.seed
+            )
+        if "embed" in suites:
+            print(f"[embed] {args.embed_chunks} chunks, batch sizes {args.batch_sizes}")
+            report["results"]["embed"] = bench_ingest.bench_embed(model, args.embed_chunks, args.batch_sizes, args.seed)
+        if "add" in suites:
+            print(f"[add] {args.add_chunks} chunks")
+            report["results"]["add_documents"] = bench_ingest.bench_add_documents(model, args.add_chunks, args.seed)
+        if "search" in suites:
+            print(f"[search] checkpoints {args.checkpoints}, {args.queries} queries, {args.vectors} vectors")
+            report["results"]["search"] = bench_search.bench_search_growth(
+                args.checkpoints,
+                args.queries,
+                args.k,
+                model=model if args.vectors == "model" else None,
+                dim=args.dim,
+                with_lexical=args.with_lexical,
+                seed=args.seed,
+                backend=args.backend,
+                flat_dtype=args.flat_dtype,
+            )
+    return report
+
+
+def main():
+    # Example: python -m benchmarks.run --suite search --checkpoints 1000,10000,100000,1000000
+    parser = argparse.ArgumentParser(description="Ingestion and retrieval benchmarks (results as JSON).")
+    parser.add_argument("--suite", nargs="+", default=["all"], choices=("all",) + SUITES)
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a smoke run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--files", type=int, default=50, help="Documents per format for load_split")
+    parser.add_argument("--doc-chars", type=int, default=20000, help="Approximate characters per document")
+    parser.add_argument("--formats", nargs="+", default=["txt", "pdf"], choices=("txt", "pdf"))
+    parser.add_argument("--embed-chunks", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=_int_list, default=[8, 32, 64, 128, 256])
+    parser.add_argument("--add-chunks", type=int, default=5000)
+    parser.add_argument("--checkpoints", type=_int_list, default=[1000, 10000, 100000, 1000000],
+                        help="Collection sizes at which search latency is measured")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=settings.HYBRID_FETCH_K, help="Results per search")
+    parser.add_argument("--vectors", choices=("synthetic", "model"), default="synthetic",
+                        help="Search growth vectors: synthetic clusters (fast, scales to 1M) or real embeddings")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension (MiniLM is 384)")
+    parser.add_argument("--with-lexical", action="store_true", help="Also measure BM25 search latency")
+    parser.add_argument("--backend", choices=("chroma", "flat"), default=settings.VECTOR_BACKEND,
+                        help="Vector store searched by the search suite")
+    parser.add_argument("--flat-dtype", choices=("float32", "float16", "int8"), default=settings.FLAT_INDEX_DTYPE)
+    parser.add_argument("--output", default=None, help="JSON path (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.files, args.doc_chars, args.embed_chunks, args.add_chunks = 5, 5000, 200, 500
+        args.checkpoints, args.queries = [1000, 5000], 50
+
+    start = time.perf_counter()
+    report = run(args)
+    report["meta"]["total_seconds"] = round(time.perf_counter() - start, 2)
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
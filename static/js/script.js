@@ -18,6 +18,7 @@ const dynamicUploadStatus = document.getElementById('dynamicUploadStatus');
 let websocket = null;
 let isWaitingForBot = false;
 let isUploading = false; // Flag to prevent double uploads
+let awaitingCancelAck = false; // Drop frames of a cancelled answer until the server confirms
 
 function applyTheme(theme) {
     if (theme === 'dark') {
@@ -110,6 +111,16 @@ function connectWebSocket() {
 
     websocket.onmessage = function(event) {
         console.log("Raw data received:", event.data);
+        let streamEvent = null;
+        try {
+            streamEvent = JSON.parse(event.data);
+        } catch (e) { /* Plain "Bot: ..." frame (non-streaming mode) */ }
+        if (streamEvent && typeof streamEvent === 'object' && streamEvent.type) {
+            handleStreamEvent(streamEvent);
+            return;
+        }
+        if (awaitingCancelAck) return; // Late answer to a cancelled question
+
         let messageText = event.data;
         let messageClass = messageText.startsWith("Bot:") ? "bot-message" : "user-message"; 
         addMessage(messageText.replace(/^Bot:\s*/, ''), messageClass); 
@@ -122,6 +133,75 @@ function connectWebSocket() {
     websocket.onclose = function(event) { /* ... keep close handling ... */ };
 }
 
+// --- Streaming Responses ---
+let streamingBubble = null; // Text segment receiving token deltas
+let streamingWrapper = null;
+let pendingSources = [];
+
+function startStreamingMessage() {
+    streamingWrapper = document.createElement('div');
+    streamingWrapper.className = 'message-wrapper bot';
+    const messageContentContainer = document.createElement('div');
+    messageContentContainer.className = 'message bot-message';
+    streamingBubble = document.createElement('div');
+    streamingBubble.className = 'message-segment message-text-block';
+    messageContentContainer.appendChild(streamingBubble);
+    streamingWrapper.appendChild(messageContentContainer);
+    messageArea.appendChild(streamingWrapper);
+}
+
+function finishStreamingMessage() {
+    if (streamingWrapper) streamingWrapper.remove(); // Re-rendered below with KaTeX
+    streamingWrapper = null;
+    streamingBubble = null;
+}
+
+function handleStreamEvent(streamEvent) {
+    if (streamEvent.type === 'cancelled') {
+        awaitingCancelAck = false;
+        finishStreamingMessage();
+        return;
+    }
+    if (awaitingCancelAck) return; // Tokens already in flight when the user cancelled
+
+    switch (streamEvent.type) {
+        case 'retrieval':
+            pendingSources = [];
+            startStreamingMessage();
+            break;
+        case 'token':
+            if (!streamingBubble) startStreamingMessage();
+            streamingBubble.textContent += streamEvent.content;
+            messageArea.scrollTo({ top: messageArea.scrollHeight });
+            break;
+        case 'sources':
+            pendingSources = streamEvent.sources || [];
+            break;
+        case 'final':
+            finishStreamingMessage();
+            addMessage(streamEvent.content, "bot-message");
+            if (pendingSources.length) {
+                const sourceText = pendingSources
+                    .map(s => s.page !== null && s.page !== undefined ? `${s.source} (p. ${s.page + 1})` : s.source)
+                    .join(', ');
+                const sourceSpan = document.createElement('span');
+                sourceSpan.className = 'timestamp';
+                sourceSpan.textContent = `Sources: ${sourceText}`;
+                messageArea.lastElementChild?.appendChild(sourceSpan);
+            }
+            console.log(`Answer streamed. TTFT: ${streamEvent.ttft_ms} ms, total: ${streamEvent.total_ms} ms`);
+            if (isWaitingForBot) resetUIState();
+            break;
+        case 'error':
+            finishStreamingMessage();
+            addMessage(streamEvent.message, "bot-message error");
+            if (isWaitingForBot) resetUIState();
+            break;
+        default:
+            console.warn("Unknown stream event:", streamEvent);
+    }
+}
+
 // --- Add Message ---
 function addMessage(message, cssClass) {
     const messageWrapper = document.createElement('div');
@@ -245,6 +325,11 @@ function resetUIState(cancelled = false) {
 cancelButton.addEventListener('click', () => {
     if (isWaitingForBot) {
         console.log("User cancelled request.");
+        if (websocket && websocket.readyState === WebSocket.OPEN) {
+            awaitingCancelAck = true;
+            websocket.send(JSON.stringify({ type: 'cancel' })); // Stops generation server-side
+        }
+        finishStreamingMessage();
         resetUIState(true);
     }
 });
@@ -299,6 +384,10 @@ async function uploadFile(file) {
 
     const formData = new FormData();
     formData.append('file', file); // Key 'file' must match FastAPI parameter
+    const course = new URLSearchParams(window.location.search).get('course');
+    if (course && !course.includes(',') && course !== '*') {
+        formData.append('course', course); // Upload into the course being chatted about
+    }
 
     setDynamicUploadStatus(`Uploading "${file.name}"...`, "info");
     isUploading = true;
@@ -311,7 +400,11 @@ async function uploadFile(file) {
 
         if (response.ok && response.status === 202) {
             setDynamicUploadStatus(`Processing "${result.filename}"...`, "success");
-            setTimeout(() => setDynamicUploadStatus(""), 5000);
+            if (result.job_id) {
+                pollJobStatus(result.job_id, result.filename);
+            } else {
+                setTimeout(() => setDynamicUploadStatus(""), 5000);
+            }
         } else {
             const errorDetail = result.detail || `Server error ${response.status}`;
             setDynamicUploadStatus(`Upload failed: ${errorDetail}`, "error");
@@ -331,6 +424,37 @@ async function uploadFile(file) {
     }
 }
 
+// Poll the ingestion job until it finishes, showing chunk progress
+async function pollJobStatus(jobId, filename) {
+    try {
+        const response = await fetch(`/data/jobs/${jobId}`);
+        if (!response.ok) throw new Error(`Server error ${response.status}`);
+        const job = await response.json();
+
+        if (job.status === 'succeeded') {
+            setDynamicUploadStatus(`"${filename}" is ready.`, "success");
+            setTimeout(() => setDynamicUploadStatus(""), 5000);
+            return;
+        }
+        if (job.status === 'failed') {
+            setDynamicUploadStatus(`Processing "${filename}" failed: ${job.error || 'unknown error'}`, "error");
+            setTimeout(() => setDynamicUploadStatus(""), 8000);
+            return;
+        }
+        let progressText = '';
+        if (job.chunks_total) {
+            progressText = ` ${job.chunks_done}/${job.chunks_total} chunks`;
+        } else if (job.chunks_done) { // Total not known until the whole document has been read
+            progressText = ` ${job.chunks_done} chunks`;
+        }
+        setDynamicUploadStatus(`Processing "${filename}" (${job.status})...${progressText}`, "info");
+        setTimeout(() => pollJobStatus(jobId, filename), 2000);
+    } catch (error) {
+        console.error("Job status error:", error);
+        setTimeout(() => setDynamicUploadStatus(""), 5000);
+    }
+}
+
 // 4. Function to update the dynamic status message
 function setDynamicUploadStatus(message, type = "") { // type: info, success, error
     if (dynamicUploadStatus) {
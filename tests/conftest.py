@@ -0,0 +1,5 @@
+import os
+
+# Settings are read at import time; tests never call the hosted LLM
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ.setdefault("LLM_MODEL_NAME", "fake")
@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+
+from app.services.answer_cache import SemanticAnswerCache
+
+
+def _unit(angle_degrees):
+    angle = np.radians(angle_degrees)
+    return [float(np.cos(angle)), float(np.sin(angle)), 0.0]
+
+
+def _cache(**overrides):
+    options = dict(similarity_threshold=0.95, max_entries=100, ttl_seconds=0, max_bytes=1 << 20)
+    options.update(overrides)
+    return SemanticAnswerCache(**options)
+
+
+def test_exact_match_ignores_case_and_trailing_punctuation():
+    cache = _cache()
+    cache.store("What is entropy?", _unit(0), "disorder", [])
+    assert cache.lookup_exact("  what is   ENTROPY ").answer == "disorder"
+
+
+def test_semantic_hit_only_above_the_threshold():
+    cache = _cache(similarity_threshold=0.95) # cos(10°) = 0.985, cos(30°) = 0.866
+    cache.store("What is entropy?", _unit(0), "disorder", [])
+    assert cache.lookup("Define entropy", _unit(10)).answer == "disorder"
+    assert cache.lookup("What is enthalpy?", _unit(30)) is None
+    assert (cache.semantic_hits, cache.misses) == (1, 1)
+
+
+def test_scopes_are_isolated():
+    cache = _cache()
+    cache.store("What is a field?", _unit(0), "physics answer", [], scope="physics")
+    assert cache.lookup_exact("What is a field?", scope="algebra") is None
+    assert cache.lookup("What is a field?", _unit(0), scope="algebra") is None
+    assert cache.lookup("What is a field?", _unit(0), scope="physics").answer == "physics answer"
+
+
+def test_invalidate_drops_only_entries_from_that_collection():
+    cache = _cache()
+    cache.store("q1", _unit(0), "a1", [], scope="physics")
+    cache.store("q2", _unit(90), "a2", [], scope="physics,chemistry")
+    cache.store("q3", _unit(180), "a3", [], scope="algebra")
+    cache.invalidate("chemistry")
+    assert cache.lookup_exact("q1", "physics") is not None
+    assert cache.lookup_exact("q2", "physics,chemistry") is None
+    assert cache.lookup_exact("q3", "algebra") is not None
+
+
+def test_answers_built_before_an_invalidation_are_not_stored():
+    cache = _cache()
+    generation = cache.generation
+    cache.invalidate("physics")
+    cache.store("q", _unit(0), "stale", [], generation=generation, scope="physics")
+    assert cache.lookup_exact("q", "physics") is None
+
+
+def test_entries_expire_after_the_ttl():
+    cache = _cache(ttl_seconds=0.05)
+    cache.store("q", _unit(0), "a", [])
+    assert cache.lookup_exact("q") is not None
+    time.sleep(0.1)
+    assert cache.lookup_exact("q") is None
+    assert cache.lookup("q", _unit(0)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_byte_cap_evicts_least_recently_used():
+    cache = _cache()
+    cache.store("q0", _unit(0), "x" * 1000, [])
+    entry_bytes = cache.stats()["bytes"]
+    cache.max_bytes = int(entry_bytes * 2.5) # Room for two entries
+    cache.store("q1", _unit(90), "x" * 1000, [])
+    assert cache.lookup_exact("q0") is not None # q0 is now the most recently used
+    cache.store("q2", _unit(180), "x" * 1000, [])
+    assert cache.lookup_exact("q1") is None
+    assert cache.lookup_exact("q0") is not None and cache.lookup_exact("q2") is not None
+    assert cache.stats()["bytes"] <= cache.max_bytes and cache.evictions == 1
+
+
+def test_entry_cap_evicts_least_recently_used():
+    cache = _cache(max_entries=2)
+    for i in range(3):
+        cache.store(f"q{i}", _unit(i * 60), "a", [])
+    assert cache.lookup_exact("q0") is None
+    assert cache.stats()["entries"] == 2
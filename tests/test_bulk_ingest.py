@@ -0,0 +1,50 @@
+import zipfile
+from pathlib import Path
+
+from app.services.bulk_ingest import collect_input_files
+
+
+def _zip(path: Path, files: dict):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, text in files.items():
+            archive.writestr(name, text)
+
+
+def test_directory_with_documents_and_zip(tmp_path):
+    upload = tmp_path / "upload"
+    upload.mkdir()
+    (upload / "a.txt").write_text("alpha")
+    (upload / "notes.bin").write_bytes(b"\0") # Unsupported: skipped
+    _zip(upload / "lectures.zip", {"week1/intro.md": "# Intro", "week2/b.txt": "beta"})
+
+    inputs = collect_input_files(str(upload), str(tmp_path / "extract"))
+
+    assert sorted(source for _, source in inputs) == ["a.txt", "week1/intro.md", "week2/b.txt"]
+    assert all(Path(path).is_file() for path, _ in inputs)
+
+
+def test_zip_only_upload(tmp_path):
+    upload = tmp_path / "upload"
+    upload.mkdir()
+    _zip(upload / "semester.zip", {"a.txt": "alpha"})
+
+    assert [source for _, source in collect_input_files(str(upload), str(tmp_path / "extract"))] == ["a.txt"]
+
+
+def test_same_named_archives_do_not_overwrite_each_other(tmp_path):
+    upload = tmp_path / "upload"
+    (upload / "x").mkdir(parents=True)
+    (upload / "y").mkdir()
+    _zip(upload / "x" / "lectures.zip", {"a.txt": "from x"})
+    _zip(upload / "y" / "lectures.zip", {"a.txt": "from y"})
+
+    inputs = collect_input_files(str(upload), str(tmp_path / "extract"))
+
+    assert sorted(Path(path).read_text() for path, _ in inputs) == ["from x", "from y"]
+
+
+def test_single_file_and_unsupported(tmp_path):
+    doc = tmp_path / "c.pdf"
+    doc.write_bytes(b"%PDF")
+    assert collect_input_files(str(doc), str(tmp_path)) == [(str(doc), "c.pdf")]
+    assert collect_input_files(str(tmp_path / "c.exe"), str(tmp_path)) == []
@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.routes.chat import ChatSession, ConnectionManager
+
+
+class _WebSocket:
+    client = SimpleNamespace(host="127.0.0.1", port=5000)
+
+
+def _manager():
+    manager = ConnectionManager()
+    websocket = _WebSocket()
+    session = manager.sessions[websocket] = ChatSession(websocket)
+    return manager, websocket, session
+
+
+def test_questions_queue_up_to_the_cap_by_default():
+    assert not settings.CHAT_SUPERSEDE_IN_FLIGHT
+
+    async def run():
+        manager, websocket, session = _manager()
+        session.current = asyncio.get_running_loop().create_future() # An answer in flight
+        accepted = [manager.submit(websocket, f"q{i}") for i in range(settings.CHAT_MAX_QUEUED_MESSAGES + 1)]
+        assert not session.current.cancelled()
+        session.current.cancel()
+        return accepted, session.queue.qsize()
+
+    accepted, queued = asyncio.run(run())
+    assert accepted == [True] * settings.CHAT_MAX_QUEUED_MESSAGES + [False]
+    assert queued == settings.CHAT_MAX_QUEUED_MESSAGES
+
+
+def test_supersede_cancels_the_answer_and_the_queue(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_SUPERSEDE_IN_FLIGHT", True)
+
+    async def run():
+        manager, websocket, session = _manager()
+        current = session.current = asyncio.get_running_loop().create_future()
+        assert manager.submit(websocket, "q1")
+        assert manager.submit(websocket, "q2")
+        return current.cancelled(), [session.queue.get_nowait()[0] for _ in range(session.queue.qsize())]
+
+    assert asyncio.run(run()) == (True, ["q2"])
@@ -0,0 +1,99 @@
+import asyncio
+from typing import List
+
+import pytest
+from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services import chatbot_service
+from app.services.chatbot_service import QA_PROMPT, stream_bot_response
+from app.services.conversation import ConversationalRetrievalQA
+from app.services.fake_llm import FakeStreamingChatModel
+
+
+class _StubRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager) -> List[Document]:
+        return [
+            Document(page_content="Entropy measures disorder.", metadata={"source": "thermo.pdf", "page": 3}),
+            Document(page_content="It never decreases in isolated systems.", metadata={"source": "thermo.pdf", "page": 4}),
+        ]
+
+
+_cancelled: List[bool] = []
+
+
+class _CancellableModel(FakeStreamingChatModel):
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        try:
+            async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+                yield chunk
+        except asyncio.CancelledError:
+            _cancelled.append(True)
+            raise
+
+
+def _chain(llm):
+    return ConversationalRetrievalQA.from_chain_type(
+        llm=llm, chain_type="stuff", retriever=_StubRetriever(),
+        return_source_documents=True, chain_type_kwargs={"prompt": QA_PROMPT},
+    )
+
+
+@pytest.fixture(autouse=True)
+def _fake_query_embedding(monkeypatch):
+    async def embed(text):
+        return [1.0, 0.0]
+    monkeypatch.setattr(chatbot_service, "aembed_query", embed)
+    chatbot_service.get_answer_cache().invalidate()
+
+
+async def _events(question, chain):
+    return [event async for event in stream_bot_response(question, qa_chain=chain)]
+
+
+def test_streams_retrieval_tokens_sources_then_final():
+    llm = FakeStreamingChatModel(token_delay=0)
+    events = asyncio.run(_events("What is entropy?", _chain(llm)))
+    kinds = [e["type"] for e in events]
+    assert kinds[0] == "retrieval" and events[0]["count"] == 2
+    assert kinds[-2:] == ["sources", "final"]
+    tokens = [e["content"] for e in events if e["type"] == "token"]
+    assert set(kinds[1:-2]) == {"token"} and len(tokens) > 1
+    assert "".join(tokens) == events[-1]["content"] == llm.response
+    assert events[-2]["sources"] == [{"source": "thermo.pdf", "page": 3}, {"source": "thermo.pdf", "page": 4}]
+
+
+def test_repeated_question_is_served_from_the_answer_cache():
+    chain = _chain(FakeStreamingChatModel(token_delay=0))
+    first = asyncio.run(_events("What is entropy?", chain))
+    second = asyncio.run(_events("what is entropy", chain))
+    assert [e["type"] for e in second] == ["retrieval", "token", "sources", "final"]
+    assert second[0]["cached"] and second[-1]["cached"]
+    assert second[-1]["content"] == first[-1]["content"]
+    assert second[2]["sources"] == first[-2]["sources"]
+
+
+def test_cancelling_the_consumer_cancels_the_llm_stream():
+    _cancelled.clear()
+    chain = _chain(_CancellableModel(token_delay=5))
+
+    async def run():
+        seen = []
+
+        async def consume():
+            async for event in stream_bot_response("What is entropy?", qa_chain=chain):
+                seen.append(event["type"])
+
+        task = asyncio.create_task(consume())
+        while "retrieval" not in seen:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05) # The model is waiting for its first token
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, 2)
+        return seen
+
+    assert asyncio.run(run()) == ["retrieval"]
+    assert _cancelled == [True]
+    assert chatbot_service.rag_limiter.active == 0 # The slot was given back
@@ -0,0 +1,44 @@
+import json
+
+from app.services import collection_stats
+from app.services.collection_stats import CollectionStats, flushing_stats
+
+
+def test_batches_are_counted_in_memory_and_saved_once(tmp_path, monkeypatch):
+    path = tmp_path / "collection_stats.json"
+    stats = CollectionStats(str(path))
+    monkeypatch.setattr(collection_stats, "_collection_stats", stats)
+    saves = []
+    save = stats._save
+    monkeypatch.setattr(stats, "_save", lambda: (saves.append(1), save()))
+
+    @flushing_stats
+    def ingest_document():
+        for batch in range(50):
+            stats.record_added("cs101", [("a.pdf", "x" * 10)] * 4)
+        assert stats.summary()["document_count"] == 200 # Reads see unsaved counts
+
+    ingest_document()
+
+    assert len(saves) <= 2 # The first batch (timer) and the end of the document
+    saved = json.loads(path.read_text())["collections"]["cs101"]
+    assert saved["chunks"] == 200 and saved["sources"]["a.pdf"]["bytes"] == 2000
+
+
+def test_flush_on_error_and_deletes(tmp_path, monkeypatch):
+    path = tmp_path / "collection_stats.json"
+    stats = CollectionStats(str(path))
+    monkeypatch.setattr(collection_stats, "_collection_stats", stats)
+    stats.record_added("cs101", [("a.pdf", "abc"), ("b.pdf", "de")])
+
+    @flushing_stats
+    def failing_delete():
+        stats.record_deleted("cs101", [("b.pdf", "de")])
+        raise RuntimeError("vector store went away")
+
+    try:
+        failing_delete()
+    except RuntimeError:
+        pass
+    reloaded = CollectionStats(str(path)).summary()["collections"][0]
+    assert reloaded["document_count"] == 1 and list(reloaded["sources"]) == ["a.pdf"]
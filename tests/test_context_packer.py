@@ -0,0 +1,71 @@
+from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.context_packer import ContextPackingRetriever, merge_adjacent
+
+
+def _chunk(text, start, **metadata):
+    return Document(page_content=text, metadata={"source": "notes.pdf", "page": 1, "start_index": start, **metadata})
+
+
+def test_merges_overlapping_chunks_of_a_page():
+    first = "a" * 40 + "b" * 10
+    second = "b" * 10 + "c" * 40
+    merged = merge_adjacent([_chunk(first, 0), _chunk(second, 40)])
+    assert [d.page_content for d in merged] == ["a" * 40 + "b" * 10 + "c" * 40]
+
+
+def test_does_not_merge_across_collections():
+    first = "a" * 40 + "b" * 10
+    second = "b" * 10 + "c" * 40
+    docs = [_chunk(first, 0, collection="physics"), _chunk(second, 40, collection="chemistry")]
+    assert [d.page_content for d in merge_adjacent(docs)] == [first, second]
+
+
+class _Store:
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.gets = 0
+
+    def get(self, ids, include):
+        self.gets += 1
+        found = [i for i in ids if i in self.vectors]
+        return {"ids": found, "embeddings": [self.vectors[i] for i in found]}
+
+
+class _NoRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager):
+        return []
+
+
+class _NoEmbedding:
+    def embed_documents(self, texts):
+        raise AssertionError("chunks must not be embedded on the request path")
+
+
+def _packer(store):
+    return ContextPackingRetriever(
+        base_retriever=_NoRetriever(), mmr_k=2, mmr_lambda=0.3,
+        embeddings=_NoEmbedding(), vector_stores={"physics": store},
+    )
+
+
+def _docs():
+    return [
+        Document(id="a", page_content="alpha topic one", metadata={"source": "a.pdf"}),
+        Document(id="b", page_content="alpha topic two", metadata={"source": "b.pdf"}),
+        Document(id="c", page_content="gamma other subject", metadata={"source": "c.pdf"}),
+    ]
+
+
+def test_mmr_uses_stored_vectors_for_diversity():
+    store = _Store({"a": [1.0, 0.0], "b": [0.99, 0.05], "c": [0.6, 0.8]})
+    packed = _packer(store)._pack(_docs(), [1.0, 0.0])
+    assert [d.metadata["source"] for d in packed] == ["a.pdf", "c.pdf"] # b is a near-copy of a
+    assert store.gets == 1
+
+
+def test_mmr_keeps_retrieval_order_when_vectors_are_missing():
+    store = _Store({"a": [1.0, 0.0]})
+    packed = _packer(store)._pack(_docs(), [1.0, 0.0])
+    assert [d.metadata["source"] for d in packed] == ["a.pdf", "b.pdf", "c.pdf"]
@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.fair_limiter import FairLimiter
+from app.services.conversation import ConversationMemory, is_follow_up
+
+
+@pytest.mark.parametrize("question", [
+    "explain that more",
+    "Give an example of it",
+    "and the second law?",
+    "What about the latter?",
+    "Why does this converge?",
+    "tell me more",
+    "How does it compare to mergesort on nearly sorted input?",
+    "Can you go over what you said about pivots in more detail?",
+])
+def test_follow_ups(question):
+    assert is_follow_up(question)
+
+
+@pytest.mark.parametrize("question", [
+    "define entropy",
+    "explain Dijkstra's algorithm",
+    "why is quicksort fast",
+    "can you define a monoid",
+    "What is an eigenvalue?",
+    "Prove that quicksort runs in O(n log n) on average",
+    "Show that every DAG has a topological order",
+    "What is a hash table and how is it implemented?",
+    "Explain the last step of Dijkstra's algorithm",
+])
+def test_standalone_questions(question):
+    assert not is_follow_up(question)
+
+
+def _ask(memory, question):
+    return asyncio.run(memory.standalone_question(question))
+
+
+def test_heuristic_rewrite_anchors_on_last_new_topic():
+    memory = ConversationMemory(summary_mode="extractive")
+    assert _ask(memory, "What is entropy?") == "What is entropy?"
+    assert _ask(memory, "explain that more") == "What is entropy? explain that more"
+    assert _ask(memory, "give an example of it") == "What is entropy? give an example of it"
+    assert _ask(memory, "define eigenvalues") == "define eigenvalues" # New topic, not rewritten
+    assert _ask(memory, "and their uses?") == "define eigenvalues and their uses?"
+
+
+def test_rewrite_off():
+    memory = ConversationMemory(rewrite_mode="off")
+    _ask(memory, "What is entropy?")
+    assert _ask(memory, "explain that more") == "explain that more"
+
+
+def test_llm_rewrite_holds_a_limiter_slot():
+    limiter = FairLimiter(1)
+    active = []
+
+    class _RewriteModel:
+        async def ainvoke(self, prompt):
+            active.append(limiter.active)
+            return SimpleNamespace(content="What is an example of entropy?")
+
+    async def ask(memory, question):
+        return await memory.standalone_question(question, _RewriteModel(), slot=lambda: limiter.slot("client"))
+
+    async def run():
+        memory = ConversationMemory(summary_mode="extractive", rewrite_mode="llm")
+        assert await ask(memory, "What is entropy?") == "What is entropy?" # Not a follow-up: no LLM call
+        assert await ask(memory, "give an example of it") == "What is an example of entropy?"
+
+    asyncio.run(run())
+    assert active == [1]
+    assert limiter.active == 0
+
+
+def test_history_stays_within_budget():
+    memory = ConversationMemory(window_turns=3, token_budget=200, summary_tokens=50, summary_mode="extractive")
+    assert memory.render() == ""
+    for i in range(50):
+        memory.record(f"question {i} " + "word " * 40, f"Answer {i}. " + "detail " * 200)
+    history = memory.render()
+    assert len(memory.turns) == 3 and not memory.pending
+    assert memory.history_tokens(history) <= 200 + 30 # Budget plus the fixed header line
+    assert len(memory.summary) <= memory.summary_chars
+    assert "question 49" in history and "question 0 " not in history
@@ -0,0 +1,63 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.embedding_cache import CachedEmbeddings
+
+
+class _CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _cached(tmp_path, model="model-a"):
+    underlying = _CountingEmbeddings()
+    return CachedEmbeddings(underlying, model_name=model, db_path=str(tmp_path / "embeddings.sqlite3")), underlying
+
+
+def test_repeated_texts_are_embedded_once(tmp_path):
+    cache, underlying = _cached(tmp_path)
+    assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert cache.embed_documents(["bb"]) == [[2.0, 1.0]]
+    assert underlying.embedded == ["a", "bb"]
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_partial_hits_keep_input_order(tmp_path):
+    cache, underlying = _cached(tmp_path)
+    cache.embed_documents(["bb"])
+    assert cache.embed_documents(["ccc", "bb", "a"]) == [[3.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert underlying.embedded == ["bb", "ccc", "a"]
+
+
+def test_another_model_misses(tmp_path):
+    cache, _ = _cached(tmp_path, "model-a")
+    cache.embed_documents(["a"])
+    other, underlying = _cached(tmp_path, "model-b")
+    other.embed_documents(["a"])
+    assert underlying.embedded == ["a"]
+    assert other.stats() == {"entries": 1, "hits": 0, "misses": 1}
+
+
+def test_entries_persist_across_instances(tmp_path):
+    cache, _ = _cached(tmp_path)
+    cache.embed_documents(["a", "bb"])
+    reopened, underlying = _cached(tmp_path)
+    assert reopened.embed_documents(["bb", "a"]) == [[2.0, 1.0], [1.0, 1.0]]
+    assert underlying.embedded == []
+    assert reopened.stats() == {"entries": 2, "hits": 2, "misses": 0}
+
+
+def test_queries_are_not_cached(tmp_path):
+    cache, underlying = _cached(tmp_path)
+    cache.embed_query("q")
+    cache.embed_query("q")
+    assert underlying.embedded == ["q", "q"]
+    assert cache.stats()["entries"] == 0
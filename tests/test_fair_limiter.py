@@ -0,0 +1,54 @@
+import asyncio
+
+from app.core.fair_limiter import FairLimiter
+from app.core.metrics import RAG_STAGE_SECONDS
+
+
+def test_round_robin_between_clients():
+    async def run():
+        limiter = FairLimiter(1)
+        order = []
+        await limiter.acquire("busy")
+
+        async def job(client, n):
+            async with limiter.slot(client):
+                order.append((client, n))
+
+        tasks = [asyncio.create_task(job("greedy", n)) for n in range(3)]
+        tasks.append(asyncio.create_task(job("other", 0)))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(run())
+    assert order[:2] == [("greedy", 0), ("other", 0)] # "other" does not wait behind all of greedy's requests
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        limiter = FairLimiter(1)
+        await limiter.acquire("a")
+        waiter = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.waiting == 0
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(run())
+
+
+def test_wait_stage_is_per_limiter(monkeypatch):
+    stages = []
+    monkeypatch.setattr(RAG_STAGE_SECONDS, "observe", lambda value, **labels: stages.append(labels.get("stage")))
+
+    async def run():
+        async with FairLimiter(1, wait_stage="llm_wait").slot("x"):
+            pass
+        async with FairLimiter(1).slot("x"):
+            pass
+
+    asyncio.run(run())
+    assert stages == ["llm_wait"]
@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+from app.services import fake_llm
+from app.services.fake_llm import FakeStreamingChatModel, SimulatedLLMError
+
+
+def test_ainvoke_sleeps_on_the_event_loop(monkeypatch):
+    def blocking_sleep(seconds):
+        raise AssertionError("ainvoke must not block an executor thread")
+    monkeypatch.setattr(fake_llm.time, "sleep", blocking_sleep)
+    llm = FakeStreamingChatModel(token_delay=0.001)
+
+    async def run():
+        return await asyncio.gather(*(llm.ainvoke("question") for _ in range(20)))
+
+    assert {answer.content for answer in asyncio.run(run())} == {llm.response}
+
+
+def test_profiles_and_injected_errors():
+    assert FakeStreamingChatModel.from_profile("fixed").profile is None
+    assert FakeStreamingChatModel.from_profile("gemini-flash").profile.tokens_per_chunk == 12
+    with pytest.raises(ValueError):
+        FakeStreamingChatModel.from_profile("gpt-9")
+    with pytest.raises(SimulatedLLMError):
+        asyncio.run(FakeStreamingChatModel(error_rate=1.0).ainvoke("question"))
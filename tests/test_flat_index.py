@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.core import flat_index
+from app.core.flat_index import FlatVectorStore
+
+DIM = 32
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def _fill(store, vectors, start=0):
+    ids = [f"c{i}" for i in range(start, start + len(vectors))]
+    store.upsert(ids, vectors, [f"text {i}" for i in range(start, start + len(vectors))],
+                 [{"source": f"doc{i % 3}.pdf", "page": i} for i in range(start, start + len(vectors))])
+    return ids
+
+
+def _top_id(store, vector):
+    return store.query_with_ids(vector, 1)[0][0]
+
+
+def test_upsert_query_and_get(tmp_path):
+    store = FlatVectorStore(str(tmp_path), "cs101")
+    vectors = _vectors(50)
+    _fill(store, vectors)
+    chunk_id, doc, distance = store.query_with_ids(vectors[7], 1)[0]
+    assert (chunk_id, doc.id, doc.page_content) == ("c7", "c7", "text 7")
+    assert doc.metadata == {"source": "doc1.pdf", "page": 7} and distance == pytest.approx(0, abs=1e-5)
+    assert store.get(where={"source": "doc0.pdf"}, limit=2)["ids"] == ["c0", "c3"]
+    found = store.get(ids=["c2", "c5"], include=["embeddings"])
+    expected = vectors[[2, 5]] / np.linalg.norm(vectors[[2, 5]], axis=1, keepdims=True)
+    assert found["ids"] == ["c2", "c5"] and np.allclose(found["embeddings"], expected, atol=1e-6)
+
+
+def test_upsert_overwrites_existing_ids(tmp_path):
+    store = FlatVectorStore(str(tmp_path), "cs101")
+    vectors = _vectors(10)
+    _fill(store, vectors)
+    store.upsert(["c0"], [vectors[9]], ["new text"], [{"source": "new.pdf"}])
+    assert store.count() == 10
+    assert store.get(ids=["c0"])["documents"] == ["new text"]
+    assert {chunk_id for chunk_id, _, _ in store.query_with_ids(vectors[9], 2)} == {"c0", "c9"}
+
+
+def test_delete_and_compact_round_trip(tmp_path):
+    store = FlatVectorStore(str(tmp_path), "cs101", dtype="int8")
+    vectors = _vectors(100)
+    ids = _fill(store, vectors)
+    store.delete(ids[:60])
+    assert store.count() == 40 and _top_id(store, vectors[0]) != "c0"
+    store.compact()
+    assert store._rows == 40
+    arrays = {name for name in os.listdir(tmp_path) if not name.startswith("meta.")}
+    assert arrays == {"vectors.g1.int8", "scales.g1.float32", "full.g1.float32"} # Previous generation removed
+    for i in (60, 75, 99):
+        assert _top_id(store, vectors[i]) == f"c{i}"
+    reopened = FlatVectorStore(str(tmp_path), "cs101", dtype="int8")
+    assert reopened.count() == 40 and _top_id(reopened, vectors[80]) == "c80"
+    _fill(reopened, _vectors(5, seed=1), start=100) # Appends after the compacted rows
+    assert reopened.count() == 45 and reopened.get(ids=["c100"])["documents"] == ["text 100"]
+
+
+def test_failed_compaction_keeps_the_previous_files(tmp_path, monkeypatch):
+    store = FlatVectorStore(str(tmp_path), "cs101")
+    vectors = _vectors(20)
+    ids = _fill(store, vectors)
+    store.delete(ids[:10])
+
+    def crash(self, conn):
+        raise OSError("disk full")
+    monkeypatch.setattr(FlatVectorStore, "_save_meta", crash)
+    with pytest.raises(OSError):
+        store.compact()
+    monkeypatch.undo()
+    assert _top_id(store, vectors[15]) == "c15"
+    reopened = FlatVectorStore(str(tmp_path), "cs101") # Removes the unused new generation
+    assert [name for name in os.listdir(tmp_path) if not name.startswith("meta.")] == ["vectors.float32"]
+    assert reopened.count() == 10 and _top_id(reopened, vectors[15]) == "c15"
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_recall_matches_float32(tmp_path, dtype):
+    vectors = _vectors(3000)
+    queries = _vectors(50, seed=2)
+    exact = FlatVectorStore(str(tmp_path / "float32"), "cs101")
+    quantized = FlatVectorStore(str(tmp_path / dtype), "cs101", dtype=dtype, rescore_factor=4)
+    _fill(exact, vectors)
+    _fill(quantized, vectors)
+    recall = []
+    for query in queries:
+        expected = {chunk_id for chunk_id, _, _ in exact.query_with_ids(query, 10)}
+        got = quantized.query_with_ids(query, 10)
+        recall.append(len(expected & {chunk_id for chunk_id, _, _ in got}) / 10)
+        reference = dict((chunk_id, distance) for chunk_id, _, distance in exact.query_with_ids(query, 50))
+        for chunk_id, _, distance in got: # Re-scored exactly: same distances as float32
+            if chunk_id in reference:
+                assert distance == pytest.approx(reference[chunk_id], abs=1e-5)
+    assert np.mean(recall) >= 0.98
+
+
+def test_stored_dtype_wins_over_the_setting(tmp_path):
+    _fill(FlatVectorStore(str(tmp_path), "cs101", dtype="float16"), _vectors(5))
+    assert FlatVectorStore(str(tmp_path), "cs101", dtype="int8").dtype == "float16"
+
+
+def test_read_only_sees_writes_after_reopening(tmp_path):
+    assert FlatVectorStore(str(tmp_path / "missing"), "cs101", read_only=True).count() == 0
+    assert not (tmp_path / "missing").exists() # Nothing created
+    writer = FlatVectorStore(str(tmp_path), "cs101")
+    vectors = _vectors(30)
+    _fill(writer, vectors[:20])
+    reader = FlatVectorStore(str(tmp_path), "cs101", read_only=True)
+    assert reader.count() == 20 and _top_id(reader, vectors[5]) == "c5"
+    with pytest.raises(RuntimeError):
+        reader.upsert(["x"], vectors[:1], ["x"])
+    _fill(writer, vectors[20:], start=20)
+    assert reader.count() == 20 # Snapshot until reopened
+    reopened = FlatVectorStore(str(tmp_path), "cs101", read_only=True)
+    assert reopened.count() == 30 and _top_id(reopened, vectors[25]) == "c25"
+
+
+def test_capacity_grows_and_keeps_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(flat_index, "_MIN_CAPACITY", 8)
+    store = FlatVectorStore(str(tmp_path), "cs101", dtype="int8")
+    vectors = _vectors(40)
+    for start in range(0, 40, 6):
+        _fill(store, vectors[start:start + 6], start=start)
+    assert store._capacity >= 40 and store._capacity < 80
+    size = os.path.getsize(tmp_path / "vectors.int8")
+    assert size == store._capacity * DIM
+    for i in (0, 7, 39):
+        assert _top_id(store, vectors[i]) == f"c{i}"
+    assert _top_id(FlatVectorStore(str(tmp_path), "cs101", dtype="int8"), vectors[33]) == "c33"
@@ -0,0 +1,11 @@
+from app.core.hybrid_retriever import reciprocal_rank_fusion
+
+
+def test_rrf_favours_ids_found_by_both_rankings():
+    scores = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], rrf_k=60)
+    assert sorted(scores, key=scores.get, reverse=True) == ["b", "a", "d", "c"]
+
+
+def test_rrf_scores_by_rank_not_raw_score():
+    scores = reciprocal_rank_fusion([["x", "y"]], rrf_k=60)
+    assert scores == {"x": 1 / 61, "y": 1 / 62}
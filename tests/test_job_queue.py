@@ -0,0 +1,27 @@
+from app.services.job_queue import RUNNING, SUCCEEDED, JobQueue
+
+
+def _queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), workers=1, max_attempts=3)
+
+
+def test_progress_is_indeterminate_while_the_total_is_unknown(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("document", "/tmp/notes.pdf", "notes.pdf")
+    assert queue.get(job_id)["progress"] == 0.0 # Queued
+    queue.claim_next()
+    report = queue._progress_callback(job_id)
+    report(chunks_done=200, chunks_total=0, batches_done=2, batches_total=0)
+    job = queue.get(job_id)
+    assert job["status"] == RUNNING and job["progress"] is None
+    report(chunks_done=250, chunks_total=250, batches_done=3, batches_total=3)
+    queue._update(job_id, status=SUCCEEDED)
+    assert queue.get(job_id)["progress"] == 1.0
+
+
+def test_progress_with_a_known_total(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("bulk", "/tmp/semester", "semester")
+    queue.claim_next()
+    queue._progress_callback(job_id)(chunks_done=25, chunks_total=100, batches_done=1, batches_total=4)
+    assert queue.get(job_id)["progress"] == 0.25
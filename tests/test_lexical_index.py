@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import lexical_index
+from app.core.config import settings
+from app.core.lexical_index import LexicalIndex, ensure_lexical_index, tokenize
+
+CHUNKS = [
+    ("c1", "Dijkstra's algorithm finds shortest paths in a weighted graph."),
+    ("c2", "A graph is a set of vertices and edges."),
+    ("c3", "The CS-101 exam covers sorting: quicksort and mergesort."),
+]
+
+
+def _index(tmp_path, **options):
+    return LexicalIndex(str(tmp_path / "cs101"), **options)
+
+
+def test_tokenizer_keeps_codes_and_symbols_whole():
+    assert tokenize("CS-101 uses x_i ≤ 3.14") == ["cs-101", "uses", "x_i", "≤", "3.14"]
+
+
+def test_ranks_by_bm25(tmp_path):
+    index = _index(tmp_path)
+    index.add(CHUNKS)
+    ranked = [chunk_id for chunk_id, _ in index.search("weighted graph shortest", 3)]
+    assert ranked == ["c1", "c2"] # c3 shares no term
+    assert [chunk_id for chunk_id, _ in index.search("cs-101", 3)] == ["c3"]
+    assert index.search("nothing matches", 3) == []
+
+
+def test_deleted_chunks_are_never_returned(tmp_path):
+    index = _index(tmp_path)
+    index.add(CHUNKS)
+    index.delete(["c1"])
+    assert [chunk_id for chunk_id, _ in index.search("graph", 3)] == ["c2"]
+    assert len(index) == 2
+    index.add([("c1", "graph theory again")]) # Re-adding a deleted ID indexes the new text
+    assert {chunk_id for chunk_id, _ in index.search("theory", 3)} == {"c1"}
+
+
+def test_journal_is_replayed_on_reopen(tmp_path):
+    index = _index(tmp_path)
+    index.add(CHUNKS)
+    index.delete(["c2"])
+    reopened = _index(tmp_path)
+    assert len(reopened) == 2
+    assert reopened.search("graph", 3) == index.search("graph", 3)
+
+
+def test_compaction_keeps_results(tmp_path):
+    index = _index(tmp_path, compact_every=4) # One journal entry per chunk: compacts on the delete
+    index.add(CHUNKS[:2])
+    index.add(CHUNKS[2:])
+    index.delete(["c1"])
+    assert index._journal_entries == 0
+    reopened = _index(tmp_path)
+    assert [chunk_id for chunk_id, _ in reopened.search("graph", 3)] == ["c2"]
+    assert [chunk_id for chunk_id, _ in reopened.search("quicksort", 3)] == ["c3"]
+
+
+def test_torn_journal_line_is_ignored(tmp_path):
+    index = _index(tmp_path)
+    index.add(CHUNKS[:1])
+    with open(index.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": "c2", "tf"')
+    assert len(_index(tmp_path)) == 1
+
+
+class _Store:
+    """Enough of a vector store for ensure_lexical_index."""
+
+    def __init__(self, name, chunks):
+        self._collection = SimpleNamespace(name=name)
+        self.chunks = chunks
+
+    def get(self, include, limit, offset=0):
+        page = self.chunks[offset:offset + limit]
+        return {"ids": [c for c, _ in page], "documents": [t for _, t in page]}
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LEXICAL_INDEX_DIR", str(tmp_path / "bm25"))
+    monkeypatch.setattr(settings, "STORE_VERSION_PATH", str(tmp_path / "store_version.json"))
+    monkeypatch.setattr(lexical_index, "_lexical_indexes", {})
+    return tmp_path / "bm25"
+
+
+def test_ensure_rebuilds_a_missing_index_from_the_store(index_dir):
+    index = ensure_lexical_index(_Store("cs101", CHUNKS))
+    assert len(index) == 3
+    assert (index_dir / "cs101.snapshot").exists()
+    assert [chunk_id for chunk_id, _ in index.search("quicksort", 3)] == ["c3"]
+
+
+def test_ensure_leaves_an_empty_collection_alone(index_dir):
+    assert len(ensure_lexical_index(_Store("empty", []))) == 0
+    assert not (index_dir / "empty.snapshot").exists()
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from app.core import llm_gateway
+from app.core.llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailableError, TokenBucket
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_gateway.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_queues_reservations_past_the_burst(clock):
+    bucket = TokenBucket(rate=2.0, capacity=2.0)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.now += 1.0
+    assert bucket.reserve() == 0.5 # Refilled 2 tokens, 3 were owed
+
+
+def test_token_bucket_try_take_never_borrows(clock):
+    bucket = TokenBucket(rate=1.0, capacity=1.0)
+    assert bucket.try_take()
+    assert not bucket.try_take()
+    clock.now += 1.0
+    assert bucket.try_take()
+    assert TokenBucket(rate=0, capacity=1).reserve(100) == 0.0 # Disabled
+
+
+def _open_breaker(clock):
+    breaker = CircuitBreaker(window=4, failure_ratio=0.5, cooldown_seconds=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now += 10
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_breaker_half_open_lets_one_trial_through_and_closes_on_success(clock):
+    breaker = _open_breaker(clock)
+    assert breaker.allow()
+    assert not breaker.allow() # Only one trial at a time
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_breaker_reopens_when_the_trial_fails(clock):
+    breaker = _open_breaker(clock)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_breaker_released_trial_lets_the_next_call_try(clock):
+    breaker = _open_breaker(clock)
+    assert breaker.allow()
+    breaker.release_trial() # e.g. the trial was cancelled
+    assert breaker.allow()
+
+
+def _hedging_gateway():
+    gateway = LLMGateway(max_concurrency=4, max_queue=4, hedge_enabled=True, hedge_min_delay_seconds=0.02)
+    gateway._latencies.extend([0.01] * 20)
+    return gateway
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    gateway = _hedging_gateway()
+    started, cancelled = [], []
+
+    async def start():
+        number = len(started)
+        started.append(number)
+        try:
+            await asyncio.sleep(5 if number == 0 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(number)
+            raise
+        return number
+
+    async def run():
+        async with gateway.slot():
+            result = await gateway.call(start)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == 1 # The hedge answered first
+    assert started == [0, 1] and cancelled == [0]
+    assert gateway.limiter.active == 0 # The hedge's extra slot was given back
+
+
+def test_fast_primary_is_not_hedged():
+    gateway = _hedging_gateway()
+    calls = []
+
+    async def start():
+        calls.append(1)
+        return "ok"
+
+    async def run():
+        async with gateway.slot():
+            return await gateway.call(start)
+
+    assert asyncio.run(run()) == "ok"
+    assert len(calls) == 1
+
+
+def test_retryable_errors_are_retried_then_reported():
+    gateway = LLMGateway(max_concurrency=1, max_queue=1, retry_attempts=2, retry_base_seconds=0)
+    attempts = []
+
+    async def start():
+        attempts.append(1)
+        raise ConnectionError("reset")
+
+    async def run():
+        async with gateway.slot():
+            await gateway.call(start)
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(run())
+    assert len(attempts) == 2
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNKS = 1200 # More than Chroma's default hnsw:sync_threshold (1000), so a writing client would persist
+
+# Each worker reads one command per line on stdin and answers with one JSON line
+_WORKER = textwrap.dedent(
+    """
+    import hashlib, json, sys
+
+    from langchain_core.embeddings import Embeddings
+
+    from app.core import store_sync, vector_store
+
+    class HashEmbeddings(Embeddings):
+        def embed_documents(self, texts):
+            return [self.embed_query(text) for text in texts]
+
+        def embed_query(self, text):
+            digest = hashlib.sha256(text.encode()).digest()
+            return [b / 255 for b in digest[:8]]
+
+    vector_store.embedding_function = HashEmbeddings()
+    role = "writer" if store_sync.acquire_writer() else "reader"
+    try:
+        store = vector_store.get_vector_store("cs101")
+    except RuntimeError as e:
+        print(json.dumps({"role": role, "error": str(e)}), flush=True)
+        sys.exit(0)
+    print(json.dumps({"role": role}), flush=True)
+    added = 0
+    for line in sys.stdin:
+        command, _, arg = line.strip().partition(" ")
+        if command == "ingest":
+            with store_sync.deferred_bumps():
+                for start in range(added, added + int(arg), 100):
+                    ids = [f"chunk-{i}" for i in range(start, start + 100)]
+                    texts = [f"text {i}" for i in range(start, start + 100)]
+                    vector_store.add_with_embeddings(
+                        store, ids, texts, vector_store.embedding_function.embed_documents(texts), [{"i": 0}] * 100
+                    )
+                    store_sync.bump("cs101")
+            added += int(arg)
+            print(json.dumps({"count": vector_store.count_chunks(store)}), flush=True)
+        elif command == "query":
+            store_sync.check_for_updates()
+            store = vector_store.get_vector_store("cs101")
+            hits = store.similarity_search("text 7", k=3)
+            print(json.dumps({"count": vector_store.count_chunks(store), "hits": len(hits)}), flush=True)
+    """
+)
+
+
+class _Worker:
+    def __init__(self, script, env):
+        self.process = subprocess.Popen(
+            [sys.executable, str(script)], cwd=ROOT, env=env, text=True,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self.hello = self.read()
+
+    def read(self):
+        for line in self.process.stdout: # Skips the store's own progress prints
+            if line.startswith("{"):
+                return json.loads(line)
+        raise AssertionError(f"worker exited with {self.process.wait()}")
+
+    def send(self, command):
+        self.process.stdin.write(command + "\n")
+        self.process.stdin.flush()
+        return self.read()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+        self.process.wait(timeout=30)
+
+
+def _fingerprint(directory):
+    """Content hash and mtime of every store file (SQLite's shared-memory index aside)."""
+    files = {}
+    for parent, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith("-shm"):
+                continue
+            path = os.path.join(parent, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, directory)] = (hashlib.sha256(f.read()).hexdigest(), os.stat(path).st_mtime_ns)
+    return files
+
+
+@pytest.fixture
+def worker_env(tmp_path):
+    script = tmp_path / "worker.py"
+    script.write_text(_WORKER)
+    data = tmp_path / "data_store"
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        VECTOR_STORE_PATH=str(data / "chroma"),
+        FLAT_INDEX_DIR=str(data / "flat"),
+        UPLOADS_DIR=str(tmp_path / "uploads"),
+        STORE_WRITER_LOCK_PATH=str(data / "writer.lock"),
+        STORE_VERSION_PATH=str(data / "store_version.json"),
+        ANONYMIZED_TELEMETRY="False",
+    )
+    workers = []
+
+    def start(backend):
+        worker = _Worker(script, dict(env, VECTOR_BACKEND=backend))
+        workers.append(worker)
+        return worker
+
+    yield start, data
+    for worker in reversed(workers):
+        worker.close()
+
+
+def test_flat_reader_never_writes(worker_env):
+    start, data = worker_env
+    writer = start("flat")
+    assert writer.hello == {"role": "writer"}
+    assert writer.send(f"ingest {CHUNKS}") == {"count": CHUNKS}
+
+    reader = start("flat")
+    assert reader.hello == {"role": "reader"}
+    before = _fingerprint(data / "flat")
+    assert reader.send("query") == {"count": CHUNKS, "hits": 3}
+    assert _fingerprint(data / "flat") == before
+
+    assert writer.send(f"ingest {CHUNKS}") == {"count": 2 * CHUNKS}
+    before = _fingerprint(data / "flat")
+    assert reader.send("query") == {"count": 2 * CHUNKS, "hits": 3} # Reopened after the writer's bump
+    assert _fingerprint(data / "flat") == before
+
+
+def test_chroma_reader_refuses(worker_env):
+    start, data = worker_env
+    writer = start("chroma")
+    assert writer.hello == {"role": "writer"}
+    assert writer.send(f"ingest {CHUNKS}") == {"count": CHUNKS}
+
+    before = _fingerprint(data / "chroma")
+    reader = start("chroma")
+    assert reader.hello["role"] == "reader"
+    assert "VECTOR_BACKEND=flat" in reader.hello["error"]
+    assert _fingerprint(data / "chroma") == before
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+
+from app.core.query_embedder import QueryEmbeddingBatcher
+
+
+def test_concurrent_queries_share_a_batch_and_batches_are_tracked():
+    release = threading.Event()
+    batches = []
+
+    def embed_batch(texts):
+        release.wait(5)
+        batches.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    batcher = QueryEmbeddingBatcher(embed_batch, max_batch=8, window_ms=20)
+
+    async def run():
+        pending = asyncio.gather(*(batcher.embed(q) for q in ["a", "bb", "a"]))
+        while not batcher._batches: # The batch is running: its task must be referenced
+            await asyncio.sleep(0.005)
+        release.set()
+        vectors = await pending
+        await asyncio.sleep(0)
+        return vectors
+
+    assert asyncio.run(run()) == [[1.0], [2.0], [1.0]]
+    assert batches == [["a", "bb"]]
+    assert not batcher._batches # Dropped once done
+    assert asyncio.run(batcher.embed("bb")) == [2.0] # Memoized
+    assert len(batches) == 1
@@ -0,0 +1,143 @@
+import json
+import zipfile
+
+import numpy as np
+import pytest
+
+from app.core import lexical_index, vector_store
+from app.core.config import settings
+from app.services import collection_stats, snapshot
+from app.services.snapshot import export_snapshot, import_snapshot
+
+DIM = 16
+COURSES = {"cs101": 23, "ma201": 4}
+
+
+def _vectors(n, seed):
+    vectors = np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True) # Stored unit-normalized
+
+
+@pytest.fixture
+def use_node(tmp_path, monkeypatch):
+    """Points the store settings at one node's data directory, with fresh in-process state."""
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "flat")
+    monkeypatch.setattr(settings, "FLAT_INDEX_DTYPE", "float32")
+    monkeypatch.setattr(vector_store, "embedding_function", object()) # Never called: vectors come precomputed
+    monkeypatch.setattr(snapshot, "_EXPORT_PAGE_ROWS", 5) # Several pages and batches per collection
+    monkeypatch.setattr(snapshot, "_IMPORT_BATCH_ROWS", 7)
+
+    def use(node):
+        data = tmp_path / node
+        monkeypatch.setattr(settings, "FLAT_INDEX_DIR", str(data / "flat"))
+        monkeypatch.setattr(settings, "LEXICAL_INDEX_DIR", str(data / "bm25"))
+        monkeypatch.setattr(settings, "COLLECTION_STATS_PATH", str(data / "collection_stats.json"))
+        monkeypatch.setattr(settings, "STORE_VERSION_PATH", str(data / "store_version.json"))
+        monkeypatch.setattr(vector_store, "vector_stores", {})
+        monkeypatch.setattr(lexical_index, "_lexical_indexes", {})
+        monkeypatch.setattr(collection_stats, "_collection_stats", None)
+        return data
+
+    return use
+
+
+def _fill(use_node):
+    use_node("source")
+    for seed, (name, n) in enumerate(COURSES.items()):
+        store = vector_store.get_vector_store(name)
+        ids = [f"{name}-{i}" for i in range(n)]
+        metadatas = [{"source": f"week{i % 3}.pdf", "page": i} for i in range(n)]
+        vector_store.add_with_embeddings(store, ids, [f"{name} text {i}" for i in range(n)], _vectors(n, seed), metadatas)
+
+
+def _contents(name):
+    rows = vector_store.get_vector_store(name).get(include=["documents", "metadatas", "embeddings"])
+    order = np.argsort(rows["ids"])
+    return (
+        [rows["ids"][i] for i in order],
+        [rows["documents"][i] for i in order],
+        [rows["metadatas"][i] for i in order],
+        np.asarray(rows["embeddings"])[order],
+    )
+
+
+def _rewrite_manifest(bundle_path, **changes):
+    with zipfile.ZipFile(bundle_path) as bundle:
+        members = {name: bundle.read(name) for name in bundle.namelist()}
+    manifest = json.loads(members["manifest.json"])
+    manifest.update(changes)
+    members["manifest.json"] = json.dumps(manifest).encode()
+    with zipfile.ZipFile(bundle_path, "w") as bundle:
+        for name, data in members.items():
+            bundle.writestr(name, data)
+
+
+def test_round_trip_into_empty_store(use_node, tmp_path):
+    _fill(use_node)
+    expected = {name: _contents(name) for name in COURSES}
+    bundle = str(tmp_path / "courses.zip")
+    manifest = export_snapshot(bundle)
+    assert manifest["dimension"] == DIM
+    assert {name: info["chunks"] for name, info in manifest["collections"].items()} == COURSES
+
+    use_node("target")
+    report = import_snapshot(bundle)
+
+    assert report["chunks_added"] == sum(COURSES.values())
+    assert vector_store.list_collection_names() == sorted(COURSES)
+    for name in COURSES:
+        ids, documents, metadatas, vectors = _contents(name)
+        assert (ids, documents, metadatas) == expected[name][:3]
+        np.testing.assert_allclose(vectors, expected[name][3], atol=1e-6) # Re-normalized on import
+    assert [chunk_id for chunk_id, _ in lexical_index.get_lexical_index("ma201").search("ma201 text 2", 1)] == ["ma201-2"]
+
+
+def test_reimport_is_a_no_op(use_node, tmp_path):
+    _fill(use_node)
+    bundle = str(tmp_path / "courses.zip")
+    export_snapshot(bundle, ["cs101"])
+    use_node("target")
+    import_snapshot(bundle)
+    before = _contents("cs101")
+
+    report = import_snapshot(bundle)
+
+    assert report["chunks_added"] == 0
+    assert report["chunks_skipped"] == COURSES["cs101"]
+    after = _contents("cs101")
+    assert after[:3] == before[:3]
+    np.testing.assert_array_equal(after[3], before[3])
+
+
+def test_other_embedding_model_is_refused(use_node, tmp_path, monkeypatch):
+    _fill(use_node)
+    bundle = str(tmp_path / "courses.zip")
+    export_snapshot(bundle)
+    use_node("target")
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL_NAME", "another-model")
+
+    with pytest.raises(ValueError, match="another-model"):
+        import_snapshot(bundle)
+    assert vector_store.list_collection_names() == []
+
+
+@pytest.mark.parametrize("changes", [{"format": "something-else"}, {"version": snapshot.SNAPSHOT_VERSION + 1}])
+def test_unsupported_bundle_is_refused(use_node, tmp_path, changes):
+    _fill(use_node)
+    bundle = str(tmp_path / "courses.zip")
+    export_snapshot(bundle)
+    _rewrite_manifest(bundle, **changes)
+    use_node("target")
+
+    with pytest.raises(ValueError, match="Unsupported snapshot"):
+        import_snapshot(bundle)
+    assert vector_store.list_collection_names() == []
+
+
+def test_bundle_without_manifest_is_refused(use_node, tmp_path):
+    use_node("target")
+    bundle = tmp_path / "not-a-snapshot.zip"
+    with zipfile.ZipFile(bundle, "w") as archive:
+        archive.writestr("notes.txt", "hello")
+    with pytest.raises(ValueError, match="manifest"):
+        import_snapshot(str(bundle))
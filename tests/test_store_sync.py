@@ -0,0 +1,45 @@
+import json
+import threading
+
+import pytest
+
+from app.core import store_sync
+from app.core.config import settings
+
+
+@pytest.fixture
+def version_file(tmp_path, monkeypatch):
+    path = tmp_path / "store_version.json"
+    monkeypatch.setattr(settings, "STORE_VERSION_PATH", str(path))
+    return path
+
+
+def _versions(path):
+    return json.loads(path.read_text())["collections"]
+
+
+def test_deferred_bumps_publish_once(version_file):
+    with store_sync.deferred_bumps():
+        for _ in range(10): # One bump per stored batch
+            store_sync.bump("cs101")
+        with store_sync.deferred_bumps(): # Nested (e.g. a replace inside a document)
+            store_sync.bump("ma201")
+        assert not version_file.exists()
+    assert _versions(version_file) == {"cs101": 1, "ma201": 1}
+
+
+def test_deferred_bumps_publish_on_error(version_file):
+    with pytest.raises(RuntimeError):
+        with store_sync.deferred_bumps():
+            store_sync.bump("cs101")
+            raise RuntimeError("batch failed")
+    assert _versions(version_file) == {"cs101": 1}
+
+
+def test_deferral_is_per_thread(version_file):
+    with store_sync.deferred_bumps():
+        thread = threading.Thread(target=store_sync.bump, args=("other",))
+        thread.start()
+        thread.join()
+        assert _versions(version_file) == {"other": 1} # Not held back by this thread's block
+    assert _versions(version_file) == {"other": 1}